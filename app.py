@@ -1,75 +1,126 @@
 import os
-from flask import Flask, render_template, request, flash, redirect, session, g, url_for
-from flask_mail import Mail, Message
+import threading
+from flask import Flask, current_app, render_template, request, flash, redirect, session, g, url_for, jsonify
+from flask_mail import Mail
 from user_model import User
-from db_init import connect_db, db
-from food_models import Favorites
-from routes.users import users_bp
+from db_init import connect_db
+from food_models import Favorites, RecipeSnapshot
 import requests
-from routes.auth import login_required, do_login, do_logout, auth_bp, CURR_USER_KEY
+from routes.users import users_bp
+from routes.auth import auth_bp, CURR_USER_KEY
 from routes.recipes import recipes_bp
+from spoonacular_client import spoonacular
+from shopping_list import shopping_lists
+from mail_queue import mail_dispatcher
+from recipe_refresher import recipe_refresher
+from random_pool import random_pool
+from static_assets import assets_bp, asset_url
+import compression
+import metrics
+from metrics import metrics_bp
+
+# Extensions are bound to an app by create_app, so importing this module doesn't configure or connect anything
+mail = Mail()
+
+_default_app = None
+_default_app_lock = threading.Lock()
+
+
+def default_config():
+    '''Configuration from the environment, read when an app is created rather than at import'''
+    return {
+        'SQLALCHEMY_DATABASE_URI': os.environ.get('DATABASE_URL', 'postgresql:///easy_recipes'),
+        'SECRET_KEY': os.environ.get('SECRET_KEY'),
+        # Email Configuration
+        'MAIL_SERVER': os.environ.get('MAIL_SERVER'),
+        'MAIL_PORT': int(os.environ.get('MAIL_PORT', 465)),
+        'MAIL_USERNAME': os.environ.get('MAIL_USERNAME'),
+        'MAIL_PASSWORD': os.environ.get('MAIL_PASSWORD'),
+        'MAIL_USE_TLS': False,
+        'MAIL_USE_SSL': True
+    }
 
-app = Flask(__name__)
 
-app.register_blueprint(users_bp, url_prefix='/users')
-app.register_blueprint(auth_bp)
-app.register_blueprint(recipes_bp, url_prefix='/recipes')
+def create_app(config=None):
+    '''Build the Flask app. config overrides the environment defaults, e.g. a SQLite SQLALCHEMY_DATABASE_URI for tests.'''
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'postgresql:///easy_recipes')
+    app.register_blueprint(users_bp, url_prefix='/users')
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(recipes_bp, url_prefix='/recipes')
+    app.register_blueprint(assets_bp)
+    app.register_blueprint(metrics_bp)
+    app.add_template_global(asset_url)
 
-app.secret_key = os.environ.get('SECRET_KEY')
-API_KEY = os.environ.get('API_KEY')
+    connect_db(app)
+    # First, so request timings include the other hooks
+    metrics.init_app(app)
+    mail.init_app(app)
+    mail_dispatcher.init_app(app, mail)
+    compression.init_app(app)
 
-# Email Configuration
-app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER')
-app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT'))
-app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME')
-app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD')
-app.config['MAIL_USE_TLS'] = False
-app.config['MAIL_USE_SSL'] = True
+    # Recipe lookups fall back to the shared snapshot table before calling Spoonacular
+    spoonacular.store = RecipeSnapshot
+    recipe_refresher.init_app(app)
+    random_pool.init_app(app)
 
-mail = Mail(app)
+    app.before_request(add_user_to_g)
+    app.add_url_rule('/', view_func=home_page)
+    app.add_url_rule('/send_email', view_func=send_email, methods=['POST'])
 
-app.app_context().push()
+    return app
+
+
+def __getattr__(name):
+    '''`from app import app` (flask run, gunicorn app:app, seed.py) builds the default app on first access'''
+    global _default_app
+    if name != 'app':
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    with _default_app_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app
 
-connect_db(app)
 
 # Before each request, add user to Flask global if logged in
-@app.before_request
 def add_user_to_g():
     '''If logged in, add curr user to Flask global for easier access in templates and view functions.'''
 
-    if CURR_USER_KEY in session:
-        g.user = User.query.get(session[CURR_USER_KEY])
+    # Static files and metrics scrapes never need the user
+    if CURR_USER_KEY in session and request.endpoint not in ('static', 'assets.serve_asset', 'metrics.serve_metrics'):
+        # Views can ask for relationships they will use to be loaded along with the user, in the same query or one extra IN query
+        view = current_app.view_functions.get(request.endpoint)
+        options = getattr(view, 'user_load_options', ())
+        g.user = User.load_cached(session[CURR_USER_KEY], options)
     else:
         g.user = None
 
-@app.route('/')
 def home_page():
     '''Renders home page, the place to search for recipes'''
     if not g.user:
         return redirect('/login')
     return render_template('home.html')
 
-@app.route('/send_email', methods=['POST'])
 def send_email():
     # Send email to user with shopping cart
 
     # Get recipes in shopping cart
     shopping_cart = Favorites.query.filter(Favorites.user_id==g.user.id, Favorites.in_shopping_cart==True).all()
     recipe_ids = [recipe.recipe_id for recipe in shopping_cart]
-    string_recipe_ids = ','.join(str(id) for id in recipe_ids)
     try:
-        resp = requests.get('https://api.spoonacular.com/recipes/informationBulk', params={'apiKey': API_KEY, 'ids': string_recipe_ids})
-        recipes = resp.json()
-
-        # Render email template and send email
-        rendered_template = render_template('users/email_template.html', recipes=recipes)
-        msg = Message('Your Shopping Cart', sender="easyrecipes.shopping@gmail.com", recipients=[g.user.email])
-        msg.html = rendered_template
-        mail.send(msg)
-        flash('Email sent!', 'success')
+        shopping_list = shopping_lists.get(recipe_ids, spoonacular.information_bulk)
+
+        # Render email template and queue it; the mail dispatcher sends it in the background
+        rendered_template = render_template('users/email_template.html', shopping_list=shopping_list)
+        mail_dispatcher.enqueue(recipients=[g.user.email], subject='Your Shopping Cart', html=rendered_template, sender="easyrecipes.shopping@gmail.com")
+
+        # API clients get 202 Accepted, the shopping cart form gets redirected back to the page
+        if request.accept_mimetypes.accept_json and not request.accept_mimetypes.accept_html:
+            return jsonify({"Result": "Email queued"}), 202
+        flash('Email on its way!', 'success')
         return redirect(url_for('users.show_shopping_cart'))
     except requests.exceptions.RequestException as e:
         flash('Could not get recipes', 'danger')
-        return redirect(url_for('users.show_shopping_cart'))
\ No newline at end of file
+        return redirect(url_for('users.show_shopping_cart'))
@@ -0,0 +1,99 @@
+# Description: Async HTTP transport for Spoonacular. One background event loop per process owns a pooled
+# httpx.AsyncClient, so async views in any request share its connections and can run upstream calls concurrently.
+import os
+import asyncio
+import time
+import random
+import threading
+import requests
+from metrics import observe_upstream
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+def as_requests_error(error):
+    '''Translate httpx errors, and the ValueError of a body that isn't JSON, into the requests exceptions the routes already handle'''
+    import httpx
+    if isinstance(error, ValueError):
+        return requests.exceptions.InvalidJSONError(str(error))
+    if isinstance(error, httpx.HTTPStatusError):
+        return requests.exceptions.HTTPError(str(error), response=None)
+    if isinstance(error, httpx.TimeoutException):
+        return requests.exceptions.Timeout(str(error))
+    return requests.exceptions.ConnectionError(str(error))
+
+
+class AsyncTransport:
+    '''Background event loop plus shared httpx.AsyncClient. Coroutines for any loop can await its calls.'''
+
+    def __init__(self, base_url, timeout, pool_size, max_retries, guard=None):
+        self.base_url = base_url
+        self.guard = guard
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self._loop = None
+        self._client = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        '''Start the loop thread on first use, and again in a forked worker since threads don't survive fork'''
+        if self._loop is not None and self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                started = threading.Event()
+                threading.Thread(target=self._run_loop, args=(loop, started), name='spoonacular-async', daemon=True).start()
+                started.wait()
+                self._pid = os.getpid()
+                self._loop = loop
+        return self._loop
+
+    def _run_loop(self, loop, started):
+        # httpx is imported on first use so processes that never run an async upstream call don't pay for it at boot
+        import httpx
+        asyncio.set_event_loop(loop)
+        connect, read = self.timeout
+        limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=httpx.Timeout(read, connect=connect),
+                                         transport=httpx.AsyncHTTPTransport(retries=self.max_retries, limits=limits))
+        started.set()
+        loop.run_forever()
+
+    async def _get(self, path, params, admitted=False):
+        '''GET on the background loop, retrying transient 5xx responses with jittered backoff'''
+        import httpx
+        if self.guard is not None and not admitted:
+            await asyncio.sleep(self.guard.admit(path, params))
+        start = time.perf_counter()
+        status = headers = None
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    resp = await self._client.get(path, params=params)
+                    status, headers = resp.status_code, resp.headers
+                    if resp.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                        await asyncio.sleep(0.25 * 2 ** attempt + random.uniform(0, 0.25))
+                        continue
+                    resp.raise_for_status()
+                    return resp.json()
+                except (httpx.HTTPError, ValueError) as e:
+                    raise as_requests_error(e) from e
+        finally:
+            observe_upstream(path, status, time.perf_counter() - start)
+            if self.guard is not None:
+                self.guard.record(status, headers)
+
+    async def get(self, path, params, admitted=False):
+        '''Await one GET from whatever loop the caller is running on. admitted skips the guard for calls it already let through.'''
+        future = asyncio.run_coroutine_threadsafe(self._get(path, params, admitted), self._ensure_started())
+        return await asyncio.wrap_future(future)
+
+    async def get_many(self, calls):
+        '''Run several (path, params) GETs concurrently. The guard admits them together, so the chunks of one lookup
+        are refused as a whole or not at all. Returns their JSON in the same order, with the error in place of any call that failed.'''
+        if self.guard is not None and calls:
+            await asyncio.sleep(self.guard.admit_many(calls))
+        return await asyncio.gather(*(self.get(path, params, admitted=True) for path, params in calls), return_exceptions=True)
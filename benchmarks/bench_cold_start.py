@@ -0,0 +1,51 @@
+# Description: Measures cold start in fresh interpreters: importing app, building the app with create_app,
+# and serving the first request. Pass --tree to measure another checkout, e.g. one made with
+# `git worktree add /tmp/before <commit>`, for a before/after comparison.
+#
+# Usage: python benchmarks/bench_cold_start.py [--runs 15] [--tree PATH]
+import os
+import sys
+import json
+import argparse
+import subprocess
+from statistics import median
+
+# Runs in the child interpreter. Trees from before the factory build the app while importing, so build counts 0 there
+# (and they start the mail worker on the first request, which the factory config turns off here).
+CHILD = '''
+import json, time
+start = time.perf_counter()
+import app as module
+imported = time.perf_counter()
+app = module.create_app({'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'SECRET_KEY': 'bench', 'MAIL_QUEUE_WORKER': False}) if hasattr(module, 'create_app') else module.app
+built = time.perf_counter()
+app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({'import': imported - start, 'build': built - imported, 'first request': served - built, 'total': served - start}))
+'''
+
+
+def run_once(tree):
+    # MAIL_PORT is only needed by trees that read it at import time
+    env = {**os.environ, 'MAIL_PORT': os.environ.get('MAIL_PORT', '465'), 'DATABASE_URL': 'sqlite://'}
+    output = subprocess.run([sys.executable, '-c', CHILD], cwd=tree, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start time of the Flask app')
+    parser.add_argument('--runs', type=int, default=15, help='fresh interpreters to start; the median is reported')
+    parser.add_argument('--tree', default=os.path.join(os.path.dirname(__file__), '..'))
+    args = parser.parse_args()
+
+    # The first run warms the OS file cache and writes .pyc files, so it is not counted
+    run_once(args.tree)
+    samples = [run_once(args.tree) for _ in range(args.runs)]
+
+    print(f'{os.path.abspath(args.tree)}, median of {args.runs} runs')
+    for phase in samples[0]:
+        print(f'{phase:<14} {median(sample[phase] for sample in samples) * 1000:>8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
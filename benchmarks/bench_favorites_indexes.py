@@ -0,0 +1,106 @@
+# Description: Shows query plans and timings for the favorites/cart/allergy hot queries before and after
+# migrations/001_favorites_allergies_indexes.sql, on a Postgres table seeded with a million favorites.
+#
+# Usage: createdb easy_recipes_bench && python benchmarks/bench_favorites_indexes.py [--rows 1000000] [--users 10000]
+# The target database is dropped and recreated, so never point BENCH_DATABASE_URL at real data.
+import os
+import sys
+import re
+import time
+import argparse
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from db_init import db
+import food_models
+import user_model
+import mail_model
+
+MIGRATION = os.path.join(os.path.dirname(__file__), '..', 'migrations', '001_favorites_allergies_indexes.sql')
+NEW_INDEXES = ('uq_favorite_recipes_user_recipe', 'ix_favorite_recipes_cart', 'uq_allergies_user_ingredient')
+RECIPES = 50000
+INGREDIENTS = 500
+
+# The queries behind show_shopping_cart/get_shopping_cart/send_email, toggle_cart_status, and loading a user's allergies
+QUERIES = {
+    'cart': 'SELECT recipe_id FROM favorite_recipes WHERE user_id = :user_id AND in_shopping_cart = true',
+    'toggle': 'SELECT * FROM favorite_recipes WHERE user_id = :user_id AND recipe_id = :recipe_id',
+    'allergies': 'SELECT ingredient_id FROM allergies WHERE user_id = :user_id'
+}
+
+
+def seed(engine, rows, users):
+    '''Recreate the schema without the new indexes and fill it with generated data'''
+    per_user = rows // users
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for index in NEW_INDEXES:
+            conn.execute(text(f'DROP INDEX IF EXISTS {index}'))
+        conn.execute(text("INSERT INTO users (id, email, username, password) "
+                          "SELECT u, 'user' || u || '@bench.test', 'user' || u, 'x' FROM generate_series(1, :users) u"), {'users': users})
+        conn.execute(text('INSERT INTO recipes (id) SELECT r FROM generate_series(1, :recipes) r'), {'recipes': RECIPES})
+        conn.execute(text("INSERT INTO ingredients (id) SELECT 'ingredient' || i FROM generate_series(1, :count) i"), {'count': INGREDIENTS})
+        # 104729 is prime, so each user's recipe ids are distinct; about 1 in 10 favorites is in the cart
+        conn.execute(text('INSERT INTO favorite_recipes (user_id, recipe_id, in_shopping_cart) '
+                          'SELECT u, ((u * 7919 + k * 104729) % :recipes) + 1, random() < 0.1 '
+                          'FROM generate_series(1, :users) u, generate_series(1, :per_user) k'),
+                     {'users': users, 'per_user': per_user, 'recipes': RECIPES})
+        conn.execute(text("INSERT INTO allergies (user_id, ingredient_id) "
+                          "SELECT u, 'ingredient' || (((u * 31 + k * 97) % :count) + 1) FROM generate_series(1, :users) u, generate_series(1, 3) k"),
+                     {'users': users, 'count': INGREDIENTS})
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.execute(text('VACUUM ANALYZE'))
+
+
+def migrate(engine):
+    '''Apply the migration file statement by statement, outside a transaction like psql does'''
+    sql = re.sub(r'--[^\n]*', '', open(MIGRATION).read())
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        for statement in filter(str.strip, sql.split(';')):
+            conn.execute(text(statement))
+
+
+def explain(engine, params, repeat):
+    '''Print each query plan and return the median execution time in ms reported by EXPLAIN ANALYZE'''
+    timings = {}
+    with engine.connect() as conn:
+        for name, query in QUERIES.items():
+            samples = []
+            for _ in range(repeat):
+                plan = [row[0] for row in conn.execute(text(f'EXPLAIN (ANALYZE, BUFFERS) {query}'), params)]
+                samples.append(float(re.search(r'Execution Time: ([\d.]+)', plan[-1]).group(1)))
+            timings[name] = sorted(samples)[len(samples) // 2]
+            print(f'--- {name}: {query}')
+            print('\n'.join(plan))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Favorites/allergies query plans before and after the index migration')
+    parser.add_argument('--rows', type=int, default=1000000, help='favorite_recipes rows to seed')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5, help='EXPLAIN ANALYZE runs per query; the median is reported')
+    args = parser.parse_args()
+
+    engine = create_engine(os.environ.get('BENCH_DATABASE_URL', 'postgresql:///easy_recipes_bench'))
+    start = time.perf_counter()
+    seed(engine, args.rows, args.users)
+    print(f'Seeded {args.rows} favorites for {args.users} users in {time.perf_counter() - start:.1f}s')
+
+    params = {'user_id': args.users // 2, 'recipe_id': ((args.users // 2) * 7919 + 104729) % RECIPES + 1}
+
+    print('\n===== Before migration =====')
+    before = explain(engine, params, args.repeat)
+    migrate(engine)
+    print('\n===== After migration =====')
+    after = explain(engine, params, args.repeat)
+
+    print('\nquery       before ms   after ms   speedup')
+    for name in QUERIES:
+        print(f'{name:<10} {before[name]:>10.3f} {after[name]:>10.3f} {before[name] / max(after[name], 0.001):>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Description: Measures password checks (the CPU cost of a login) per second per core for several bcrypt costs,
+# in the request thread and through the password_hasher process pool.
+#
+# Usage: python benchmarks/bench_password_hashing.py [--rounds 10 11 12 13] [--workers N] [--seconds 3]
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from password_hasher import PasswordHasher
+
+PASSWORD = 'correct horse battery staple'
+
+
+def checks_per_second(hasher, hashed, threads, seconds):
+    '''Run password checks from `threads` request-like threads for about `seconds`. Returns checks per second.'''
+    deadline = time.perf_counter() + seconds
+
+    def login():
+        count = 0
+        while time.perf_counter() < deadline:
+            hasher.check(hashed, PASSWORD)
+            count += 1
+        return count
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        total = sum(executor.map(lambda _: login(), range(threads)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bcrypt logins/sec per core')
+    parser.add_argument('--rounds', type=int, nargs='+', default=[10, 11, 12, 13])
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='password hashing pool size')
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    print(f'{os.cpu_count()} cores, pool of {args.workers} workers')
+    print('cost   inline/core   pool total   pool/core   ms/login')
+    for rounds in args.rounds:
+        inline = PasswordHasher(rounds=rounds, workers=0)
+        pooled = PasswordHasher(rounds=rounds, workers=args.workers)
+        hashed = inline.hash(PASSWORD)
+        try:
+            # Warm the pool up first so process start-up isn't counted
+            pooled.check(hashed, PASSWORD)
+            single = checks_per_second(inline, hashed, 1, args.seconds)
+            # Twice as many threads as workers keeps every worker busy
+            total = checks_per_second(pooled, hashed, args.workers * 2, args.seconds)
+        finally:
+            pooled.shutdown()
+        print(f'{rounds:>4} {single:>13.1f} {total:>12.1f} {total / args.workers:>11.1f} {1000 / single:>10.1f}')
+
+
+if __name__ == '__main__':
+    main()
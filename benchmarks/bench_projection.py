@@ -0,0 +1,56 @@
+# Description: Response size and serialization time of full Spoonacular recipe objects versus the card projection
+# the views now return. Uses generated recipes shaped like /recipes/informationBulk results, or a saved real response.
+#
+# Usage: python benchmarks/bench_projection.py [--sample informationBulk.json] [--counts 16 100]
+import os
+import sys
+import gzip
+import json
+import time
+import argparse
+from statistics import median
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from projection import project_many, RECIPE_CARD_FIELDS
+from fixtures import fake_recipe
+
+def dumps(data):
+    # Same settings as Flask's JSON provider outside debug mode
+    return json.dumps(data, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def dumps_ms(data, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        dumps(data)
+        samples.append(time.perf_counter() - start)
+    return median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full vs projected recipe payload size')
+    parser.add_argument('--sample', help='a saved informationBulk JSON response to use instead of generated recipes')
+    parser.add_argument('--counts', type=int, nargs='+', default=[16, 100], help='recipes per response')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.sample:
+        with open(args.sample) as f:
+            sample = json.load(f)
+
+    print('recipes  payload      json bytes   gzip bytes   dumps ms')
+    for count in args.counts:
+        recipes = [sample[i % len(sample)] for i in range(count)] if args.sample else [fake_recipe(i) for i in range(count)]
+        rows = {'full': recipes, 'card': project_many(recipes, RECIPE_CARD_FIELDS)}
+        sizes = {}
+        for name, payload in rows.items():
+            body = dumps(payload)
+            sizes[name] = len(body)
+            print(f'{count:>7}  {name:<10} {len(body):>12} {len(gzip.compress(body)):>12} {dumps_ms(payload, args.repeat):>10.2f}')
+        print(f'{"":>7}  card is {sizes["card"] / sizes["full"]:.0%} of full')
+
+
+if __name__ == '__main__':
+    main()
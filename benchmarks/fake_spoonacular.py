@@ -0,0 +1,145 @@
+# Description: Local stand-in for the Spoonacular API. Serves generated random, complexSearch, information and
+# informationBulk responses with configurable latency and error rate, and counts the calls it receives.
+# GET /__stats returns the counts, POST /__reset clears them.
+#
+# Usage: python benchmarks/fake_spoonacular.py [--port 8765] [--latency 80] [--jitter 40] [--error-rate 0.01]
+# then run the app with SPOONACULAR_BASE_URL=http://127.0.0.1:8765
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fixtures import fake_recipe, search_card
+
+# complexSearch results come from this many recipes
+CATALOG_SIZE = 5000
+
+
+class FakeSpoonacular(ThreadingHTTPServer):
+    '''HTTP server holding the latency/error settings and call counts'''
+
+    daemon_threads = True
+
+    def __init__(self, address, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__(address, Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def record(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] += 1
+            return self.random.random() < self.error_rate, self.latency + self.random.uniform(0, self.jitter)
+
+    def stats(self):
+        with self.lock:
+            return {'calls': sum(self.calls.values()), 'by_endpoint': dict(self.calls)}
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+    def start(self):
+        '''Serve from a background thread, for use inside another script'''
+        threading.Thread(target=self.serve_forever, name='fake-spoonacular', daemon=True).start()
+        return self
+
+
+def random_recipes(params):
+    number = int(params.get('number', ['1'])[0])
+    return {'recipes': [fake_recipe(random.randint(1, CATALOG_SIZE)) for _ in range(number)]}
+
+
+def complex_search(params):
+    number = int(params.get('number', ['10'])[0])
+    offset = int(params.get('offset', ['0'])[0])
+    # Different queries get different but stable pages of the catalog
+    query = json.dumps({key: value for key, value in params.items() if key not in ('apiKey', 'offset', 'number')}, sort_keys=True)
+    start = zlib.crc32(query.encode('utf-8')) % CATALOG_SIZE
+    ids = [(start + offset + i) % CATALOG_SIZE + 1 for i in range(number)]
+    return {'results': [search_card(fake_recipe(recipe_id)) for recipe_id in ids], 'offset': offset, 'number': number, 'totalResults': 900}
+
+
+def information_bulk(params):
+    ids = [int(recipe_id) for recipe_id in params.get('ids', [''])[0].split(',') if recipe_id]
+    return [fake_recipe(recipe_id) for recipe_id in ids]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        parts = url.path.strip('/').split('/')
+
+        if url.path == '/__stats':
+            return self.send_json(self.server.stats())
+        if url.path == '/recipes/random':
+            endpoint, handler = 'random', random_recipes
+        elif url.path == '/recipes/complexSearch':
+            endpoint, handler = 'complexSearch', complex_search
+        elif url.path == '/recipes/informationBulk':
+            endpoint, handler = 'informationBulk', information_bulk
+        elif len(parts) == 3 and parts[0] == 'recipes' and parts[1].isdigit() and parts[2] == 'information':
+            endpoint, handler = 'information', lambda params: fake_recipe(int(parts[1]))
+        else:
+            return self.send_json({'status': 'failure', 'code': 404}, status=404)
+
+        failed, delay = self.server.record(endpoint)
+        time.sleep(delay / 1000)
+        if failed:
+            return self.send_json({'status': 'failure', 'code': 503}, status=503)
+        self.send_json(handler(params))
+
+    def do_POST(self):
+        if self.path == '/__reset':
+            self.server.reset()
+            return self.send_json({'reset': True})
+        self.send_json({'status': 'failure', 'code': 404}, status=404)
+
+    def send_json(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake Spoonacular API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help='ms added to every call')
+    parser.add_argument('--jitter', type=float, default=0, help='up to this many extra ms, uniformly random')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of calls answered with 503')
+    args = parser.parse_args()
+
+    server = FakeSpoonacular((args.host, args.port), args.latency, args.jitter, args.error_rate)
+    print(f'Fake Spoonacular on {server.url}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# Description: Generated Spoonacular fixtures for the benchmarks. Recipes have the fields and nesting of real
+# /information responses and are deterministic per id, so every process generates the same recipe for an id.
+import random
+
+WORDS = 'flour sugar butter egg milk salt pepper garlic onion tomato basil olive oil lemon chicken rice beans cumin'.split()
+DIETS = ['vegan', 'vegetarian', 'gluten free', 'dairy free', 'pescatarian', 'ketogenic']
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+def measures(amount, unit):
+    return {'us': {'amount': amount, 'unitShort': unit, 'unitLong': unit + 's'},
+            'metric': {'amount': round(amount * 236.6, 1), 'unitShort': 'ml', 'unitLong': 'milliliters'}}
+
+
+def fake_recipe(recipe_id):
+    '''A recipe with the fields and nesting of a Spoonacular information response'''
+    rng = random.Random(recipe_id)
+    ingredients = []
+    for i in range(rng.randint(8, 16)):
+        name = sentence(rng, rng.randint(1, 2))
+        amount, unit = rng.randint(1, 4), rng.choice(['cup', 'tbsp', 'tsp', 'g', 'oz', ''])
+        ingredients.append({
+            'id': 1000 + i, 'aisle': rng.choice(['Baking', 'Produce', 'Spices and Seasonings', 'Milk, Eggs, Other Dairy']),
+            'image': f'{name}.jpg', 'consistency': 'SOLID', 'name': name, 'nameClean': name,
+            'original': f'{amount} {unit} {name}', 'originalName': name, 'amount': amount, 'unit': unit,
+            'meta': [sentence(rng, 1)], 'measures': measures(amount, unit)
+        })
+    steps = [{
+        'number': n + 1, 'step': sentence(rng, 25),
+        'ingredients': [{'id': 1000 + n, 'name': sentence(rng, 1), 'localizedName': sentence(rng, 1), 'image': 'x.jpg'}],
+        'equipment': [{'id': 404784, 'name': 'oven', 'localizedName': 'oven', 'image': 'oven.jpg',
+                       'temperature': {'number': 350.0, 'unit': 'Fahrenheit'}}]
+    } for n in range(rng.randint(5, 12))]
+    diets = rng.sample(DIETS, rng.randint(0, 3))
+    return {
+        'id': recipe_id, 'title': sentence(rng, 5).title(), 'image': f'https://img.spoonacular.com/recipes/{recipe_id}-556x370.jpg',
+        'imageType': 'jpg', 'servings': 4, 'readyInMinutes': rng.randint(10, 90), 'license': 'CC BY 3.0', 'sourceName': 'Foodista',
+        'sourceUrl': f'https://www.foodista.com/recipe/{recipe_id}', 'spoonacularSourceUrl': f'https://spoonacular.com/{recipe_id}',
+        'healthScore': 12.0, 'spoonacularScore': 70.1, 'pricePerServing': 163.15, 'analyzedInstructions': [{'name': '', 'steps': steps}],
+        'cheap': False, 'creditsText': 'Foodista.com', 'cuisines': ['Italian'], 'dairyFree': 'dairy free' in diets, 'diets': diets,
+        'gaps': 'no', 'glutenFree': 'gluten free' in diets, 'instructions': '<ol>' + ''.join(f'<li>{step["step"]}.</li>' for step in steps) + '</ol>',
+        'ketogenic': 'ketogenic' in diets, 'lowFodmap': False, 'occasions': [], 'sustainable': False, 'vegan': 'vegan' in diets,
+        'vegetarian': 'vegetarian' in diets or 'vegan' in diets, 'veryHealthy': False, 'veryPopular': False, 'whole30': False,
+        'weightWatcherSmartPoints': 9, 'dishTypes': ['lunch', 'main course'], 'extendedIngredients': ingredients,
+        'summary': '<b>' + sentence(rng, 120) + '</b>',
+        'winePairing': {'pairedWines': ['chianti'], 'pairingText': sentence(rng, 40), 'productMatches': []}
+    }
+
+
+def search_card(recipe):
+    '''A complexSearch result entry'''
+    return {'id': recipe['id'], 'title': recipe['title'], 'image': recipe['image'], 'imageType': recipe['imageType']}
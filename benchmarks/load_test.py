@@ -0,0 +1,297 @@
+# Description: End-to-end load test. Runs the app under gunicorn against the local fake Spoonacular and an SMTP sink,
+# drives home, search, details, favorites, cart and email scenarios with concurrent logged-in users, and reports
+# p50/p95/p99 latency, req/s, error rate and upstream calls per request for each scenario.
+# Threshold flags make it exit non-zero, so CI can fail on a performance regression.
+#
+# Usage: python benchmarks/load_test.py [--scenarios search details] [--duration 20] [--concurrency 16]
+#            [--latency 80 --jitter 40 --error-rate 0.01] [--database-url postgresql:///easy_recipes_bench]
+#            [--json results.json] [--max-p95 250] [--max-error-rate 0.01] [--min-rps 50] [--max-upstream-per-request 0.5]
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from fake_spoonacular import FakeSpoonacular
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+SECRET_KEY = 'load-test'
+INGREDIENTS = ['flour', 'sugar', 'butter', 'egg', 'milk', 'garlic', 'onion', 'tomato', 'basil', 'lemon', 'chicken', 'rice']
+DIETS = ['', 'vegan', 'vegetarian', 'gluten free', 'pescatarian']
+# Details pages and favorites come from this many recipes, so caches warm up like they would for popular recipes
+HOT_RECIPES = 500
+FAVORITES_PER_USER = 12
+CART_PER_USER = 4
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class SinkHandler:
+    '''SMTP handler that accepts and drops every message'''
+
+    async def handle_DATA(self, server, session, envelope):
+        return '250 OK'
+
+
+# Each scenario is one user action: a function(client, rng) that makes its requests through client.get/post/patch
+def home(client, rng):
+    client.get('/recipes/random')
+
+
+def search(client, rng):
+    include = ','.join(rng.sample(INGREDIENTS, 2))
+    client.get('/recipes/complexSearch', params={'includeIngredients': include, 'excludeIngredients': rng.choice(INGREDIENTS), 'diet': rng.choice(DIETS)})
+
+
+def details(client, rng):
+    client.get(f'/recipes/{rng.randint(1, HOT_RECIPES)}/details')
+
+
+def favorites(client, rng):
+    client.get('/users/bootstrap')
+    client.get(f'/users/{client.user_id}/recipes')
+
+
+def cart(client, rng):
+    client.patch(f'/users/{client.user_id}/cart', json={'recipe_id': rng.choice(client.favorite_ids)})
+    client.get('/users/shopping_cart')
+
+
+def email(client, rng):
+    client.post('/send_email', headers={'Accept': 'application/json'})
+
+
+SCENARIOS = {'home': home, 'search': search, 'details': details, 'favorites': favorites, 'cart': cart, 'email': email}
+
+
+class Client:
+    '''A logged-in user's HTTP session that records the latency and status of every request'''
+
+    def __init__(self, base_url, cookie, user_id, favorite_ids):
+        self.base_url = base_url
+        self.user_id = user_id
+        self.favorite_ids = favorite_ids
+        self.session = requests.Session()
+        self.session.cookies.set('session', cookie)
+        self.samples = []
+        self.recording = False
+
+    def request(self, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            status = self.session.request(method, self.base_url + path, allow_redirects=False, timeout=30, **kwargs).status_code
+        except requests.exceptions.RequestException:
+            status = None
+        if self.recording:
+            self.samples.append((time.perf_counter() - start, status))
+
+    def get(self, path, **kwargs):
+        self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        self.request('POST', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        self.request('PATCH', path, **kwargs)
+
+
+def percentile(sorted_values, p):
+    '''Nearest-rank percentile'''
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(p / 100 * len(sorted_values)) - 1))]
+
+
+def seed_database(database_url, users):
+    '''Create the schema and users with favorites and cart items. Returns [(user_id, session_cookie, favorite_ids)].'''
+    os.environ.setdefault('BCRYPT_ROUNDS', '4')
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', '0')
+    from app import create_app
+    from db_init import db
+    from food_models import Recipe, Favorites
+    from user_model import User
+
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url, 'SECRET_KEY': SECRET_KEY, 'MAIL_QUEUE_WORKER': False})
+    serializer = app.session_interface.get_signing_serializer(app)
+    rng = random.Random(7)
+    seeded = []
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(Recipe(id=recipe_id) for recipe_id in range(1, HOT_RECIPES + 1))
+        for n in range(users):
+            user = User.register(username=f'load{n}', email=f'load{n}@example.com', password='password',
+                                 image_url=None, diet='', allergies='')
+            db.session.add(user)
+            db.session.flush()
+            favorite_ids = rng.sample(range(1, HOT_RECIPES + 1), FAVORITES_PER_USER)
+            db.session.add_all(Favorites(user_id=user.id, recipe_id=recipe_id, in_shopping_cart=i < CART_PER_USER)
+                               for i, recipe_id in enumerate(favorite_ids))
+            seeded.append((user.id, serializer.dumps({'curr_user': user.id}), favorite_ids))
+        db.session.commit()
+    return seeded
+
+
+def start_gunicorn(port, env, workers, threads, config):
+    '''Serve create_app(config) from gunicorn; config overrides the production defaults and holds only literals'''
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', f'app:create_app({config!r})']
+    process = subprocess.Popen(command, cwd=ROOT, env={**env, 'WEB_CONCURRENCY': str(workers), 'GUNICORN_THREADS': str(threads)})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/login', timeout=10)
+            return process
+        except requests.exceptions.RequestException:
+            if process.poll() is not None:
+                raise RuntimeError('gunicorn exited during start-up')
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn did not start within 30s')
+
+
+def run_scenario(name, base_url, seeded, fake, concurrency, duration, warmup):
+    '''Drive one scenario from `concurrency` threads. Warm-up requests are made but not recorded.'''
+    scenario = SCENARIOS[name]
+    clients = [Client(base_url, cookie, user_id, favorite_ids)
+               for user_id, cookie, favorite_ids in (seeded[i % len(seeded)] for i in range(concurrency))]
+    stop = threading.Event()
+
+    def loop(client, seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            scenario(client, rng)
+
+    threads = [threading.Thread(target=loop, args=(client, i), daemon=True) for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    time.sleep(warmup)
+
+    upstream_before = requests.get(f'{fake.url}/__stats').json()['calls']
+    for client in clients:
+        client.recording = True
+    start = time.perf_counter()
+    time.sleep(duration)
+    for client in clients:
+        client.recording = False
+    elapsed = time.perf_counter() - start
+    upstream = requests.get(f'{fake.url}/__stats').json()['calls'] - upstream_before
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    samples = [sample for client in clients for sample in client.samples]
+    latencies = sorted(latency * 1000 for latency, status in samples)
+    errors = sum(1 for latency, status in samples if status is None or status >= 500)
+    count = len(samples)
+    return {
+        'scenario': name,
+        'requests': count,
+        'rps': count / elapsed,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'error_rate': errors / count if count else 0,
+        'upstream_per_request': upstream / count if count else 0
+    }
+
+
+def check_thresholds(results, args):
+    '''Messages for every result outside the limits given on the command line'''
+    failures = []
+    for result in results:
+        name = result['scenario']
+        if args.max_p95 is not None and result['p95_ms'] > args.max_p95:
+            failures.append(f'{name}: p95 {result["p95_ms"]:.1f} ms > {args.max_p95} ms')
+        if args.max_error_rate is not None and result['error_rate'] > args.max_error_rate:
+            failures.append(f'{name}: error rate {result["error_rate"]:.2%} > {args.max_error_rate:.2%}')
+        if args.min_rps is not None and result['rps'] < args.min_rps:
+            failures.append(f'{name}: {result["rps"]:.1f} req/s < {args.min_rps} req/s')
+        if args.max_upstream_per_request is not None and result['upstream_per_request'] > args.max_upstream_per_request:
+            failures.append(f'{name}: {result["upstream_per_request"]:.2f} upstream calls/request > {args.max_upstream_per_request}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the app under gunicorn against a fake Spoonacular')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before each scenario')
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent simulated users')
+    parser.add_argument('--users', type=int, default=50, help='users to seed')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads per worker')
+    parser.add_argument('--latency', type=float, default=80, help='fake Spoonacular latency in ms')
+    parser.add_argument('--jitter', type=float, default=40, help='extra random fake Spoonacular latency in ms')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of fake Spoonacular calls that fail with 503')
+    parser.add_argument('--database-url', help='defaults to a SQLite file in a temporary directory')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--max-p95', type=float, help='fail if any scenario p95 is above this many ms')
+    parser.add_argument('--max-error-rate', type=float, help='fail if any scenario has a higher fraction of 5xx/failed requests')
+    parser.add_argument('--min-rps', type=float, help='fail if any scenario serves fewer requests per second')
+    parser.add_argument('--max-upstream-per-request', type=float, help='fail if any scenario makes more Spoonacular calls per request')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = args.database_url or f'sqlite:///{tmp}/load_test.db'
+        fake = FakeSpoonacular(('127.0.0.1', free_port()), args.latency, args.jitter, args.error_rate, seed=1).start()
+        smtp = Controller(SinkHandler(), hostname='127.0.0.1', port=free_port()) if Controller else None
+        if smtp:
+            smtp.start()
+
+        seeded = seed_database(database_url, args.users)
+        port = free_port()
+        env = {**os.environ, 'DATABASE_URL': database_url, 'SECRET_KEY': SECRET_KEY, 'SPOONACULAR_BASE_URL': fake.url,
+               'API_KEY': 'load-test', 'MAIL_SERVER': '127.0.0.1', 'MAIL_PORT': str(smtp.port if smtp else free_port()),
+               # Measure the app, not the production rate limit; the fake API doesn't bill points
+               'SPOONACULAR_POINTS_PER_SECOND': os.environ.get('SPOONACULAR_POINTS_PER_SECOND', '0')}
+        # The sink SMTP server speaks plain SMTP
+        gunicorn = start_gunicorn(port, env, args.workers, args.threads, {'MAIL_USE_SSL': False, 'MAIL_USE_TLS': False})
+
+        results = []
+        try:
+            for name in args.scenarios:
+                results.append(run_scenario(name, f'http://127.0.0.1:{port}', seeded, fake, args.concurrency, args.duration, args.warmup))
+        finally:
+            gunicorn.terminate()
+            gunicorn.wait(timeout=30)
+            fake.shutdown()
+            if smtp:
+                smtp.stop()
+
+    print(f'{args.workers} workers x {args.threads} threads, {args.concurrency} users, upstream {args.latency}+{args.jitter} ms, '
+          f'{args.error_rate:.0%} upstream errors')
+    print('scenario     requests    req/s   p50 ms   p95 ms   p99 ms   errors   upstream/req')
+    for r in results:
+        print(f'{r["scenario"]:<10} {r["requests"]:>10} {r["rps"]:>8.1f} {r["p50_ms"]:>8.1f} {r["p95_ms"]:>8.1f} {r["p99_ms"]:>8.1f} '
+              f'{r["error_rate"]:>8.2%} {r["upstream_per_request"]:>14.3f}')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
+
+    failures = check_thresholds(results, args)
+    for failure in failures:
+        print(f'FAIL {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# Description: Negotiated gzip/brotli compression for dynamic responses. Large JSON like informationBulk results
+# compresses several times over; small bodies aren't worth the CPU and are sent as they are.
+import os
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+# Brotli quality 11 is meant for build time; 4-5 compresses better than gzip 6 at a similar speed
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 4))
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/javascript', 'text/html', 'text/css', 'text/plain', 'text/javascript', 'image/svg+xml'}
+
+
+def available_encodings():
+    '''Encodings this process can produce, best first'''
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def choose_encoding(accept_encodings):
+    '''Best encoding the client accepts, or None'''
+    return accept_encodings.best_match(available_encodings())
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=COMPRESS_GZIP_LEVEL)
+
+
+def compress_response(response):
+    '''after_request hook: compress the body when the client accepts it and it is worth it'''
+    # Streamed and file responses (static files) keep their body as is
+    if (response.direct_passthrough or response.is_streamed or not 200 <= response.status_code < 300
+            or response.status_code == 204 or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None or len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the identity ones, so a strong ETag must not be shared between them.
+    # A weak ETag still matches If-None-Match, so 304s keep working.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -1,8 +1,37 @@
 # Description: This file initializes the database for the Flask app.
+from contextlib import contextmanager
+from contextvars import ContextVar
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
+# Statement lists of the count_queries blocks active in the current context
+_query_counters = ContextVar('query_counters', default=())
+
 def connect_db(app):
     '''Connect db to Flask app'''
-    db.init_app(app)
\ No newline at end of file
+    db.init_app(app)
+
+def dialect_insert(model):
+    '''INSERT construct for the connected database, which supports on_conflict_do_update/do_nothing upserts'''
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    return insert(model)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    for queries in _query_counters.get():
+        queries.append(statement)
+
+@contextmanager
+def count_queries():
+    '''Collect the SQL statements run inside the block, e.g. to assert how many queries an endpoint makes.
+    Only statements from the current thread/context are counted, not background workers.'''
+    queries = []
+    token = _query_counters.set(_query_counters.get() + (queries,))
+    try:
+        yield queries
+    finally:
+        _query_counters.reset(token)
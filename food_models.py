@@ -1,4 +1,25 @@
-from db_init import db
+import os
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.exc import DBAPIError
+from db_init import db, dialect_insert
+
+# How long a stored recipe snapshot is trusted before it is fetched again
+SNAPSHOT_MAX_AGE = timedelta(seconds=int(os.environ.get('SNAPSHOT_MAX_AGE', 7 * 24 * 60 * 60)))
+# Past SNAPSHOT_MAX_AGE a snapshot may still be served while it is refreshed in the background, up to this age
+SNAPSHOT_STALE_MAX_AGE = timedelta(seconds=int(os.environ.get('SNAPSHOT_STALE_MAX_AGE', 30 * 24 * 60 * 60)))
+
+# First key of the two-key Postgres advisory locks taken while fetching a recipe, so they can't clash with other lock users
+FETCH_LOCK_NAMESPACE = 7301
+
+
+def utcnow():
+    '''Naive UTC timestamp, matching how DateTime columns are stored'''
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
 
 class Favorites(db.Model):
     '''Tracks users' saved recipes.'''
@@ -13,6 +34,13 @@ class Favorites(db.Model):
 
     in_shopping_cart = db.Column(db.Boolean, default=False)
 
+    __table_args__ = (
+        # A recipe can only be favorited once per user. Also serves every lookup by user or by (user, recipe).
+        db.Index('uq_favorite_recipes_user_recipe', 'user_id', 'recipe_id', unique=True),
+        # Partial index over cart rows only, so cart queries stay small however many favorites a user has
+        db.Index('ix_favorite_recipes_cart', 'user_id', 'recipe_id', postgresql_where=in_shopping_cart, sqlite_where=in_shopping_cart),
+    )
+
 
 class Allergy(db.Model):
     '''Tracks ingredients that users are allergic to. Used in "excludeIngredients" parameter of API call'''
@@ -25,6 +53,8 @@ class Allergy(db.Model):
 
     user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='cascade'), nullable=False)
 
+    __table_args__ = (db.Index('uq_allergies_user_ingredient', 'user_id', 'ingredient_id', unique=True),)
+
 
 class Ingredient(db.Model):
     '''Ingredients in the system'''
@@ -37,4 +67,135 @@ class Recipe(db.Model):
 
     __tablename__ = 'recipes'
 
-    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
\ No newline at end of file
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+class RecipeSnapshot(db.Model):
+    '''Full Spoonacular JSON for a recipe, stored locally so every worker shares it and it survives restarts.
+    Hot fields are pulled out into their own columns so they can be queried without decoding the JSON.'''
+
+    __tablename__ = 'recipe_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+
+    data = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=False)
+
+    title = db.Column(db.Text)
+
+    ready_in_minutes = db.Column(db.Integer)
+
+    image = db.Column(db.Text)
+
+    ingredient_names = db.Column(db.JSON().with_variant(ARRAY(db.Text), 'postgresql'))
+
+    fetched_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @staticmethod
+    def row_from_json(recipe, fetched_at):
+        '''Map a Spoonacular recipe object to a dict of column values'''
+        return {
+            'id': recipe['id'],
+            'data': recipe,
+            'title': recipe.get('title'),
+            'ready_in_minutes': recipe.get('readyInMinutes'),
+            'image': recipe.get('image'),
+            'ingredient_names': [ingredient.get('nameClean') or ingredient.get('name') for ingredient in recipe.get('extendedIngredients') or []],
+            'fetched_at': fetched_at
+        }
+
+    @classmethod
+    def load_many(cls, recipe_ids, max_age=SNAPSHOT_MAX_AGE):
+        '''Return dict of recipe id -> recipe JSON for stored snapshots fetched within max_age (any age when None)'''
+        if not recipe_ids:
+            return {}
+        query = select(cls.id, cls.data).where(cls.id.in_(set(recipe_ids)))
+        if max_age is not None:
+            query = query.where(cls.fetched_at >= utcnow() - max_age)
+        return {id: data for id, data in db.session.execute(query)}
+
+    @classmethod
+    def load_with_stale(cls, recipe_ids, max_age=SNAPSHOT_MAX_AGE, stale_max_age=SNAPSHOT_STALE_MAX_AGE):
+        '''Return (dict of recipe id -> recipe JSON, set of ids older than max_age) for snapshots fetched within stale_max_age'''
+        if not recipe_ids:
+            return {}, set()
+        now = utcnow()
+        rows = db.session.execute(select(cls.id, cls.data, cls.fetched_at)
+                                  .where(cls.id.in_(set(recipe_ids)), cls.fetched_at >= now - stale_max_age))
+        recipes, stale = {}, set()
+        for id, data, fetched_at in rows:
+            recipes[id] = data
+            if fetched_at < now - max_age:
+                stale.add(id)
+        return recipes, stale
+
+    @classmethod
+    def stale_ids(cls, recipe_ids, max_age):
+        '''Ids among recipe_ids whose snapshots were fetched more than max_age ago'''
+        if not recipe_ids:
+            return set()
+        return set(db.session.execute(select(cls.id).where(cls.id.in_(set(recipe_ids)), cls.fetched_at < utcnow() - max_age)).scalars())
+
+    @classmethod
+    def version(cls, recipe_ids):
+        '''When the newest of recipe_ids' snapshots was fetched, or None if none is stored. Changes whenever one of them is refreshed.'''
+        if not recipe_ids:
+            return None
+        return db.session.execute(select(func.max(cls.fetched_at)).where(cls.id.in_(set(recipe_ids)))).scalar()
+
+    @classmethod
+    def sample(cls, number):
+        '''JSON of up to `number` random stored recipes. The draw is made from the ids, which Postgres reads from the primary
+        key index alone, so only the chosen rows' JSON is loaded instead of sorting every snapshot by random().'''
+        ids = db.session.execute(select(cls.id)).scalars().all()
+        return list(cls.load_many(random.sample(ids, min(number, len(ids))), max_age=None).values())
+
+    @classmethod
+    def iter_recipes(cls, batch_size=500):
+        '''Yield the JSON of every stored recipe, streaming rows in batches'''
+        rows = db.session.execute(select(cls.data).order_by(cls.id).execution_options(yield_per=batch_size))
+        for data, in rows:
+            yield data
+
+    @classmethod
+    def save_many(cls, recipes):
+        '''Upsert snapshots for recipes fetched from Spoonacular.
+        Runs on its own connection so it never commits or expires objects in the request's session.'''
+        fetched_at = utcnow()
+        rows = [cls.row_from_json(recipe, fetched_at) for recipe in recipes]
+        if not rows:
+            return
+        stmt = dialect_insert(cls).values(rows)
+        stmt = stmt.on_conflict_do_update(index_elements=[cls.id], set_={column: stmt.excluded[column] for column in rows[0] if column != 'id'})
+        with db.engine.begin() as conn:
+            conn.execute(stmt)
+
+    @classmethod
+    @contextmanager
+    def fetch_lock(cls, recipe_ids):
+        '''Hold a cross-worker lock on recipe_ids while they are fetched from Spoonacular. Yields True if another
+        worker held any of the locks, meaning it has likely stored some of them already.
+        Uses Postgres advisory locks on the session's own connection, so a fetch doesn't hold a second pooled connection
+        while it waits on Spoonacular. Other databases only get the in-process coalescing.'''
+        if db.engine.dialect.name != 'postgresql':
+            yield False
+            return
+
+        contended = False
+        conn = db.session.connection()
+        locked = []
+        try:
+            # Sorted so two workers locking overlapping id sets can't deadlock
+            for recipe_id in sorted(set(recipe_ids)):
+                params = {'namespace': FETCH_LOCK_NAMESPACE, 'id': recipe_id}
+                if not conn.execute(text('SELECT pg_try_advisory_lock(:namespace, :id)'), params).scalar():
+                    contended = True
+                    conn.execute(text('SELECT pg_advisory_lock(:namespace, :id)'), params)
+                locked.append(params)
+            yield contended
+        finally:
+            # Session-level locks outlive the transaction, so they are released here rather than when the request ends
+            try:
+                for params in locked:
+                    conn.execute(text('SELECT pg_advisory_unlock(:namespace, :id)'), params)
+            except DBAPIError:
+                # The session's transaction failed; closing the connection releases whatever it still holds
+                conn.invalidate()
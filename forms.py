@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, TextAreaField, SelectField
+from wtforms import StringField, PasswordField, SelectField
 from wtforms.validators import InputRequired, Email, Length, URL, Optional
 
 
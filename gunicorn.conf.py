@@ -0,0 +1,18 @@
+# Description: Gunicorn settings. Threaded workers let a worker keep serving other requests
+# while one of its requests is waiting on Spoonacular or the database.
+import os
+import glob
+import tempfile
+
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+
+# Workers write their metrics here so /metrics can add up all of them. Counts from a previous server start are removed.
+os.environ.setdefault('METRICS_DIR', tempfile.mkdtemp(prefix='easy-recipes-metrics-'))
+
+
+def on_starting(server):
+    for path in glob.glob(os.path.join(os.environ['METRICS_DIR'], '*.json')):
+        os.remove(path)
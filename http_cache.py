@@ -0,0 +1,44 @@
+# Description: Conditional GET helpers. Views compute a validator before doing expensive work, answer 304 when the
+# client's copy is still current, and put the same validators on full responses.
+import hashlib
+from flask import current_app, request
+from werkzeug.http import is_resource_modified
+
+
+def make_etag(*parts):
+    '''ETag value from everything that determines the response body'''
+    return hashlib.sha1('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    '''True if If-None-Match/If-Modified-Since show the client already has this version. ETags take precedence.'''
+    return request.method in ('GET', 'HEAD') and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def with_validators(response, etag, last_modified=None, private=True):
+    '''Add ETag/Last-Modified and make browsers and shared caches revalidate before reusing the response.
+    Responses that depend on the logged in user are private so a CDN never serves them to someone else.'''
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
+
+
+def not_modified_response(etag, last_modified=None, private=True):
+    '''Empty 304 carrying the same validators as the full response'''
+    return with_validators(current_app.response_class(status=304), etag, last_modified, private)
+
+
+def json_response(data, etag=None, private=True):
+    '''JSON response with an ETag, by default a hash of the body, or a 304 if the client already has it.
+    Views that can compute the ETag before fetching data should check not_modified first and pass it in.'''
+    body = current_app.json.dumps(data)
+    etag = etag or make_etag(body)
+    if not_modified(etag):
+        return not_modified_response(etag, private=private)
+    return with_validators(current_app.response_class(body, mimetype='application/json'), etag, private=private)
@@ -0,0 +1,168 @@
+# Description: In-process inverted index from ingredient name to recipe ids, used to answer searches without Spoonacular.
+import re
+import threading
+from collections import defaultdict
+
+WORD_PATTERN = re.compile(r'[a-z]+')
+
+# Spoonacular diet labels (and boolean flags) -> the diet values our search form sends.
+# A recipe that fits a stricter diet also fits the looser ones, e.g. vegan recipes are vegetarian.
+DIET_LABELS = {
+    'vegan': ('vegan', 'vegetarian', 'lacto-vegetarian', 'ovo-vegetarian', 'pescetarian'),
+    'lacto ovo vegetarian': ('vegetarian', 'pescetarian'),
+    'vegetarian': ('vegetarian', 'pescetarian'),
+    'lacto vegetarian': ('lacto-vegetarian', 'vegetarian', 'pescetarian'),
+    'ovo vegetarian': ('ovo-vegetarian', 'vegetarian', 'pescetarian'),
+    'pescatarian': ('pescetarian',),
+    'pescetarian': ('pescetarian',),
+    'paleolithic': ('paleo',),
+    'paleo': ('paleo',),
+    'fodmap friendly': ('low-fodmap',),
+    'low fodmap': ('low-fodmap',),
+    'whole 30': ('whole30',),
+    'gluten free': ('gluten free',),
+    'dairy free': ('dairy free',),
+    'ketogenic': ('ketogenic',),
+    'primal': ('primal',)
+}
+DIET_FLAGS = {'vegan': 'vegan', 'vegetarian': 'vegetarian', 'glutenFree': 'gluten free', 'dairyFree': 'dairy free', 'lowFodmap': 'low fodmap'}
+
+
+def singular(word):
+    '''Crude singularization so "eggs" matches "egg" and "berries" matches "berry"'''
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes', 'sses')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def normalize_terms(name):
+    '''Split an ingredient name into normalized word tokens'''
+    return {singular(word) for word in WORD_PATTERN.findall(name.lower())}
+
+
+def recipe_diets(recipe):
+    '''Set of search-form diet values a Spoonacular recipe satisfies'''
+    labels = {label.lower() for label in recipe.get('diets') or []}
+    labels.update(label for flag, label in DIET_FLAGS.items() if recipe.get(flag))
+    return {diet for label in labels for diet in DIET_LABELS.get(label, (label,))}
+
+
+def iter_bits(bits):
+    '''Yield positions of set bits, lowest first'''
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+class IngredientIndex:
+    '''Maps normalized ingredient words and diets to bitsets of recipe slots. Searches are
+    set intersection/difference on Python ints, so they stay fast however many recipes are indexed.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._slots = {}  # recipe id -> bit position
+        self._cards = []  # bit position -> search result card for the recipe
+        self._terms = []  # bit position -> index keys the recipe is filed under, so it can be re-indexed
+        self._ingredient_terms = []  # bit position -> word set of each of the recipe's ingredients
+        self._ingredients = defaultdict(int)
+        self._diets = defaultdict(int)
+        self._all = 0
+        self._load_lock = threading.Lock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, recipe):
+        '''Index (or re-index) one Spoonacular recipe. Recipes without ingredient data are skipped.'''
+        ingredients = recipe.get('extendedIngredients')
+        if not ingredients:
+            return
+        ingredient_terms = tuple({frozenset(normalize_terms(ingredient.get('nameClean') or ingredient.get('name') or ''))
+                                  for ingredient in ingredients})
+        terms = set().union(*ingredient_terms)
+        diets = recipe_diets(recipe)
+        card = {'id': recipe['id'], 'title': recipe.get('title'), 'image': recipe.get('image'), 'imageType': recipe.get('imageType')}
+
+        with self._lock:
+            slot = self._slots.get(recipe['id'])
+            if slot is None:
+                slot = self._slots[recipe['id']] = len(self._cards)
+                self._cards.append(card)
+                self._terms.append(((), ()))
+                self._ingredient_terms.append(())
+            else:
+                self._unfile(slot)
+                self._cards[slot] = card
+            bit = 1 << slot
+            for term in terms:
+                self._ingredients[term] |= bit
+            for diet in diets:
+                self._diets[diet] |= bit
+            self._terms[slot] = (tuple(terms), tuple(diets))
+            self._ingredient_terms[slot] = ingredient_terms
+            self._all |= bit
+
+    def add_many(self, recipes):
+        for recipe in recipes:
+            self.add(recipe)
+
+    def ensure_loaded(self, source):
+        '''Bulk-build the index once from source(), an iterable of stored recipes such as the snapshot table'''
+        if self.loaded:
+            return
+        with self._load_lock:
+            if not self.loaded:
+                self.add_many(source())
+                self.loaded = True
+
+    def _unfile(self, slot):
+        bit = 1 << slot
+        terms, diets = self._terms[slot]
+        for term in terms:
+            self._ingredients[term] &= ~bit
+        for diet in diets:
+            self._diets[diet] &= ~bit
+
+    def _match(self, name):
+        '''Bitset of recipes with an ingredient containing every word of name ("olive oil" needs both words in one ingredient)'''
+        terms = normalize_terms(name)
+        bits = self._all
+        for term in terms:
+            bits &= self._ingredients.get(term, 0)
+        if len(terms) > 1:
+            # The words may come from different ingredients ("black olives", "vegetable oil"), so check the candidates
+            for slot in iter_bits(bits):
+                if not any(terms <= ingredient for ingredient in self._ingredient_terms[slot]):
+                    bits &= ~(1 << slot)
+        return bits
+
+    def search(self, include=(), exclude=(), diet=None, offset=0, number=8):
+        '''Return (result cards, total matches) for recipes with every included ingredient, none of the
+        excluded ingredients, and fitting diet. Results are in the order recipes were indexed.'''
+        with self._lock:
+            bits = self._all
+            for name in include:
+                bits &= self._match(name)
+            for name in exclude:
+                if normalize_terms(name):
+                    bits &= ~self._match(name)
+            if diet and diet != 'none':
+                bits &= self._diets.get(diet, 0)
+
+            total = bits.bit_count()
+            results = []
+            for position, slot in enumerate(iter_bits(bits)):
+                if position >= offset + number:
+                    break
+                if position >= offset:
+                    results.append(self._cards[slot])
+        return results, total
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,34 @@
+from db_init import db
+from food_models import utcnow
+
+
+class OutboxEmail(db.Model):
+    '''Outgoing email waiting to be sent by the background mail dispatcher'''
+
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+
+    sender = db.Column(db.Text, nullable=False)
+
+    # Comma separated list of addresses
+    recipients = db.Column(db.Text, nullable=False)
+
+    subject = db.Column(db.Text, nullable=False)
+
+    html = db.Column(db.Text, nullable=False)
+
+    # pending -> sent, or pending -> failed once attempts run out
+    status = db.Column(db.Text, nullable=False, default='pending')
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    last_error = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),)
@@ -0,0 +1,163 @@
+# Description: Background mail dispatcher. Requests add emails to the outbox table and return immediately;
+# a worker thread sends them in batches over one SMTP connection and retries failures with backoff.
+import os
+import random
+import time
+import smtplib
+import threading
+import logging
+from datetime import timedelta
+from flask_mail import Message, Connection
+from db_init import db
+from food_models import utcnow
+from mail_model import OutboxEmail
+
+MAIL_QUEUE_BATCH_SIZE = int(os.environ.get('MAIL_QUEUE_BATCH_SIZE', 20))
+MAIL_QUEUE_POLL_INTERVAL = float(os.environ.get('MAIL_QUEUE_POLL_INTERVAL', 5))
+MAIL_QUEUE_MAX_ATTEMPTS = int(os.environ.get('MAIL_QUEUE_MAX_ATTEMPTS', 6))
+# Retry delays grow 30s, 60s, 120s, ... capped at an hour
+MAIL_QUEUE_BACKOFF_BASE = float(os.environ.get('MAIL_QUEUE_BACKOFF_BASE', 30))
+MAIL_QUEUE_BACKOFF_MAX = float(os.environ.get('MAIL_QUEUE_BACKOFF_MAX', 60 * 60))
+# A claimed email is not picked up again for this long, so a worker that dies mid-send doesn't lose it
+MAIL_QUEUE_LEASE = timedelta(seconds=int(os.environ.get('MAIL_QUEUE_LEASE', 120)))
+# Seconds any one SMTP read or write may take. Flask-Mail sets no timeout, so a hung server would block the worker for good.
+MAIL_QUEUE_SMTP_TIMEOUT = float(os.environ.get('MAIL_QUEUE_SMTP_TIMEOUT', 20))
+
+logger = logging.getLogger(__name__)
+
+
+def retry_delay(attempts):
+    '''Exponential backoff with jitter, so a flaky SMTP server isn't hit by every retry at once'''
+    delay = min(MAIL_QUEUE_BACKOFF_BASE * 2 ** (attempts - 1), MAIL_QUEUE_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class TimeoutConnection(Connection):
+    '''Flask-Mail connection whose SMTP socket times out'''
+
+    def __init__(self, mail, timeout):
+        super().__init__(mail)
+        self.timeout = timeout
+
+    def configure_host(self):
+        if self.mail.use_ssl:
+            host = smtplib.SMTP_SSL(self.mail.server, self.mail.port, timeout=self.timeout)
+        else:
+            host = smtplib.SMTP(self.mail.server, self.mail.port, timeout=self.timeout)
+        host.set_debuglevel(int(self.mail.debug))
+        if self.mail.use_tls:
+            host.starttls()
+        if self.mail.username and self.mail.password:
+            host.login(self.mail.username, self.mail.password)
+        return host
+
+
+class MailDispatcher:
+    '''Owns the outbox worker thread for one process'''
+
+    def __init__(self, batch_size=MAIL_QUEUE_BATCH_SIZE, poll_interval=MAIL_QUEUE_POLL_INTERVAL, max_attempts=MAIL_QUEUE_MAX_ATTEMPTS,
+                 timeout=MAIL_QUEUE_SMTP_TIMEOUT):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self.app = None
+        self.mail = None
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app, mail):
+        '''Attach to the Flask app. The worker starts with the first request so it is never forked by a preloading server.'''
+        self.app = app
+        self.mail = mail
+        if app.config.get('MAIL_QUEUE_WORKER', True):
+            app.before_request(self.start)
+
+    def start(self):
+        '''Start the worker thread if this process doesn't have one yet'''
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='mail-dispatcher', daemon=True)
+                self._thread.start()
+
+    def enqueue(self, recipients, subject, html, sender):
+        '''Store an email in the outbox and wake the worker. Commits the current session.'''
+        email = OutboxEmail(recipients=','.join(recipients), subject=subject, html=html, sender=sender)
+        db.session.add(email)
+        db.session.commit()
+        self._wake.set()
+        return email
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    sent = self.dispatch_batch()
+            except Exception:
+                logger.exception('Mail dispatcher failed')
+                sent = 0
+            # Keep draining while there is work, otherwise sleep until woken by enqueue or the poll interval passes
+            if not sent:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def claim_batch(self):
+        '''Lease up to batch_size due emails. SKIP LOCKED lets several workers drain the outbox without sending twice.'''
+        now = utcnow()
+        emails = (OutboxEmail.query
+                  .filter(OutboxEmail.status == 'pending', OutboxEmail.next_attempt_at <= now)
+                  .order_by(OutboxEmail.next_attempt_at)
+                  .limit(self.batch_size)
+                  .with_for_update(skip_locked=True)
+                  .all())
+        for email in emails:
+            email.attempts += 1
+            email.next_attempt_at = now + MAIL_QUEUE_LEASE
+        db.session.commit()
+        return emails
+
+    def dispatch_batch(self):
+        '''Send one batch of due emails over a single SMTP connection. Returns the number of emails handled.'''
+        emails = self.claim_batch()
+        if not emails:
+            return 0
+
+        # Stop sending well before the lease runs out, so no email is claimed by another worker while it is being sent
+        deadline = time.monotonic() + MAIL_QUEUE_LEASE.total_seconds() - 2 * self.timeout
+        try:
+            with TimeoutConnection(self.app.extensions['mail'], self.timeout) as conn:
+                for email in emails:
+                    if time.monotonic() > deadline:
+                        # Not attempted: due again straight away, without counting an attempt
+                        email.attempts -= 1
+                        email.next_attempt_at = utcnow()
+                        continue
+                    try:
+                        conn.send(Message(email.subject, sender=email.sender, recipients=email.recipients.split(','), html=email.html))
+                        email.status = 'sent'
+                        email.sent_at = utcnow()
+                    except (smtplib.SMTPException, OSError) as e:
+                        self._schedule_retry(email, e)
+        except (smtplib.SMTPException, OSError) as e:
+            # Couldn't open (or cleanly close) the connection: every email not already sent goes back in the queue
+            for email in emails:
+                if email.status != 'sent':
+                    self._schedule_retry(email, e)
+        db.session.commit()
+        return len(emails)
+
+    def _schedule_retry(self, email, error):
+        email.last_error = repr(error)
+        if email.attempts >= self.max_attempts:
+            email.status = 'failed'
+            logger.error('Giving up on email %s after %s attempts: %r', email.id, email.attempts, error)
+        else:
+            email.next_attempt_at = utcnow() + retry_delay(email.attempts)
+
+
+mail_dispatcher = MailDispatcher()
@@ -0,0 +1,210 @@
+# Description: Latency histograms for requests, Spoonacular calls and SQL statements, served in Prometheus text format
+# at /metrics. Each worker process counts in memory and a background thread writes the counts to a file in METRICS_DIR;
+# /metrics adds up every worker's file, so it shows the same totals whichever worker answers the scrape.
+import os
+import re
+import json
+import time
+import atexit
+import bisect
+import tempfile
+import threading
+from flask import Blueprint, Response, g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Unset means single-process mode: /metrics only reports the process that serves it
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+# Upper bounds in seconds, from fast SQL statements up to Spoonacular calls that hit the read timeout
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': 'Time to handle a request, by endpoint, method and status',
+    'spoonacular_request_duration_seconds': 'Time of Spoonacular API calls including retries, by path and status',
+    'db_query_duration_seconds': 'Time of SQL statements, by request endpoint and statement type'
+}
+SQL_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'BEGIN', 'COMMIT', 'ROLLBACK'}
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+class Metrics:
+    '''Thread-safe histogram registry for one process, optionally shared with other processes through a directory'''
+
+    def __init__(self, buckets=BUCKETS, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        self.buckets = tuple(buckets)
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # (name, labels) -> per-bucket counts (the last one is +Inf) followed by the sum; cumulated when rendered
+        self._series = {}
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher_pid = None
+
+    def observe(self, name, labels, seconds):
+        '''Add one observation. labels is a tuple of (label, value) pairs.'''
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            # A forked worker starts counting from zero instead of repeating its parent's counts
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._series = {}
+            if self.directory is not None and self._flusher_pid != self._pid:
+                self._start_flusher()
+            series = self._series.get((name, labels))
+            if series is None:
+                series = self._series[(name, labels)] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += seconds
+
+    def _start_flusher(self):
+        '''Write this process' file every flush_interval from a daemon thread, keeping file I/O out of requests'''
+        self._flusher_pid = self._pid
+        threading.Thread(target=self._flush_forever, name='metrics-flusher', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                # Metrics must never take the worker down; the next flush tries again
+                pass
+
+    def snapshot(self):
+        '''Copy of this process' series'''
+        with self._lock:
+            if self._pid != os.getpid():
+                return {}
+            return {key: list(series) for key, series in self._series.items()}
+
+    def clear(self):
+        with self._lock:
+            self._series = {}
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'{pid}.json')
+
+    def flush(self):
+        '''Write this process' counts to its file. Only one thread writes at a time; the others skip.'''
+        if self.directory is None or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            series = self.snapshot()
+            if not series:
+                return
+            data = json.dumps([[name, labels, counts] for (name, labels), counts in series.items()])
+            # Write then rename, so readers never see a half-written file
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp, self._path(os.getpid()))
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        '''Series of every process that has written to the directory plus this one.
+        Files of workers that have exited are kept, so totals never go backwards.'''
+        merged = self.snapshot()
+        if self.directory is None:
+            return merged
+        own = f'{os.getpid()}.json'
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, counts in entries:
+                key = (name, tuple(tuple(pair) for pair in labels))
+                total = merged.setdefault(key, [0] * len(counts))
+                for i, count in enumerate(counts):
+                    total[i] += count
+        return merged
+
+    def render(self):
+        '''All histograms in the Prometheus text exposition format'''
+        by_name = {}
+        for (name, labels), counts in sorted(self.collect().items()):
+            by_name.setdefault(name, []).append((labels, counts))
+
+        lines = []
+        for name, series in by_name.items():
+            lines.append(f'# HELP {name} {HISTOGRAMS.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for labels, counts in series:
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", str(bound)),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {counts[-1]}')
+                lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + '}'
+
+
+def current_endpoint():
+    '''Endpoint of the request being handled, for labels. Unmatched URLs share one label to keep the series bounded.'''
+    if not has_request_context():
+        return 'background'
+    return request.endpoint or 'unmatched'
+
+
+def observe_upstream(path, status, seconds):
+    '''Record a Spoonacular call. Recipe ids in the path are replaced by {id}; status is None when no response came back.'''
+    metrics.observe('spoonacular_request_duration_seconds',
+                    (('path', ID_SEGMENT.sub('/{id}', path)), ('status', str(status) if status else 'error')), seconds)
+
+
+def start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def record_request(response):
+    start = g.pop('metrics_start', None)
+    if start is not None:
+        metrics.observe('http_request_duration_seconds',
+                        (('endpoint', current_endpoint()), ('method', request.method), ('status', str(response.status_code))),
+                        time.perf_counter() - start)
+    return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info['metrics_query_start'] = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop('metrics_query_start', None)
+    if start is None:
+        return
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ''
+    metrics.observe('db_query_duration_seconds',
+                    (('endpoint', current_endpoint()), ('operation', operation if operation in SQL_OPERATIONS else 'OTHER')),
+                    time.perf_counter() - start)
+
+
+@metrics_bp.route('/metrics')
+def serve_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_app(app):
+    '''Time every request. Call before registering other hooks so the timing includes them.'''
+    app.before_request(start_timer)
+    app.after_request(record_request)
+
+
+metrics = Metrics()
+# Gracefully stopped workers write their last counts
+atexit.register(metrics.flush)
@@ -0,0 +1,23 @@
+-- Adds the unique and partial indexes on favorite_recipes and allergies to an existing database.
+-- New databases get them from db.create_all(). Run with: psql easy_recipes -f migrations/001_favorites_allergies_indexes.sql
+-- Indexes are built CONCURRENTLY so the tables stay writable; psql runs each statement in its own transaction.
+
+-- Duplicate rows would block the unique indexes. Keep the oldest row of each pair, and keep it in the cart if any duplicate was.
+UPDATE favorite_recipes keep SET in_shopping_cart = true
+FROM favorite_recipes dup
+WHERE dup.user_id = keep.user_id AND dup.recipe_id = keep.recipe_id AND dup.id > keep.id AND dup.in_shopping_cart;
+
+DELETE FROM favorite_recipes dup USING favorite_recipes keep
+WHERE dup.user_id = keep.user_id AND dup.recipe_id = keep.recipe_id AND dup.id > keep.id;
+
+DELETE FROM allergies dup USING allergies keep
+WHERE dup.user_id = keep.user_id AND dup.ingredient_id = keep.ingredient_id AND dup.id > keep.id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_favorite_recipes_user_recipe ON favorite_recipes (user_id, recipe_id);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_favorite_recipes_cart ON favorite_recipes (user_id, recipe_id) WHERE in_shopping_cart;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_allergies_user_ingredient ON allergies (user_id, ingredient_id);
+
+ANALYZE favorite_recipes;
+ANALYZE allergies;
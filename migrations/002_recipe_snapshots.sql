@@ -0,0 +1,15 @@
+-- Adds the recipe_snapshots table, the shared store of Spoonacular recipe JSON, to an existing database.
+-- New databases get it from db.create_all(). Run with: psql easy_recipes -f migrations/002_recipe_snapshots.sql
+
+CREATE TABLE IF NOT EXISTS recipe_snapshots (
+    id INTEGER NOT NULL PRIMARY KEY,
+    data JSONB NOT NULL,
+    title TEXT,
+    ready_in_minutes INTEGER,
+    image TEXT,
+    ingredient_names TEXT[],
+    fetched_at TIMESTAMP WITHOUT TIME ZONE NOT NULL
+);
+
+-- Max-age filtering and the background refresher look snapshots up by fetch time
+CREATE INDEX IF NOT EXISTS ix_recipe_snapshots_fetched_at ON recipe_snapshots (fetched_at);
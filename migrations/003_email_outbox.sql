@@ -0,0 +1,19 @@
+-- Adds the email_outbox table, drained by the background mail dispatcher, to an existing database.
+-- New databases get it from db.create_all(). Run with: psql easy_recipes -f migrations/003_email_outbox.sql
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+    id SERIAL NOT NULL PRIMARY KEY,
+    sender TEXT NOT NULL,
+    recipients TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    html TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    next_attempt_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    last_error TEXT,
+    created_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+    sent_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- The dispatcher claims due pending emails with this index
+CREATE INDEX IF NOT EXISTS ix_email_outbox_due ON email_outbox (status, next_attempt_at);
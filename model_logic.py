@@ -1,30 +1,31 @@
-from flask_bcrypt import Bcrypt
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import make_transient_to_detached
+from db_init import db, dialect_insert
 from food_models import Ingredient
 import re
 
+ALLERGY_PATTERN = re.compile(r'[a-zA-Z]+') # regex pattern to extract all words from allergies string
+
 def set_allergies(allergies, user):
-    '''Add allergies to user. If allergy does not exist, create new ingredient and add to user. If allergy exists, add to user'''
-    user.allergies = []
-    user.dietary_restrictions = ''
+    '''Replace user's allergies with the words in the allergies string. Ingredients that don't exist yet are created.
+    Costs one IN query plus one upsert, however many allergies are listed.'''
 
-    allergy_pattern = r'[a-zA-Z]+' # regex pattern to extract all words from allergies string
-    allergies = re.findall(allergy_pattern, allergies)
+    # dict.fromkeys drops repeated words while keeping the order the user typed them in
+    names = list(dict.fromkeys(ALLERGY_PATTERN.findall(allergies or '')))
 
-    for index, allergy in enumerate(allergies):
-        existing_allergy = Ingredient.query.filter(Ingredient.id==allergy).one_or_none()
+    ingredients = {}
+    if names:
+        ingredients = {ingredient.id: ingredient for ingredient in Ingredient.query.filter(Ingredient.id.in_(names))}
 
-        if not existing_allergy:
-            new_allergy = Ingredient(id=allergy)
-            user.allergies.append(new_allergy)
-            add_dietary_restrictions(index, user, allergy)
-        elif existing_allergy not in user.allergies:
-            user.allergies.append(existing_allergy)
-            add_dietary_restrictions(index, user, allergy)
+    missing = [name for name in names if name not in ingredients]
+    if missing:
+        # Upsert so two users registering with the same new allergy at once don't collide
+        db.session.execute(dialect_insert(Ingredient).values([{'id': name} for name in missing]).on_conflict_do_nothing(index_elements=['id']))
+        for name in missing:
+            # The row exists now, so attach it to the session as persistent without selecting it back
+            ingredient = Ingredient(id=name)
+            make_transient_to_detached(ingredient)
+            db.session.add(ingredient)
+            ingredients[name] = ingredient
 
-def add_dietary_restrictions(index, user, allergy):
-    '''Add dietary restrictions to user'''
-    if index == 0:
-        user.dietary_restrictions = allergy
-    else:
-        user.dietary_restrictions = user.dietary_restrictions + ', ' + allergy
\ No newline at end of file
+    user.allergies = [ingredients[name] for name in names]
+    user.dietary_restrictions = ', '.join(names)
@@ -0,0 +1,87 @@
+# Description: Password hashing service. bcrypt runs in a dedicated process pool, so hashing at peak login times
+# is capped at the pool size instead of taking CPU from every request thread, and the work factor is configurable.
+import os
+import hmac
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+# bcrypt cost (log2 of the rounds). Existing hashes with another cost are rehashed the next time their user logs in.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+# Per web worker process, so the default is kept small; 0 hashes in the calling thread, which is what tests and scripts want
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', min(os.cpu_count() or 1, 2)))
+
+
+def _hash(password, rounds):
+    '''Runs in a pool process. Same format as flask_bcrypt, so existing hashes keep working.'''
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _check(hashed, password):
+    '''Runs in a pool process. Compares in constant time.'''
+    hashed = hashed.encode('utf-8')
+    return hmac.compare_digest(bcrypt.hashpw(password.encode('utf-8'), hashed), hashed)
+
+
+def hash_rounds(hashed):
+    '''Cost a bcrypt hash was made with, read from its "$2b$12$..." prefix'''
+    try:
+        return int(hashed.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class PasswordHasher:
+    '''Hashes and checks passwords on a process pool, started lazily and again in forked workers'''
+
+    def __init__(self, rounds=BCRYPT_ROUNDS, workers=PASSWORD_HASH_WORKERS):
+        self.rounds = rounds
+        self.workers = workers
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        return self._ensure_started().submit(fn, *args).result()
+
+    def _ensure_started(self):
+        '''A pool inherited through fork has no live processes in the child, so each process starts its own'''
+        if self._pool is not None and self._pid == os.getpid():
+            return self._pool
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                # The pool starts lazily in a process that is already running request threads, where fork is unsafe.
+                # forkserver forks workers from a clean single-threaded server that has imported only this module.
+                # Workers still import the __main__ script, so scripts using the pool (seed.py) guard their body.
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+        return self._pool
+
+    def hash(self, password):
+        '''Hash password with the configured cost'''
+        if not password:
+            raise ValueError('Password must be non-empty.')
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        '''True if password matches hashed'''
+        if not hashed or not password:
+            return False
+        return self._run(_check, hashed, password)
+
+    def needs_rehash(self, hashed):
+        '''True if hashed was made with a different cost than the configured one'''
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+
+
+password_hasher = PasswordHasher()
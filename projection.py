@@ -0,0 +1,30 @@
+# Description: Projection of Spoonacular recipe objects. Views send only the fields their client uses instead of the
+# full objects, which carry extendedIngredients, analyzedInstructions and more; `?fields=` can choose other fields.
+from flask import request
+
+# Fields the frontend's Recipe class uses
+RECIPE_CARD_FIELDS = ('id', 'title', 'cuisines', 'summary', 'instructions', 'sourceUrl', 'readyInMinutes', 'image')
+# ?fields=* returns the whole object
+ALL_FIELDS = None
+
+
+def requested_fields(default=RECIPE_CARD_FIELDS):
+    '''Fields from the ?fields=a,b query parameter, or default when it's missing'''
+    value = request.args.get('fields')
+    if value is None:
+        return default
+    if value.strip() == '*':
+        return ALL_FIELDS
+    # The id is always included so clients can tell the recipes apart
+    return tuple(dict.fromkeys(['id', *(field.strip() for field in value.split(',') if field.strip())]))
+
+
+def project(recipe, fields):
+    '''Copy of recipe with only the given fields (missing ones are None), or recipe itself for ALL_FIELDS'''
+    if fields is ALL_FIELDS:
+        return recipe
+    return {field: recipe.get(field) for field in fields}
+
+
+def project_many(recipes, fields):
+    return [project(recipe, fields) for recipe in recipes]
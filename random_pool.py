@@ -0,0 +1,145 @@
+# Description: Pool of pre-fetched recipes for /recipes/random. A background thread keeps a few hundred recipes in
+# memory, drawn from the snapshot table and topped up from Spoonacular in large batches, so the home page samples
+# recipes from memory instead of asking Spoonacular for 16 new ones on every visit.
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from ingredient_index import normalize_terms, recipe_diets
+from spoonacular_client import spoonacular
+
+RANDOM_POOL_SIZE = int(os.environ.get('RANDOM_POOL_SIZE', 300))
+# Spoonacular returns at most 100 random recipes per call
+RANDOM_POOL_FETCH_SIZE = int(os.environ.get('RANDOM_POOL_FETCH_SIZE', 100))
+# The pool is redrawn from the stored recipes this often, which costs no points, so visitors see different recipes
+RANDOM_POOL_REFRESH_INTERVAL = float(os.environ.get('RANDOM_POOL_REFRESH_INTERVAL', 10 * 60))
+# New random recipes are fetched this often, or whenever too few are stored to fill the pool
+RANDOM_POOL_FETCH_INTERVAL = float(os.environ.get('RANDOM_POOL_FETCH_INTERVAL', 6 * 60 * 60))
+
+logger = logging.getLogger(__name__)
+
+
+def allergen_terms(allergies):
+    '''Normalized words of a user's allergies, comparable with recipe ingredient terms'''
+    return set().union(*(normalize_terms(allergy) for allergy in allergies))
+
+
+def recipe_terms(recipe):
+    '''Normalized words of a recipe's ingredients'''
+    return frozenset(term for ingredient in recipe.get('extendedIngredients') or []
+                     for term in normalize_terms(ingredient.get('nameClean') or ingredient.get('name') or ''))
+
+
+def top_up(recipes, more, number, allergies=()):
+    '''recipes followed by those in more that it doesn't have yet and that are free of the allergy ingredients, up to number'''
+    allergens = allergen_terms(allergies)
+    picked = list(recipes)
+    ids = {recipe['id'] for recipe in picked}
+    for recipe in more:
+        if len(picked) >= number:
+            break
+        if recipe['id'] not in ids and not recipe_terms(recipe) & allergens:
+            picked.append(recipe)
+            ids.add(recipe['id'])
+    return picked
+
+
+class RandomRecipePool:
+    '''Recipes to sample random ones from, grouped by diet. A refill builds new groups and swaps them in at once,
+    so sampling never takes a lock.'''
+
+    def __init__(self, client, size=RANDOM_POOL_SIZE, fetch_size=RANDOM_POOL_FETCH_SIZE,
+                 refresh_interval=RANDOM_POOL_REFRESH_INTERVAL, fetch_interval=RANDOM_POOL_FETCH_INTERVAL):
+        self.client = client
+        self.size = size
+        self.fetch_size = fetch_size
+        self.refresh_interval = refresh_interval
+        self.fetch_interval = fetch_interval
+        self.app = None
+        # (all entries, diet -> entries); an entry is (recipe, its ingredient terms)
+        self._groups = ((), {})
+        self._last_fetch = time.monotonic()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._groups[0])
+
+    def init_app(self, app):
+        '''Attach to the Flask app. The worker starts with the first request so it is never forked by a preloading server.'''
+        self.app = app
+        if app.config.get('RANDOM_POOL', True):
+            app.before_request(self.start)
+
+    def start(self):
+        '''Start the refill thread if this process doesn't have one yet'''
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='random-pool', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    self.refill()
+            except Exception:
+                logger.exception('Random recipe pool refill failed')
+            time.sleep(self.refresh_interval)
+
+    def replace(self, recipes):
+        '''Make recipes the pool's contents'''
+        entries = []
+        by_diet = {}
+        for recipe in recipes:
+            entry = (recipe, recipe_terms(recipe))
+            entries.append(entry)
+            for diet in recipe_diets(recipe):
+                by_diet.setdefault(diet, []).append(entry)
+        self._groups = (tuple(entries), {diet: tuple(group) for diet, group in by_diet.items()})
+
+    def refill(self):
+        '''Redraw the pool from stored recipes, first fetching a batch of new ones when it is time or too few are stored'''
+        stored = self.client.store.sample(self.size)
+        fetched = []
+        if len(stored) < self.size or time.monotonic() - self._last_fetch >= self.fetch_interval:
+            try:
+                fetched = self.client.random(number=self.fetch_size).get('recipes', [])
+                self._last_fetch = time.monotonic()
+            except requests.exceptions.RequestException:
+                logger.warning('Could not fetch random recipes for the pool')
+
+        # New recipes first, then stored ones until the pool is full; dict keeps one copy of each recipe
+        recipes = {}
+        for recipe in fetched + stored:
+            if len(recipes) >= self.size:
+                break
+            recipes.setdefault(recipe['id'], recipe)
+        if recipes:
+            self.replace(recipes.values())
+
+    def sample(self, number, diet=None, allergies=()):
+        '''Up to `number` random recipes fitting the diet and free of the allergy ingredients.
+        Returns fewer, or none while the pool is empty, when not enough recipes fit.'''
+        entries, by_diet = self._groups
+        candidates = by_diet.get(diet, ()) if diet and diet != 'none' else entries
+        allergens = allergen_terms(allergies)
+        if not allergens:
+            return [recipe for recipe, terms in random.sample(candidates, min(number, len(candidates)))]
+
+        # A few spare draws cover most allergy rejections; only when they don't is every candidate checked
+        drawn = random.sample(candidates, min(number * 2, len(candidates)))
+        picked = [recipe for recipe, terms in drawn if not terms & allergens]
+        if len(picked) < number and len(drawn) < len(candidates):
+            safe = [recipe for recipe, terms in candidates if not terms & allergens]
+            picked = random.sample(safe, min(number, len(safe)))
+        return picked[:number]
+
+
+random_pool = RandomRecipePool(spoonacular)
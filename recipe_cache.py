@@ -0,0 +1,128 @@
+# Description: In-process TTL + LRU cache used for recipe JSON from Spoonacular.
+import os
+import json
+import threading
+import time
+from collections import OrderedDict
+
+RECIPE_CACHE_TTL = int(os.environ.get('RECIPE_CACHE_TTL', 6 * 60 * 60))
+RECIPE_CACHE_MAX_ENTRIES = int(os.environ.get('RECIPE_CACHE_MAX_ENTRIES', 2000))
+RECIPE_CACHE_MAX_BYTES = int(os.environ.get('RECIPE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+
+def json_size(value):
+    '''Approximate memory cost of a cached value by the size of its JSON encoding'''
+    return len(json.dumps(value, separators=(',', ':')))
+
+
+class TTLCache:
+    '''Thread-safe cache with per-entry expiry, an entry count and byte budget, and least-recently-used eviction.'''
+
+    def __init__(self, ttl, max_entries, max_bytes=None, sizeof=json_size):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, expires_at, size), oldest first
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] > time.monotonic()
+
+    def get(self, key, default=None):
+        '''Return cached value for key, or default if missing or expired'''
+        with self._lock:
+            return self._get(key, default, time.monotonic())
+
+    def get_many(self, keys):
+        '''Return dict of the keys that are cached. Missing/expired keys are left out.'''
+        found = {}
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                value = self._get(key, None, now)
+                if value is not None:
+                    found[key] = value
+        return found
+
+    def _get(self, key, default, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[1] <= now:
+            self._remove(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def set(self, key, value, ttl=None):
+        '''Cache value under key, evicting least recently used entries to stay within budget'''
+        size = self.sizeof(value) if self.max_bytes else 0
+        # A single value larger than the whole budget would just evict everything else
+        if self.max_bytes and size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, expires_at, size)
+            self._bytes += size
+            self._evict()
+
+    def set_many(self, items, ttl=None):
+        '''Cache every (key, value) pair in items'''
+        for key, value in items:
+            self.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        value, expires_at, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes)):
+            key, (value, expires_at, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def stats(self):
+        '''Counters used to size the cache'''
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
+
+
+# Recipe information keyed by recipe id. Recipe content rarely changes, so a long TTL is safe.
+recipe_cache = TTLCache(ttl=RECIPE_CACHE_TTL, max_entries=RECIPE_CACHE_MAX_ENTRIES, max_bytes=RECIPE_CACHE_MAX_BYTES)
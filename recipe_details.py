@@ -0,0 +1,75 @@
+# Description: Rendered recipe details. The part of /recipes/<id>/details that only depends on the recipe is rendered
+# once from recipes/details_fragment.html and cached per recipe id and template version.
+import os
+import re
+import hashlib
+from datetime import datetime, timezone
+from flask import current_app, render_template
+from recipe_cache import TTLCache
+
+DETAILS_CACHE_TTL = int(os.environ.get('DETAILS_CACHE_TTL', 24 * 60 * 60))
+DETAILS_CACHE_MAX_ENTRIES = int(os.environ.get('DETAILS_CACHE_MAX_ENTRIES', 2000))
+FRAGMENT_TEMPLATE = 'recipes/details_fragment.html'
+
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+
+def strip_tags(html):
+    '''Remove HTML tags Spoonacular puts in summaries and instructions'''
+    return TAG_PATTERN.sub('', html or '')
+
+
+def instruction_steps(instructions):
+    '''Split cleaned instructions into one step per sentence'''
+    return [sentence.strip() for sentence in strip_tags(instructions).split('.') if sentence.strip()]
+
+
+def template_version(*names):
+    '''Short digest of the templates' source, so changing a template on deploy invalidates what was rendered from it'''
+    env = current_app.jinja_env
+    digest = hashlib.sha1()
+    for name in names:
+        digest.update(env.loader.get_source(env, name)[0].encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class RecipeDetails:
+    '''Caches rendered details fragments. Entries are {'html', 'digest', 'last_modified'}.'''
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._version = None
+        self._page_version = None
+
+    def version(self):
+        # Templates only change on deploy, so the digest is computed once per process
+        if self._version is None:
+            self._version = template_version(FRAGMENT_TEMPLATE)
+        return self._version
+
+    def cached(self, recipe_id):
+        '''Return the cached fragment for a recipe, or None if it has to be rendered'''
+        return self.cache.get((recipe_id, self.version()))
+
+    def page_version(self):
+        '''Version of the templates wrapped around the fragment for the full page'''
+        if self._page_version is None:
+            self._page_version = template_version('recipes/details.html', 'base.html')
+        return self._page_version
+
+    def render(self, recipe_id, recipe):
+        '''Render and cache the fragment for a recipe from its /information JSON'''
+        html = render_template(FRAGMENT_TEMPLATE, title=recipe.get('title'), prep_time=recipe.get('readyInMinutes'),
+                               steps=instruction_steps(recipe.get('instructions')), summary=strip_tags(recipe.get('summary')),
+                               image=recipe.get('image'), source_url=recipe.get('sourceUrl'))
+        fragment = {
+            'html': html,
+            'digest': hashlib.sha1(html.encode('utf-8')).hexdigest(),
+            # HTTP dates have second precision
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0)
+        }
+        self.cache.set((recipe_id, self.version()), fragment)
+        return fragment
+
+
+recipe_details = RecipeDetails(TTLCache(ttl=DETAILS_CACHE_TTL, max_entries=DETAILS_CACHE_MAX_ENTRIES))
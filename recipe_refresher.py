@@ -0,0 +1,159 @@
+# Description: Background refresh of stored recipe snapshots. Lookups count how often each recipe is asked for and
+# hand over stored recipes that were served stale; a worker thread re-fetches those, plus popular recipes that are
+# about to go stale, in informationBulk batches with the most requested recipes first.
+import os
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import timedelta
+import requests
+from food_models import SNAPSHOT_MAX_AGE
+from spoonacular_client import spoonacular
+
+RECIPE_REFRESH_INTERVAL = float(os.environ.get('RECIPE_REFRESH_INTERVAL', 30))
+# One informationBulk call per round, made smaller when the guard has fewer points to spare
+RECIPE_REFRESH_BATCH_SIZE = int(os.environ.get('RECIPE_REFRESH_BATCH_SIZE', 100))
+# Points a round leaves in the guard's rate limiter and daily budget, so refreshing never makes requests wait or fail
+RECIPE_REFRESH_RESERVE = float(os.environ.get('RECIPE_REFRESH_RESERVE', 10))
+# Popular recipes are refreshed this long before their snapshots reach SNAPSHOT_MAX_AGE
+RECIPE_REFRESH_AHEAD = timedelta(seconds=int(os.environ.get('RECIPE_REFRESH_AHEAD', 24 * 60 * 60)))
+# How many of the most requested recipes are checked for an upcoming refresh each round
+RECIPE_REFRESH_HOT = int(os.environ.get('RECIPE_REFRESH_HOT', 1000))
+# Request counts halve over this many seconds, so popularity follows what users ask for now
+RECIPE_REFRESH_HALF_LIFE = float(os.environ.get('RECIPE_REFRESH_HALF_LIFE', 60 * 60))
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeRefresher:
+    '''Owns the refresh worker thread for one process'''
+
+    def __init__(self, client, interval=RECIPE_REFRESH_INTERVAL, batch_size=RECIPE_REFRESH_BATCH_SIZE,
+                 reserve=RECIPE_REFRESH_RESERVE, ahead=RECIPE_REFRESH_AHEAD, hot=RECIPE_REFRESH_HOT,
+                 half_life=RECIPE_REFRESH_HALF_LIFE):
+        self.client = client
+        self.interval = interval
+        self.batch_size = batch_size
+        self.reserve = reserve
+        self.ahead = ahead
+        self.hot = hot
+        self.half_life = half_life
+        self.app = None
+        self._hits = Counter()
+        self._queued = set()
+        self._last_decay = time.monotonic()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+
+    def init_app(self, app):
+        '''Attach to the Flask app. The worker starts with the first request so it is never forked by a preloading server.
+        Only while the refresher is enabled does the client serve stale recipes, since nothing else would refresh them.'''
+        self.app = app
+        enabled = app.config.get('RECIPE_REFRESHER', True)
+        self.client.refresher = self if enabled else None
+        if enabled:
+            app.before_request(self.start)
+
+    def start(self):
+        '''Start the worker thread if this process doesn't have one yet'''
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='recipe-refresher', daemon=True)
+                self._thread.start()
+
+    def touch(self, recipe_ids):
+        '''Count requests for recipes'''
+        with self._lock:
+            self._hits.update(recipe_ids)
+
+    def request(self, recipe_ids):
+        '''Queue recipes that were served stale. A full batch wakes the worker straight away.'''
+        if not recipe_ids:
+            return
+        with self._lock:
+            self._queued.update(recipe_ids)
+            full = len(self._queued) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    self.refresh_batch()
+            except Exception:
+                logger.exception('Recipe refresher failed')
+
+    def _decay(self):
+        '''Scale request counts down by the time passed since the last round. Call with the lock held.'''
+        now = time.monotonic()
+        factor = 0.5 ** ((now - self._last_decay) / self.half_life)
+        self._last_decay = now
+        for recipe_id, count in list(self._hits.items()):
+            if count * factor < 0.01:
+                del self._hits[recipe_id]
+            else:
+                self._hits[recipe_id] = count * factor
+
+    def batch_limit(self):
+        '''How many recipes this round can refresh: at most batch_size, and no more than one informationBulk call can
+        fetch with the guard's spare points minus the reserve. 0 means skip the round.'''
+        guard = self.client.guard
+        if guard is None:
+            return self.batch_size
+        points = guard.spare_points() - self.reserve
+        if points < 1:
+            return 0
+        # informationBulk costs 1 point plus 0.5 for every recipe after the first
+        if points >= 1 + 0.5 * (self.batch_size - 1):
+            return self.batch_size
+        return int((points - 1) / 0.5) + 1
+
+    def next_batch(self, limit=None):
+        '''Up to limit (default batch_size) ids that are stale or about to be, most requested first.
+        Queued ids that don't fit wait for the next round.'''
+        limit = self.batch_size if limit is None else limit
+        with self._lock:
+            self._decay()
+            candidates = self._queued | {recipe_id for recipe_id, _ in self._hits.most_common(self.hot)}
+            self._queued = set()
+            hits = dict(self._hits)
+        if not candidates:
+            return []
+
+        # Checked against the store, so a recipe another worker has just refreshed is skipped
+        due = sorted(self.client.store.stale_ids(candidates, SNAPSHOT_MAX_AGE - self.ahead), key=lambda id: -hits.get(id, 0))
+        if len(due) > limit:
+            with self._lock:
+                self._queued.update(due[limit:])
+        return due[:limit]
+
+    def refresh_batch(self):
+        '''Refresh one batch. Returns the ids that were fetched.'''
+        limit = self.batch_limit()
+        if not limit:
+            return []
+        batch = self.next_batch(limit)
+        if not batch:
+            return []
+        try:
+            self.client.refresh(batch)
+        except requests.exceptions.RequestException:
+            # Spoonacular is unavailable or refused by the guard; the stale copies keep being served until a later round
+            logger.warning('Could not refresh %d recipes', len(batch))
+            with self._lock:
+                self._queued.update(batch)
+            return []
+        return batch
+
+
+recipe_refresher = RecipeRefresher(spoonacular)
@@ -1,12 +1,9 @@
-from flask import g, flash, redirect
 from functools import wraps
-from flask import Blueprint, Flask, render_template, jsonify, request, flash, redirect, session, g, url_for
-from food_models import Recipe, Favorites
-from forms import UserEditForm, UserAddForm, LoginForm
+import inspect
+from flask import Blueprint, render_template, flash, redirect, session, g, url_for
+from forms import UserAddForm, LoginForm
 from db_init import db
 from user_model import User
-import requests
-import os
 from sqlalchemy.exc import IntegrityError
 
 auth_bp = Blueprint('auth', __name__, template_folder='templates')
@@ -15,6 +12,16 @@ CURR_USER_KEY = "curr_user"
 
 # Decorator to require login for certain routes
 def login_required(f):
+    # Async views need an async wrapper, otherwise Flask would treat the returned coroutine as the response
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            if not g.user:
+                flash("Please login first", "danger")
+                return redirect("/login")
+            return await f(*args, **kwargs)
+        return decorated_coroutine
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if not g.user:
@@ -23,6 +30,13 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# Decorator to declare how g.user should be loaded for a view, e.g. eager loading relationships it will serialize
+def user_load_options(*options):
+    def decorator(f):
+        f.user_load_options = options
+        return f
+    return decorator
+
 # Login and Logout Functions to update session
 def do_login(user):
     '''Log in user.'''
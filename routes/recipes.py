@@ -1,77 +1,117 @@
-from flask import g, flash, redirect
-from flask import Blueprint, Flask, render_template, jsonify, request, flash, redirect, session, g
-from food_models import Recipe, Favorites
-from forms import UserEditForm, UserAddForm, LoginForm
-from db_init import db
-from user_model import User
+from flask import Blueprint, render_template, make_response, jsonify, request, flash, redirect, session, g
+from sqlalchemy.orm import joinedload
 import requests
-import os
-from sqlalchemy.exc import IntegrityError
-from model_logic import set_allergies
-import re
+from spoonacular_client import spoonacular
+from user_model import User
+from routes.auth import user_load_options
+from random_pool import random_pool, top_up
+from recipe_cache import recipe_cache
+from ingredient_index import ingredient_index
+from food_models import RecipeSnapshot
+from recipe_details import recipe_details
+from projection import requested_fields, project, project_many, ALL_FIELDS
+from http_cache import make_etag, not_modified, not_modified_response, with_validators, json_response
 
 recipes_bp = Blueprint('recipes', __name__, template_folder='templates')
 
-API_KEY = os.environ.get('API_KEY')
+SEARCH_PAGE_SIZE = 8
+MAX_SEARCH_PAGE_SIZE = 100
+
+
+def split_ingredients(ingredients):
+    '''Turn the comma separated ingredient param into a list. The frontend sends "null" when a field is empty.'''
+    return [name for name in ingredients.split(',') if name.strip() and name.strip() not in ('null', 'undefined')]
 
 @recipes_bp.route('/random')
-def get_random_recipes():
-    # Get 16 random recipes
+@user_load_options(joinedload(User.allergies))
+async def get_random_recipes():
+    # Get 16 random recipes, sampled from the pre-fetched pool to fit the user's diet and allergies
 
-    try:
-        resp = requests.get('https://api.spoonacular.com/recipes/random', params={'apiKey': API_KEY, 'number': 16})
-        return jsonify(resp.json())
-    except requests.exceptions.RequestException as e:
-        return jsonify({"Error": "Could not get recipes"}), 500
+    fields = requested_fields()
+    diet, allergies = (g.user.diet, [allergy.id for allergy in g.user.allergies]) if g.user else (None, ())
+    recipes = random_pool.sample(16, diet, allergies)
+    if len(recipes) < 16:
+        # Few pooled recipes fit a less common diet, so fill up with allergy-free recipes of any diet
+        recipes = top_up(recipes, random_pool.sample(16, None, allergies), 16)
+    if len(recipes) < 16:
+        # The pool is still filling
+        try:
+            response = await spoonacular.async_random(number=16)
+            recipes = top_up(recipes, response.get('recipes', []), 16, allergies)
+        except requests.exceptions.RequestException as e:
+            if not recipes:
+                return jsonify({"Error": "Could not get recipes"}), 500
+    return jsonify({'recipes': project_many(recipes, fields)})
 
 
 @recipes_bp.route('/complexSearch')
-def get_specific_recipes():
+async def get_specific_recipes():
     # Get recipes based on user's search parameters
 
     include_ingredients = request.args['includeIngredients']
     exclude_ingredients = request.args['excludeIngredients']
     diet = request.args['diet']
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    number = min(max(request.args.get('number', SEARCH_PAGE_SIZE, type=int), 1), MAX_SEARCH_PAGE_SIZE)
+
+    # Answer from recipes we already have locally, and only ask Spoonacular when they can't fill the page
+    ingredient_index.ensure_loaded(RecipeSnapshot.iter_recipes)
+    results, total = ingredient_index.search(split_ingredients(include_ingredients), split_ingredients(exclude_ingredients),
+                                             diet, offset=offset, number=number)
+    if len(results) == number:
+        return jsonify({'results': results, 'offset': offset, 'number': number, 'totalResults': total})
     try:
-        resp = requests.get('https://api.spoonacular.com/recipes/complexSearch', params={'apiKey': API_KEY, 'includeIngredients': include_ingredients, 
-                                                                                'excludeIngredients': exclude_ingredients, 'diet': diet, 'number': 8})
-        return jsonify(resp.json())
+        return jsonify(await spoonacular.async_complex_search(include_ingredients, exclude_ingredients, diet, number=number, offset=offset))
     except requests.exceptions.RequestException as e:
+        # Spoonacular is down or out of quota: a short page of local matches beats an error
+        if results:
+            return jsonify({'results': results, 'offset': offset, 'number': number, 'totalResults': total})
         return jsonify({"Error": "Could not get recipes"}), 500
 
 @recipes_bp.route('/<int:recipe_id>/information')
-def get_recipe_info(recipe_id):
+async def get_recipe_info(recipe_id):
     # Get detailed information about a specific recipe
     try:
-        resp = requests.get(f'https://api.spoonacular.com/recipes/{recipe_id}/information', params={'apiKey': API_KEY})
-        return jsonify(resp.json())
+        # Recipe data is the same for everyone, so shared caches may keep it; the ETag is a hash of the content
+        return json_response(project(await spoonacular.async_information(recipe_id), requested_fields(ALL_FIELDS)), private=False)
     except requests.exceptions.RequestException as e:
         return jsonify({"Error": "Could not get recipe info"}), 500
 
 @recipes_bp.route('/info', methods=['POST'])
-def get_bulk_recipe_info():
+async def get_bulk_recipe_info():
     # Get detailed information about multiple recipes
 
-    recipe_ids = ','.join(str(id) for id in request.json.get('ids', []))
+    recipe_ids = request.json.get('ids', [])
+    fields = requested_fields()
     try:
-        resp = requests.get('https://api.spoonacular.com/recipes/informationBulk', params={'apiKey': API_KEY, 'ids': recipe_ids})
-        return jsonify(resp.json())
+        return jsonify(project_many(await spoonacular.async_information_bulk(recipe_ids), fields))
     except requests.exceptions.RequestException as e:
         return jsonify({"Error": "Could not get recipes info"}), 500
 
 @recipes_bp.route('/<int:recipe_id>/details')
-def show_recipe_details(recipe_id):
+async def show_recipe_details(recipe_id):
     # Shows details about recipe (instructions, summary, video, etc.)
     
-    try:
-        resp = requests.get(f'https://api.spoonacular.com/recipes/{recipe_id}/information', params={'apiKey': API_KEY})
-        results = resp.json()
-        title, prep_time, instructions, summary, image, source_url = results['title'], results['readyInMinutes'], results['instructions'], results['summary'], results['image'], results['sourceUrl']
-        clean_summary = re.sub('<[^>]+>', '', summary)
-        clean_instructions = re.sub('<[^>]+>', '', instructions)
-
-        return render_template('recipes/details.html', title=title, prep_time=prep_time, instructions=clean_instructions,
-                                summary=clean_summary, image=image, source_url=source_url)
-    except requests.exceptions.RequestException as e:
-        flash('Could not get recipe details', 'danger')
-        return redirect('/')
\ No newline at end of file
+    # The recipe part of the page is rendered once per recipe; a cached fragment needs neither a fetch nor a render
+    fragment = recipe_details.cached(recipe_id)
+    if fragment is None:
+        try:
+            fragment = recipe_details.render(recipe_id, await spoonacular.async_information(recipe_id))
+        except requests.exceptions.RequestException as e:
+            flash('Could not get recipe details', 'danger')
+            return redirect('/')
+
+    # The navbar shows the logged in user, so they are part of the page version too
+    nav = (g.user.id, g.user.username, g.user.image_url) if g.user else ()
+    etag = make_etag(fragment['digest'], recipe_details.page_version(), *nav)
+    # Pending flash messages are only shown by a full render
+    if '_flashes' not in session and not_modified(etag, fragment['last_modified']):
+        return not_modified_response(etag, fragment['last_modified'], private=bool(g.user))
+
+    response = make_response(render_template('recipes/details.html', fragment=fragment['html']))
+    return with_validators(response, etag, fragment['last_modified'], private=bool(g.user))
+
+@recipes_bp.route('/cache')
+def get_cache_stats():
+    # Hit/miss/eviction counters for the recipe information cache, used to size it
+    return jsonify(recipe_cache.stats())
\ No newline at end of file
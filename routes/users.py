@@ -1,36 +1,72 @@
-from flask import Blueprint, Flask, render_template, jsonify, request, flash, redirect, session, g, url_for
-from food_models import Recipe, Favorites
+from flask import Blueprint, render_template, jsonify, request, flash, redirect, g, url_for
+from food_models import Recipe, Favorites, RecipeSnapshot
 from forms import UserEditForm
 from db_init import db
 from user_model import User
 import requests
-import os
-from routes.auth import login_required
+from routes.auth import login_required, user_load_options
+from projection import requested_fields, project_many
+from http_cache import make_etag, not_modified, not_modified_response, json_response
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 from model_logic import set_allergies
-
-API_KEY = os.environ.get('API_KEY')
+from spoonacular_client import spoonacular
+from shopping_list import shopping_lists, EMPTY_SHOPPING_LIST
 
 
 users_bp = Blueprint('users', __name__, template_folder='templates')
 
 @users_bp.route('/current')
+@user_load_options(*User.serialize_options())
 def get_current_user():
     if g.user:
-        return jsonify(g.user.serialize()), 200
+        return json_response(g.user.serialize())
     return jsonify(None), 404
 
+@users_bp.route('/bootstrap')
+async def get_bootstrap():
+    # Everything the frontend needs on page load in one response: current user, favorite and cart ids, and favorite recipe cards.
+    # Costs one query for the favorites rows and one informationBulk call (none when the recipes are cached).
+
+    if not g.user:
+        return jsonify(None), 404
+    fields = requested_fields()
+    favorites = db.session.execute(select(Favorites.recipe_id, Favorites.in_shopping_cart)
+                                   .where(Favorites.user_id == g.user.id).order_by(Favorites.id)).all()
+    favorite_ids = [recipe_id for recipe_id, in_shopping_cart in favorites]
+    cart_ids = [recipe_id for recipe_id, in_shopping_cart in favorites if in_shopping_cart]
+    try:
+        recipes = await spoonacular.async_information_bulk(favorite_ids)
+    except requests.exceptions.RequestException as e:
+        # Still return the ids so favorite and cart buttons work; the favorites page will show no cards
+        recipes = []
+    return jsonify({
+        'user': {**g.user.serialize_profile(), 'recipes': favorite_ids},
+        'favorite_ids': favorite_ids,
+        'cart_ids': cart_ids,
+        'recipes': project_many(recipes, fields)
+    })
+
 @users_bp.route('/<user_id>/recipes')
-def get_saved_recipes(user_id):
+async def get_saved_recipes(user_id):
     # Get all saved recipes for a user as well as detailed information about each recipe
 
     user = User.query.get_or_404(user_id)
-    recipes = ','.join(str(recipe.id) for recipe in user.recipes)
-    try:  
-        resp = requests.get('https://api.spoonacular.com/recipes/informationBulk', params={'apiKey': API_KEY, 'ids': recipes})
-        return jsonify(resp.json())
+    recipe_ids = [recipe.id for recipe in user.recipes]
+    fields = requested_fields()
+    # Stored recipes are refreshed in the background, so the newest snapshot's fetch time is part of the version along with
+    # the favorites and fields. That is one indexed query, and a 304 skips the bulk call.
+    etag = make_etag('recipes', fields, RecipeSnapshot.version(recipe_ids), *recipe_ids)
+    if not_modified(etag):
+        return not_modified_response(etag)
+    try:
+        recipes = await spoonacular.async_information_bulk(recipe_ids)
     except requests.exceptions.RequestException as e:
         return jsonify({"Error": "Could not get recipes"}), 500
+    # Recipes Spoonacular couldn't return are left out; a partial list gets no ETag so it is never revalidated as complete
+    if len(recipes) != len(recipe_ids):
+        return jsonify(project_many(recipes, fields))
+    return json_response(project_many(recipes, fields), etag=etag)
 
 @users_bp.route('/<user_id>/recipes', methods=['DELETE'])
 def delete_saved_recipe(user_id):
@@ -53,8 +89,10 @@ def save_recipe(user_id):
     recipe = Recipe.query.get(recipe_id)
     if not recipe:
         recipe = Recipe(id=recipe_id)
-    user.recipes.append(recipe)
-    db.session.commit()
+    # (user_id, recipe_id) is unique, so saving twice is a no-op instead of an IntegrityError
+    if recipe not in user.recipes:
+        user.recipes.append(recipe)
+        db.session.commit()
     return jsonify({"Result": "Saved"})
 
 @users_bp.route('/<user_id>/cart', methods=['PATCH'])
@@ -77,7 +115,7 @@ def get_shopping_cart(user_id):
     user = User.query.get_or_404(user_id)
     shopping_cart = Favorites.query.filter(Favorites.user_id==user.id, Favorites.in_shopping_cart==True).all()
     recipe_ids = [recipe.recipe_id for recipe in shopping_cart]
-    return jsonify(recipe_ids)
+    return json_response(recipe_ids)
 
 @users_bp.route('/details')
 @login_required
@@ -92,7 +130,7 @@ def edit_user():
 
     form = UserEditForm(obj=g.user)
     if form.validate_on_submit():
-        if User.authenticate(g.user.username, form.password.data):
+        if g.user.check_password(form.password.data):
             try: 
                 # Update user details or keep the same if no input
                 g.user.username = form.username.data or g.user.username
@@ -102,6 +140,7 @@ def edit_user():
                 allergies = form.dietary_restrictions.data
                 set_allergies(allergies, g.user)
                 db.session.commit()
+                User.forget(g.user.id)
                 return redirect(url_for('users.get_user_details'))
             except IntegrityError:
                 db.session.rollback()
@@ -113,16 +152,16 @@ def edit_user():
 
 @users_bp.route('/shopping_cart')
 @login_required
-def show_shopping_cart():
+async def show_shopping_cart():
     '''Show user's shopping cart'''
 
     shopping_cart = Favorites.query.filter(Favorites.user_id==g.user.id, Favorites.in_shopping_cart==True).all()
     recipe_ids = [recipe.recipe_id for recipe in shopping_cart]
-    recipe_ids = ','.join(str(id) for id in recipe_ids)
     try:
-        resp = requests.get('https://api.spoonacular.com/recipes/informationBulk', params={'apiKey': API_KEY, 'ids': recipe_ids})
-        recipes = resp.json()
-        return render_template('users/shopping_cart.html', recipes=recipes)
+        shopping_list = shopping_lists.cached(recipe_ids)
+        if shopping_list is None:
+            shopping_list = shopping_lists.build(recipe_ids, await spoonacular.async_information_bulk(shopping_lists.version(recipe_ids)))
+        return render_template('users/shopping_cart.html', shopping_list=shopping_list)
     except requests.exceptions.RequestException as e:
         flash('Could not get recipes', 'danger')
-        return render_template('users/shopping_cart.html', recipes=[])
\ No newline at end of file
+        return render_template('users/shopping_cart.html', shopping_list=EMPTY_SHOPPING_LIST)
\ No newline at end of file
@@ -1,14 +1,17 @@
-from app import app
-from food_models import Recipe, Favorites, Allergy, Ingredient
-from db_init import db
-from user_model import User
+# Guarded so the password hashing pool, which re-imports the main script in its workers, doesn't seed again
+if __name__ == '__main__':
+    from app import app
+    from food_models import Recipe, Favorites, Allergy, Ingredient
+    from db_init import db
+    from user_model import User
 
-db.drop_all()
-db.create_all()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
 
-user1 = User.register(email='example@example.com', username='example_user', password='password', 
-        diet='vegan', image_url='https://tinyurl.com/29q8o28r', allergies='peanuts')
+        user1 = User.register(email='example@example.com', username='example_user', password='password', 
+                diet='vegan', image_url='https://tinyurl.com/29q8o28r', allergies='peanuts')
 
 
-db.session.add(user1)
-db.session.commit()
\ No newline at end of file
+        db.session.add(user1)
+        db.session.commit()
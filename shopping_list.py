@@ -0,0 +1,174 @@
+# Description: Builds a shopping list from recipes in a cart by merging repeated ingredients and summing their amounts.
+import os
+from collections import defaultdict
+from ingredient_index import singular, WORD_PATTERN
+from recipe_cache import TTLCache
+
+SHOPPING_LIST_CACHE_TTL = int(os.environ.get('SHOPPING_LIST_CACHE_TTL', 60 * 60))
+
+# Conversion factors to the canonical unit of each dimension (millilitres for volume, grams for mass)
+VOLUME_UNITS = {
+    'ml': 1, 'milliliter': 1, 'millilitre': 1, 'l': 1000, 'liter': 1000, 'litre': 1000,
+    'tsp': 4.92892, 'teaspoon': 4.92892, 't': 4.92892,
+    'tbsp': 14.7868, 'tablespoon': 14.7868, 'tbs': 14.7868, 'tb': 14.7868,
+    'cup': 236.588, 'c': 236.588, 'fl oz': 29.5735, 'fluid ounce': 29.5735,
+    'pint': 473.176, 'pt': 473.176, 'quart': 946.353, 'qt': 946.353, 'gallon': 3785.41, 'gal': 3785.41,
+    'dash': 0.616, 'pinch': 0.308
+}
+MASS_UNITS = {
+    'g': 1, 'gram': 1, 'gr': 1, 'kg': 1000, 'kilogram': 1000,
+    'oz': 28.3495, 'ounce': 28.3495, 'lb': 453.592, 'pound': 453.592
+}
+METRIC_UNITS = {'ml', 'milliliter', 'millilitre', 'l', 'liter', 'litre', 'g', 'gram', 'gr', 'kg', 'kilogram'}
+
+# Units Spoonacular gives counted ingredients that describe the item rather than count it ("2 large eggs")
+SIZE_UNITS = {'', 'small', 'medium', 'large', 'extra large', 'whole'}
+
+EMPTY_SHOPPING_LIST = {'recipes': [], 'aisles': []}
+
+
+def normalize_unit(unit):
+    '''Lowercase, strip periods and plurals so "Tbsps." and "tablespoons" both become one unit'''
+    # Recipes use a capital T for tablespoon and lowercase t for teaspoon, so decide that before lowercasing
+    if unit == 'T':
+        return 'tbsp'
+    unit = unit.strip().lower().replace('.', '')
+    if unit in VOLUME_UNITS or unit in MASS_UNITS:
+        return unit
+    if unit.endswith('es') and unit[:-2] in VOLUME_UNITS:
+        return unit[:-2]
+    if unit.endswith('s') and (unit[:-1] in VOLUME_UNITS or unit[:-1] in MASS_UNITS):
+        return unit[:-1]
+    return singular(unit)
+
+
+def normalize_name(name):
+    '''Lowercase and singularize each word of an ingredient name'''
+    return ' '.join(singular(word) for word in WORD_PATTERN.findall(name.lower()))
+
+
+def pluralize(word):
+    '''Rough inverse of singular for display: "clove" -> "cloves", "berry" -> "berries". Plural words are left alone.'''
+    if not word or singular(word) != word:
+        return word
+    if word.endswith('y') and len(word) > 2 and word[-2] not in 'aeiou':
+        return word[:-1] + 'ies'
+    if word.endswith(('s', 'x', 'ch', 'sh', 'o')):
+        return word + 'es'
+    return word + 's'
+
+
+def display_count(name, unit, amount):
+    '''Name and unit of a counted ingredient, plural when there is more than one: "3 cloves garlic", "2 large eggs"'''
+    if amount <= 1:
+        return name, unit
+    if unit in SIZE_UNITS:
+        words = name.rsplit(' ', 1)
+        return ' '.join(words[:-1] + [pluralize(words[-1])]), unit
+    return name, pluralize(unit)
+
+
+def format_amount(amount):
+    '''Round to two decimals and drop trailing zeros'''
+    return f'{amount:.2f}'.rstrip('0').rstrip('.')
+
+
+def display_volume(ml, metric):
+    '''Pick a readable unit for a summed volume'''
+    if metric:
+        return (ml / 1000, 'l') if ml >= 1000 else (ml, 'ml')
+    if ml >= VOLUME_UNITS['cup'] / 4:
+        return ml / VOLUME_UNITS['cup'], 'cups'
+    if ml >= VOLUME_UNITS['tbsp']:
+        return ml / VOLUME_UNITS['tbsp'], 'Tbsp'
+    return ml / VOLUME_UNITS['tsp'], 'tsp'
+
+
+def display_mass(grams, metric):
+    '''Pick a readable unit for a summed mass'''
+    if metric:
+        return (grams / 1000, 'kg') if grams >= 1000 else (grams, 'g')
+    if grams >= MASS_UNITS['lb']:
+        return grams / MASS_UNITS['lb'], 'lb'
+    return grams / MASS_UNITS['oz'], 'oz'
+
+
+def aggregate_ingredients(recipes):
+    '''Merge every extendedIngredient across recipes. Amounts of the same ingredient are summed after converting
+    to a canonical unit; amounts that can't be converted into each other (e.g. cups vs grams) stay separate lines.
+    Returns a list of {'aisle', 'ingredients'} groups sorted by aisle, each ingredient {'name', 'amount', 'unit', 'text'}.'''
+    # (aisle, name, dimension) -> [total, metric?]; dimension is 'volume', 'mass' or the unit itself for counts
+    totals = {}
+    for recipe in recipes:
+        for ingredient in recipe.get('extendedIngredients') or []:
+            # The normalized name only groups lines; the first spelling seen is what gets displayed
+            display_name = ' '.join((ingredient.get('nameClean') or ingredient.get('name') or '').split())
+            name = normalize_name(display_name)
+            if not name:
+                continue
+            aisle = (ingredient.get('aisle') or 'Other').split(';')[0]
+            amount = ingredient.get('amount') or 0
+            unit = normalize_unit(ingredient.get('unit') or '')
+
+            if unit in VOLUME_UNITS:
+                key, amount = (aisle, name, 'volume'), amount * VOLUME_UNITS[unit]
+            elif unit in MASS_UNITS:
+                key, amount = (aisle, name, 'mass'), amount * MASS_UNITS[unit]
+            else:
+                key = (aisle, name, unit)
+
+            if key not in totals:
+                # The first recipe to use an ingredient decides whether it is displayed in metric or US units
+                totals[key] = [0, unit in METRIC_UNITS, display_name]
+            totals[key][0] += amount
+
+    aisles = defaultdict(list)
+    for (aisle, _, dimension), (total, metric, name) in totals.items():
+        if dimension == 'volume':
+            amount, unit = display_volume(total, metric)
+        elif dimension == 'mass':
+            amount, unit = display_mass(total, metric)
+        else:
+            amount = total
+            name, unit = display_count(name, dimension, total)
+        text = ' '.join(part for part in (format_amount(amount) if amount else '', unit, name) if part)
+        aisles[aisle].append({'name': name, 'amount': round(amount, 2), 'unit': unit, 'text': text})
+
+    return [{'aisle': aisle, 'ingredients': sorted(ingredients, key=lambda item: item['name'])}
+            for aisle, ingredients in sorted(aisles.items())]
+
+
+class ShoppingListBuilder:
+    '''Caches the aggregated shopping list per cart version. Recipe content doesn't change,
+    so the sorted set of recipe ids in the cart identifies a version.'''
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def version(self, recipe_ids):
+        return tuple(sorted(set(recipe_ids)))
+
+    def cached(self, recipe_ids):
+        '''Return the cached shopping list for a cart, or None if it has to be built'''
+        if not recipe_ids:
+            return EMPTY_SHOPPING_LIST
+        return self.cache.get(self.version(recipe_ids))
+
+    def build(self, recipe_ids, recipes):
+        '''Aggregate the shopping list for a cart from its recipes. It is only cached when every recipe in the cart
+        was loaded, so a list missing recipes Spoonacular couldn't return is built again next time.'''
+        shopping_list = {'recipes': [recipe['title'] for recipe in recipes], 'aisles': aggregate_ingredients(recipes)}
+        version = self.version(recipe_ids)
+        if set(version) <= {recipe['id'] for recipe in recipes}:
+            self.cache.set(version, shopping_list)
+        return shopping_list
+
+    def get(self, recipe_ids, load_recipes):
+        '''Return {'recipes': [titles], 'aisles': [...]} for a cart. load_recipes(recipe_ids) is only called on a cache miss.'''
+        shopping_list = self.cached(recipe_ids)
+        if shopping_list is None:
+            shopping_list = self.build(recipe_ids, load_recipes(list(self.version(recipe_ids))))
+        return shopping_list
+
+
+shopping_lists = ShoppingListBuilder(TTLCache(ttl=SHOPPING_LIST_CACHE_TTL, max_entries=1000))
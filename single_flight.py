@@ -0,0 +1,134 @@
+# Description: In-flight request deduplication. Concurrent callers asking for the same key share one call.
+import asyncio
+import threading
+
+
+class _Call:
+    '''One outstanding call that other threads can wait on'''
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    async def async_wait(self):
+        '''Wait without blocking the caller's event loop; the leader may be a thread or another loop'''
+        if not self.event.is_set():
+            await asyncio.to_thread(self.event.wait)
+        return self.wait()
+
+
+class SingleFlight:
+    '''Coalesces concurrent calls by key. The first caller for a key runs the call, later callers wait for its result.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self):
+        return len(self._calls)
+
+    def do(self, key, fn):
+        '''Run fn() unless a call for key is already in flight, in which case wait for that call's result'''
+        claimed, waiting = self._claim([key])
+        if waiting:
+            return waiting[key].wait()
+
+        # BaseException too: a leader that is cancelled or interrupted must still release its keys, or every later
+        # caller for them would wait forever
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._fail(claimed, e)
+            raise
+        self._finish(claimed, {key: result})
+        return result
+
+    async def async_do(self, key, fn):
+        '''Same as do for a coroutine function fn'''
+        claimed, waiting = self._claim([key])
+        if waiting:
+            return await waiting[key].async_wait()
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._fail(claimed, e)
+            raise
+        self._finish(claimed, {key: result})
+        return result
+
+    def do_many(self, keys, fetch):
+        '''Resolve several keys at once. fetch(claimed_keys) is called with only the keys no other thread is fetching,
+        and must return a dict of key -> result. Returns a dict of every key that resolved to a result.'''
+        claimed, waiting = self._claim(keys)
+        results = {}
+        if claimed:
+            try:
+                results = fetch(list(claimed))
+            except BaseException as e:
+                self._fail(claimed, e)
+                raise
+            self._finish(claimed, results)
+
+        for key, call in waiting.items():
+            result = call.wait()
+            if result is not None:
+                results[key] = result
+        return results
+
+    async def async_do_many(self, keys, fetch):
+        '''Same as do_many for coroutines: fetch(claimed_keys) is awaited and waiting never blocks the event loop.
+        Sync and async callers coalesce with each other.'''
+        claimed, waiting = self._claim(keys)
+        results = {}
+        if claimed:
+            try:
+                results = await fetch(list(claimed))
+            except BaseException as e:
+                self._fail(claimed, e)
+                raise
+            self._finish(claimed, results)
+
+        for key, call in waiting.items():
+            result = await call.async_wait()
+            if result is not None:
+                results[key] = result
+        return results
+
+    def _claim(self, keys):
+        '''Split keys into calls this caller now leads and calls already led by someone else'''
+        claimed, waiting = {}, {}
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                call = self._calls.get(key)
+                if call is None:
+                    claimed[key] = self._calls[key] = _Call()
+                else:
+                    waiting[key] = call
+        return claimed, waiting
+
+    def _finish(self, claimed, results):
+        for key, call in claimed.items():
+            call.result = results.get(key)
+        self._release(claimed)
+
+    def _fail(self, claimed, error):
+        for call in claimed.values():
+            call.error = error
+        self._release(claimed)
+
+    def _release(self, calls):
+        '''Remove finished calls so the next caller starts a fresh one, then wake up waiters'''
+        with self._lock:
+            for key in calls:
+                self._calls.pop(key, None)
+        for call in calls.values():
+            call.event.set()
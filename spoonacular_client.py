@@ -0,0 +1,313 @@
+# Description: Shared client for the Spoonacular API. Owns one pooled HTTP session so routes reuse connections.
+import os
+import time
+import threading
+from contextlib import nullcontext
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from recipe_cache import recipe_cache
+from single_flight import SingleFlight
+from ingredient_index import ingredient_index
+from async_transport import AsyncTransport
+from metrics import observe_upstream
+from upstream_guard import UpstreamGuard
+
+BASE_URL = os.environ.get('SPOONACULAR_BASE_URL', 'https://api.spoonacular.com')
+CONNECT_TIMEOUT = float(os.environ.get('SPOONACULAR_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('SPOONACULAR_READ_TIMEOUT', 10))
+POOL_SIZE = int(os.environ.get('SPOONACULAR_POOL_SIZE', 10))
+MAX_RETRIES = int(os.environ.get('SPOONACULAR_MAX_RETRIES', 2))
+# Max ids sent in one informationBulk call
+BULK_CHUNK_SIZE = int(os.environ.get('SPOONACULAR_BULK_CHUNK_SIZE', 100))
+
+# Only retry idempotent GETs on errors that are likely to be transient. 402/429 mean quota is spent, so retrying only burns more points.
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class SpoonacularClient:
+    '''Wrapper around the Spoonacular endpoints used by the app. All calls share one keep-alive session.'''
+
+    def __init__(self, api_key=None, base_url=BASE_URL, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), pool_size=POOL_SIZE, max_retries=MAX_RETRIES, cache=None, store=None, index=None, guard=None):
+        self.api_key = api_key
+        # cache is the per-process memory tier, store is the shared database tier (anything with load_many/save_many)
+        self.cache = cache
+        self.store = store
+        # Every recipe that passes through the client is added to the local ingredient search index
+        self.index = index
+        # Rate limit, daily budget and circuit breaker checked before every call; None makes calls unguarded
+        self.guard = guard
+        # Background refresher told which recipes are asked for; with one, stale stored recipes are served while it refetches them
+        self.refresher = None
+        # Concurrent threads asking for the same recipe id or search share one upstream call
+        self.flights = SingleFlight()
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self._session = None
+        self._lock = threading.Lock()
+        # Async views use this instead of the requests session; its event loop only starts on first use
+        self.transport = AsyncTransport(self.base_url, timeout, pool_size, max_retries, guard)
+
+    @property
+    def session(self):
+        '''Session is created on first use so importing this module stays cheap'''
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._make_session()
+        return self._session
+
+    def _make_session(self):
+        '''Build a session with a bounded connection pool and jittered exponential backoff on transient failures'''
+        retry = Retry(
+            total=self.max_retries,
+            connect=self.max_retries,
+            read=self.max_retries,
+            status=self.max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            backoff_factor=0.25,
+            backoff_jitter=0.25,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        # pool_block makes threads wait for a free connection instead of opening unbounded extra sockets
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, pool_block=True, max_retries=retry)
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _get(self, path, **params):
+        '''GET a Spoonacular path and return the decoded JSON. Raises requests.exceptions.RequestException on any failure.'''
+        if self.guard is not None:
+            time.sleep(self.guard.admit(path, params))
+        return self._send(path, params)
+
+    def _get_many(self, calls):
+        '''GET several (path, params) calls one after another. The guard admits them together, so the chunks of one lookup
+        are refused as a whole or not at all. Returns their JSON in order, with the error in place of any call that failed.'''
+        if self.guard is not None and calls:
+            time.sleep(self.guard.admit_many(calls))
+        results = []
+        for path, params in calls:
+            try:
+                results.append(self._send(path, dict(params)))
+            except requests.exceptions.RequestException as e:
+                results.append(e)
+        return results
+
+    def _send(self, path, params):
+        '''Make a call the guard has admitted'''
+        params['apiKey'] = self.api_key
+        start = time.perf_counter()
+        status = headers = None
+        try:
+            resp = self.session.get(f'{self.base_url}{path}', params=params, timeout=self.timeout)
+            status, headers = resp.status_code, resp.headers
+        finally:
+            observe_upstream(path, status, time.perf_counter() - start)
+            if self.guard is not None:
+                self.guard.record(status, headers)
+        resp.raise_for_status()
+        return resp.json()
+
+    def random(self, number=16):
+        '''Get `number` random recipes. They are full recipe objects, so they are stored like any other lookup.'''
+        try:
+            results = self._get('/recipes/random', number=number)
+        except requests.exceptions.RequestException as e:
+            return self._stale_random(number, e)
+        self._remember({recipe['id']: recipe for recipe in results.get('recipes', [])})
+        return results
+
+    def complex_search(self, include_ingredients, exclude_ingredients, diet, number=8, offset=0):
+        '''Search recipes by included/excluded ingredients and diet. Identical concurrent searches share one call.'''
+        key = ('complexSearch', include_ingredients, exclude_ingredients, diet, number, offset)
+        return self.flights.do(key, lambda: self._get('/recipes/complexSearch', includeIngredients=include_ingredients,
+                                                      excludeIngredients=exclude_ingredients, diet=diet, number=number, offset=offset))
+
+    def information(self, recipe_id):
+        '''Get detailed information about a single recipe, served from the cache or store when possible'''
+        recipe_id = int(recipe_id)
+        found = self._lookup([recipe_id])
+        if recipe_id not in found:
+            found = self.flights.do_many([recipe_id], self._fetch_missing)
+        if recipe_id not in found:
+            raise requests.exceptions.HTTPError(f'Recipe {recipe_id} not found')
+        return found[recipe_id]
+
+    def information_bulk(self, recipe_ids):
+        '''Get detailed information about several recipes. Only ids missing from the cache and store are fetched,
+        in chunks of BULK_CHUNK_SIZE, and results are returned in the order of recipe_ids.'''
+        recipe_ids = [int(id) for id in recipe_ids]
+        found = self._lookup(recipe_ids)
+
+        # dict.fromkeys drops duplicate ids while keeping the caller's order
+        missing = [id for id in dict.fromkeys(recipe_ids) if id not in found]
+        if missing:
+            found.update(self.flights.do_many(missing, self._fetch_missing))
+
+        # Ids that Spoonacular doesn't know about are left out, same as informationBulk itself does
+        return [found[id] for id in recipe_ids if id in found]
+
+    async def async_random(self, number=16):
+        '''Async version of random'''
+        try:
+            results = await self.transport.get('/recipes/random', {'apiKey': self.api_key, 'number': number})
+        except requests.exceptions.RequestException as e:
+            return self._stale_random(number, e)
+        self._remember({recipe['id']: recipe for recipe in results.get('recipes', [])})
+        return results
+
+    async def async_complex_search(self, include_ingredients, exclude_ingredients, diet, number=8, offset=0):
+        '''Async version of complex_search. Coalesces with sync callers making the same search.'''
+        key = ('complexSearch', include_ingredients, exclude_ingredients, diet, number, offset)
+        params = {'apiKey': self.api_key, 'includeIngredients': include_ingredients, 'excludeIngredients': exclude_ingredients,
+                  'diet': diet, 'number': number, 'offset': offset}
+        return await self.flights.async_do(key, lambda: self.transport.get('/recipes/complexSearch', params))
+
+    async def async_information(self, recipe_id):
+        '''Async version of information'''
+        recipe_id = int(recipe_id)
+        found = self._lookup([recipe_id])
+        if recipe_id not in found:
+            found = await self.flights.async_do_many([recipe_id], self._async_fetch_missing)
+        if recipe_id not in found:
+            raise requests.exceptions.HTTPError(f'Recipe {recipe_id} not found')
+        return found[recipe_id]
+
+    async def async_information_bulk(self, recipe_ids):
+        '''Async version of information_bulk. Missing chunks are fetched concurrently.'''
+        recipe_ids = [int(id) for id in recipe_ids]
+        found = self._lookup(recipe_ids)
+        missing = [id for id in dict.fromkeys(recipe_ids) if id not in found]
+        if missing:
+            found.update(await self.flights.async_do_many(missing, self._async_fetch_missing))
+        return [found[id] for id in recipe_ids if id in found]
+
+    def _lookup(self, recipe_ids):
+        '''Return dict of recipe id -> recipe for ids held in the memory cache or the store. With a refresher,
+        stored recipes past their max age are returned too and queued to be fetched again in the background.'''
+        if self.refresher is not None:
+            self.refresher.touch(recipe_ids)
+        found = self.cache.get_many(recipe_ids) if self.cache is not None else {}
+        if self.store is not None:
+            missing = [id for id in recipe_ids if id not in found]
+            if missing:
+                if self.refresher is not None:
+                    stored, stale = self.store.load_with_stale(missing)
+                    self.refresher.request(stale)
+                else:
+                    stored, stale = self.store.load_many(missing), ()
+                # Stale recipes stay out of the memory cache, so the refreshed copy is picked up as soon as it is stored
+                if self.cache is not None:
+                    self.cache.set_many((id, recipe) for id, recipe in stored.items() if id not in stale)
+                if self.index is not None:
+                    self.index.add_many(stored.values())
+                found.update(stored)
+        return found
+
+    def _remember(self, recipes):
+        '''Write freshly fetched recipes (dict of id -> recipe) through to the store and memory cache'''
+        if self.store is not None:
+            self.store.save_many(recipes.values())
+        if self.cache is not None:
+            self.cache.set_many(recipes.items())
+        if self.index is not None:
+            self.index.add_many(recipes.values())
+
+    def _fetch_missing(self, recipe_ids):
+        '''Fetch recipes this thread has claimed from Spoonacular, one call after another'''
+        with self._fetch_lock(recipe_ids) as contended:
+            found, calls = self._plan_fetch(recipe_ids, contended)
+            try:
+                responses = self._get_many(calls)
+            except requests.exceptions.RequestException as e:
+                responses = [e]
+            errors = self._absorb_all(found, responses)
+            if errors:
+                found.update(self._load_stale([id for id in recipe_ids if id not in found]))
+                if not found:
+                    raise errors[0]
+        return found
+
+    async def _async_fetch_missing(self, recipe_ids):
+        '''Fetch recipes this request has claimed from Spoonacular, running all chunk calls concurrently'''
+        with self._fetch_lock(recipe_ids) as contended:
+            found, calls = self._plan_fetch(recipe_ids, contended)
+            try:
+                responses = await self.transport.get_many([(path, dict(params, apiKey=self.api_key)) for path, params in calls])
+            except requests.exceptions.RequestException as e:
+                responses = [e]
+            errors = self._absorb_all(found, responses)
+            if errors:
+                found.update(self._load_stale([id for id in recipe_ids if id not in found]))
+                if not found:
+                    raise errors[0]
+        return found
+
+    def refresh(self, recipe_ids):
+        '''Fetch recipes again whether or not they are stored, in as few informationBulk calls as possible.
+        Raises the first error if any call failed, after keeping what the others returned.'''
+        found, calls = self._plan_fetch(list(dict.fromkeys(recipe_ids)), contended=False)
+        errors = self._absorb_all(found, self._get_many(calls))
+        if errors:
+            raise errors[0]
+        return found
+
+    def _load_stale(self, recipe_ids):
+        '''Last-known copies of recipes, however old, for when Spoonacular can't be asked. They are not put in the
+        memory cache, so the next request tries Spoonacular again.'''
+        if self.store is None or not recipe_ids:
+            return {}
+        return self.store.load_many(recipe_ids, max_age=None)
+
+    def _stale_random(self, number, error):
+        '''Random recipes from the store for when Spoonacular can't be asked. Raises error if there are none.'''
+        recipes = self.store.sample(number) if self.store is not None else []
+        if not recipes:
+            raise error
+        return {'recipes': recipes}
+
+    def _fetch_lock(self, recipe_ids):
+        '''The store's fetch lock keeps other workers from fetching the same ids at the same time'''
+        return self.store.fetch_lock(recipe_ids) if self.store is not None else nullcontext(False)
+
+    def _plan_fetch(self, recipe_ids, contended):
+        '''Return (recipes found in the store, list of (path, params) calls that fetch the rest). If we had to wait
+        for the fetch lock, another worker has probably stored some of the recipes in the meantime.'''
+        found = {}
+        if contended:
+            found = self.store.load_many(recipe_ids)
+            if self.cache is not None:
+                self.cache.set_many(found.items())
+
+        missing = [id for id in recipe_ids if id not in found]
+        if len(missing) == 1:
+            return found, [(f'/recipes/{missing[0]}/information', {})]
+        return found, [('/recipes/informationBulk', {'ids': ','.join(str(id) for id in missing[start:start + BULK_CHUNK_SIZE])})
+                       for start in range(0, len(missing), BULK_CHUNK_SIZE)]
+
+    def _absorb_all(self, found, responses):
+        '''Absorb the successful responses of a lookup's calls into found. Returns the errors of the calls that failed.'''
+        errors = []
+        for response in responses:
+            if isinstance(response, requests.exceptions.RequestException):
+                errors.append(response)
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                found.update(self._absorb(response))
+        return errors
+
+    def _absorb(self, response):
+        '''Write an information or informationBulk response through to every tier. Returns dict of recipe id -> recipe.'''
+        recipes = response if isinstance(response, list) else [response]
+        fetched = {recipe['id']: recipe for recipe in recipes}
+        self._remember(fetched)
+        return fetched
+
+spoonacular = SpoonacularClient(api_key=os.environ.get('API_KEY'), cache=recipe_cache, index=ingredient_index, guard=UpstreamGuard())
@@ -57,8 +57,8 @@ class RecipeSearch {
 		document.querySelector('body').classList.remove('hide-scroll');
 	}
 
-	async showUserFavorites() {
-		// Show user's favorite recipes
+	async showUserFavorites(refresh = false) {
+		// Show user's favorite recipes. They arrive with the page bootstrap, so only refetch after favorites change
 
 		this.showLoadingView('#user_favorites');
 		if (!this.curr_user) {
@@ -68,7 +68,9 @@ class RecipeSearch {
 			window.location.replace('/login');
 			return;
 		}
-		await this.curr_user.getRecipes();
+		if (refresh) {
+			await this.curr_user.getRecipes();
+		}
 		this.recipes = this.curr_user.recipes;
 		const userFavoritesSection = document.querySelector('#user_favorites');
 		this.makeRecipes();
@@ -280,13 +282,11 @@ class Recipe {
 }
 
 class User {
-	constructor(id, recipes) {
+	constructor(id, recipes = [], favoriteRecipeIds = [], shoppingCart = []) {
 		this.id = id;
 		this.recipes = recipes;
-		this.shoppingCart = [];
-		this.favoriteRecipeIds = [];
-		this.getShoppingCart();
-		this.getRecipes();
+		this.favoriteRecipeIds = favoriteRecipeIds;
+		this.shoppingCart = shoppingCart;
 	}
 
 	async getRecipes() {
@@ -304,24 +304,23 @@ class User {
 		this.shoppingCart = response.data;
 	}
 
-	static async getCurrentUser() {
-		// Get current user from backend
+	static async getBootstrap() {
+		// Get current user, favorite recipes and shopping cart from backend in a single request
 
-		const user = await axios.get(`https://easy-recipes-6vwo.onrender.com/users/current`);
-		if (user != {}) {
-			return user.data;
+		try {
+			const response = await axios.get(`https://easy-recipes-6vwo.onrender.com/users/bootstrap`);
+			return response.data;
+		} catch (error) {
+			return null;
 		}
-		return null;
 	}
 
 	static async makeUser() {
 		// Create a new user instance
 
-		const user = await User.getCurrentUser();
-		if (user) {
-			const newUser = new User(user.id, user.recipes);
-			newUser.favoriteRecipeIds = user.recipes.map(recipe => recipe.id);
-			return newUser;
+		const data = await User.getBootstrap();
+		if (data) {
+			return new User(data.user.id, data.recipes, data.favorite_ids, data.cart_ids);
 		} else {
 			return 'Not logged in';
 		}
@@ -335,7 +334,7 @@ class User {
 		if (this.favoriteRecipeIds.includes(parseInt(recipeId))) {
 			await this.removeFavorite(recipeId);
 			if (window.location.pathname === '/users/details') {
-				home.showUserFavorites();
+				home.showUserFavorites(true);
 			}
 			favoriteBtn.classList.remove('btn-danger');
 			favoriteBtn.innerText = 'Favorite';
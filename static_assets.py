@@ -0,0 +1,97 @@
+# Description: Built static assets. `python static_assets.py` copies every file in static/ to static/dist/ under a
+# content-hashed name, writes gzip and brotli versions of the text files next to them, and records the names in a
+# manifest. Templates link through asset_url, so changed files get new URLs and built URLs can be cached forever.
+import os
+import gzip
+import json
+import hashlib
+import mimetypes
+from flask import Blueprint, request, send_from_directory, url_for
+from compression import brotli
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+# Images are already compressed, so only text assets get precompressed versions
+PRECOMPRESS_EXTENSIONS = ('.js', '.css', '.svg', '.json', '.txt', '.html')
+PRECOMPRESSED_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+assets_bp = Blueprint('assets', __name__)
+
+_manifest = None
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    '''Write hashed and precompressed copies of the static files plus manifest.json. Returns the manifest.
+    Files from earlier builds are kept, so pages rendered before a deploy can still load their assets.'''
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if os.path.join(root, d) != dist_dir)
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            filename = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+
+            stem, ext = os.path.splitext(filename)
+            hashed = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+            out = os.path.join(dist_dir, hashed)
+            write_file(out, data)
+            if ext in PRECOMPRESS_EXTENSIONS:
+                # Highest levels: this runs once per deploy, not per request. mtime=0 keeps the output reproducible.
+                write_file(out + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    write_file(out + '.br', brotli.compress(data, quality=11))
+            manifest[filename] = hashed
+
+    write_file(os.path.join(dist_dir, 'manifest.json'), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+def load_manifest():
+    '''Built asset names, read once per process. Empty when the build step hasn't been run.'''
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(os.path.join(DIST_DIR, 'manifest.json')) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def asset_url(filename):
+    '''URL of the built copy of a static file, falling back to the plain static URL when there is none'''
+    hashed = load_manifest().get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+    return url_for('assets.serve_asset', filename=hashed)
+
+
+@assets_bp.route('/assets/<path:filename>')
+def serve_asset(filename):
+    '''Serve a built asset, precompressed when the client accepts it. The name changes with the content, so it never expires.'''
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    available = [encoding for encoding, suffix in PRECOMPRESSED_SUFFIXES.items() if os.path.exists(os.path.join(DIST_DIR, filename + suffix))]
+    encoding = request.accept_encodings.best_match(available) if available else None
+
+    response = send_from_directory(DIST_DIR, filename + PRECOMPRESSED_SUFFIXES[encoding] if encoding else filename,
+                                   mimetype=mimetype, max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+if __name__ == '__main__':
+    manifest = build()
+    print(f'Built {len(manifest)} assets into {DIST_DIR}')
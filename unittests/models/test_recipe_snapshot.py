@@ -0,0 +1,67 @@
+import os
+from datetime import timedelta
+from unittest import TestCase
+from food_models import RecipeSnapshot, SNAPSHOT_MAX_AGE, utcnow
+from db_init import db
+
+from app import create_app
+
+# In-memory SQLite unless TEST_DATABASE_URL points somewhere else, e.g. postgresql:///easy_recipes_test
+app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', 'sqlite://'), 'TESTING': True, 'MAIL_QUEUE_WORKER': False,
+                  'RECIPE_REFRESHER': False, 'RANDOM_POOL': False})
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+class RecipeSnapshotTestCase(TestCase):
+    """Test the stored recipe snapshots"""
+
+    def setUp(self):
+        """Delete stored snapshots"""
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+
+        RecipeSnapshot.query.delete()
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_save_many_upserts(self):
+        '''Test that saving a recipe again updates its row and pulls the hot fields out of the JSON'''
+
+        RecipeSnapshot.save_many([{'id': 1, 'title': 'Soup'}, {'id': 2, 'title': 'Bread'}])
+        RecipeSnapshot.query.filter_by(id=1).update({'fetched_at': utcnow() - timedelta(days=1)})
+        db.session.commit()
+        RecipeSnapshot.save_many([{'id': 1, 'title': 'Tomato soup', 'readyInMinutes': 20,
+                                   'extendedIngredients': [{'name': 'tomatoes', 'nameClean': 'tomato'}, {'name': 'salt'}]}])
+
+        snapshot = db.session.get(RecipeSnapshot, 1)
+        self.assertEqual(RecipeSnapshot.query.count(), 2)
+        self.assertEqual((snapshot.title, snapshot.ready_in_minutes), ('Tomato soup', 20))
+        self.assertEqual(snapshot.ingredient_names, ['tomato', 'salt'])
+        self.assertEqual(snapshot.data['title'], 'Tomato soup')
+        self.assertGreater(snapshot.fetched_at, utcnow() - timedelta(minutes=1))
+
+    def test_load_many_max_age(self):
+        '''Test that load_many leaves out snapshots older than max_age unless max_age is None'''
+
+        RecipeSnapshot.save_many([{'id': 1, 'title': 'Soup'}, {'id': 2, 'title': 'Bread'}])
+        RecipeSnapshot.query.filter_by(id=2).update({'fetched_at': utcnow() - SNAPSHOT_MAX_AGE - timedelta(hours=1)})
+        db.session.commit()
+
+        self.assertEqual(RecipeSnapshot.load_many([1, 2, 3]), {1: {'id': 1, 'title': 'Soup'}})
+        self.assertEqual(set(RecipeSnapshot.load_many([1, 2, 3], max_age=None)), {1, 2})
+        self.assertEqual(RecipeSnapshot.load_many([]), {})
+
+    def test_sample(self):
+        '''Test that sample returns distinct stored recipes, all of them when fewer are stored'''
+
+        RecipeSnapshot.save_many([{'id': id, 'title': f'Recipe {id}'} for id in range(1, 11)])
+
+        sample = RecipeSnapshot.sample(4)
+        self.assertEqual(len({recipe['id'] for recipe in sample}), 4)
+        self.assertEqual(sorted(recipe['id'] for recipe in RecipeSnapshot.sample(20)), list(range(1, 11)))
@@ -2,16 +2,19 @@ import os
 from unittest import TestCase
 from pdb import set_trace
 from food_models import Recipe, Favorites, Allergy, Ingredient
-from db_init import db
-from user_model import User
+from db_init import db, count_queries
+from user_model import User, user_rows
 from sqlalchemy import exc
 
-os.environ['DATABASE_URL'] = "postgresql:///easy_recipes_test"
+from app import create_app
 
-from app import app
+# In-memory SQLite unless TEST_DATABASE_URL points somewhere else, e.g. postgresql:///easy_recipes_test
+app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', 'sqlite://'), 'TESTING': True, 'MAIL_QUEUE_WORKER': False,
+                  'RECIPE_REFRESHER': False, 'RANDOM_POOL': False})
 
-db.drop_all()
-db.create_all()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
 class UserModelTestCase(TestCase):
     """Test model for users"""
@@ -19,13 +22,18 @@ class UserModelTestCase(TestCase):
     def setUp(self):
         """Delete test model instances from db"""
 
+        self.ctx = app.app_context()
+        self.ctx.push()
+
         User.query.delete()
         Allergy.query.delete()
         Favorites.query.delete()
         Ingredient.query.delete()
+        user_rows.clear()
 
     def tearDown(self):
         db.session.rollback()
+        self.ctx.pop()
 
     def test_user_model_relationships(self):
         '''Test if user model relationships work (recipes, allergies)'''
@@ -59,6 +67,38 @@ class UserModelTestCase(TestCase):
 
         self.assertIsNotNone(valid_user)
 
+    def test_registration_allergies(self):
+        '''Test that repeated allergy words are dropped in typed order and existing ingredients are reused'''
+
+        eggs = Ingredient(id='eggs')
+        db.session.add(eggs)
+        db.session.commit()
+
+        user = User.register(email='test@test.com', username='testuser', password='password',
+                    image_url='https://tinyurl.com/29q8o28r', diet='vegan', allergies='eggs, peanuts, eggs, milk')
+        db.session.add(user)
+        db.session.commit()
+
+        self.assertEqual(user.dietary_restrictions, 'eggs, peanuts, milk')
+        self.assertCountEqual([allergy.id for allergy in user.allergies], ['eggs', 'peanuts', 'milk'])
+        self.assertIn(eggs, user.allergies)
+        self.assertEqual(Ingredient.query.count(), 3)
+
+    def test_registration_query_count(self):
+        '''Test that registering with five allergies, two of them known, costs 4 queries'''
+
+        db.session.add_all([Ingredient(id='eggs'), Ingredient(id='milk')])
+        db.session.commit()
+
+        with count_queries() as queries:
+            user = User.register(email='test@test.com', username='testuser', password='password',
+                        image_url='https://tinyurl.com/29q8o28r', diet='vegan', allergies='eggs peanuts milk soy fish')
+            db.session.add(user)
+            db.session.commit()
+
+        self.assertEqual(len(queries), 4)
+        self.assertEqual(user.dietary_restrictions, 'eggs, peanuts, milk, soy, fish')
+
     def test_invalid_registration(self):
         '''Test if User.register creates user with invalid input (null email)'''
 
@@ -88,4 +128,48 @@ class UserModelTestCase(TestCase):
 
         self.assertEqual(auth_check_valid, valid_user)
         self.assertFalse(auth_check_invalid_username)
-        self.assertFalse(auth_check_invalid_password)
\ No newline at end of file
+        self.assertFalse(auth_check_invalid_password)
+
+    def test_check_password(self):
+        '''Test that check_password verifies the password on an already loaded user'''
+
+        user = User.register(email='test@test.com', username='testuser', password='password',
+                    image_url='https://tinyurl.com/29q8o28r', diet='vegan', allergies='apples')
+        db.session.add(user)
+        db.session.commit()
+        # Loaded once, like add_user_to_g does for the session user
+        db.session.refresh(user)
+
+        with count_queries() as queries:
+            self.assertTrue(user.check_password('password'))
+            self.assertFalse(user.check_password('invalid_password'))
+
+        self.assertEqual(len(queries), 0)
+
+    def test_load_cached(self):
+        '''Test that the session user is loaded from the row cache until it is forgotten'''
+
+        user = User.register(email='test@test.com', username='testuser', password='password',
+                    image_url='https://tinyurl.com/29q8o28r', diet='vegan', allergies='apples')
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+        db.session.expunge_all()
+
+        with count_queries() as queries:
+            User.load_cached(user_id)
+        self.assertEqual(len(queries), 1)
+        db.session.expunge_all()
+
+        with count_queries() as queries:
+            cached = User.load_cached(user_id)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(cached.username, 'testuser')
+        self.assertTrue(cached.check_password('password'))
+
+        cached.username = 'renamed'
+        db.session.commit()
+        User.forget(user_id)
+        db.session.expunge_all()
+
+        self.assertEqual(User.load_cached(user_id).username, 'renamed')
@@ -0,0 +1,75 @@
+import gzip
+import json
+import tempfile
+from unittest import TestCase, skipIf
+from flask import Flask, jsonify
+import compression
+import static_assets
+
+
+def make_app():
+    app = Flask(__name__)
+    compression.init_app(app)
+
+    @app.route('/big')
+    def big():
+        response = jsonify([{'id': i, 'title': 'Recipe'} for i in range(200)])
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({'id': 1})
+
+    return app
+
+
+class CompressionTestCase(TestCase):
+    """Test negotiated response compression"""
+
+    def setUp(self):
+        self.client = make_app().test_client()
+
+    def test_gzip(self):
+        '''Test that large bodies are gzipped for clients that accept it, with a weak ETag'''
+
+        resp = self.client.get('/big', headers={'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(json.loads(gzip.decompress(resp.get_data()))), 200)
+        self.assertEqual(resp.headers['ETag'], 'W/"abc"')
+        self.assertIn('Accept-Encoding', resp.headers['Vary'])
+
+    @skipIf(compression.brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        '''Test that brotli is preferred when the client accepts both'''
+
+        resp = self.client.get('/big', headers={'Accept-Encoding': 'gzip, br'})
+
+        self.assertEqual(resp.headers['Content-Encoding'], 'br')
+        self.assertEqual(len(json.loads(compression.brotli.decompress(resp.get_data()))), 200)
+
+    def test_uncompressed(self):
+        '''Test that small bodies and clients without Accept-Encoding get the plain body'''
+
+        self.assertNotIn('Content-Encoding', self.client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers)
+        self.assertNotIn('Content-Encoding', self.client.get('/big').headers)
+
+
+class StaticAssetsTestCase(TestCase):
+    """Test the static asset build"""
+
+    def test_build(self):
+        '''Test that files get content-hashed names and precompressed copies'''
+
+        with tempfile.TemporaryDirectory() as static_dir:
+            with open(f'{static_dir}/script.js', 'w') as f:
+                f.write('console.log("hi");' * 100)
+            manifest = static_assets.build(static_dir, f'{static_dir}/dist')
+
+            hashed = manifest['script.js']
+            self.assertRegex(hashed, r'^script\.[0-9a-f]{12}\.js$')
+            with open(f'{static_dir}/dist/{hashed}.gz', 'rb') as f:
+                self.assertEqual(gzip.decompress(f.read()), b'console.log("hi");' * 100)
+            # Building again skips the dist folder and gives the same name
+            self.assertEqual(static_assets.build(static_dir, f'{static_dir}/dist'), manifest)
@@ -0,0 +1,71 @@
+from unittest import TestCase
+from ingredient_index import IngredientIndex, normalize_terms
+
+
+def make_recipe(id, ingredients, diets=(), **flags):
+    return dict(id=id, title=f'Recipe {id}', image=f'{id}.jpg', diets=list(diets),
+                extendedIngredients=[{'name': name} for name in ingredients], **flags)
+
+
+class IngredientIndexTestCase(TestCase):
+    """Test local ingredient search index"""
+
+    def setUp(self):
+        self.index = IngredientIndex()
+        self.index.add_many([
+            make_recipe(1, ['chicken breasts', 'olive oil', 'garlic']),
+            make_recipe(2, ['tofu', 'olive oil', 'peanuts'], diets=['vegan']),
+            make_recipe(3, ['eggs', 'flour', 'butter'], vegetarian=True),
+            make_recipe(4, ['tomatoes', 'garlic', 'basil'], diets=['vegan', 'gluten free'])
+        ])
+
+    def search_ids(self, *args, **kwargs):
+        results, total = self.index.search(*args, **kwargs)
+        return [recipe['id'] for recipe in results]
+
+    def test_normalize_terms(self):
+        '''Test that ingredient names are lowercased, split into words and singularized'''
+
+        self.assertEqual(normalize_terms('Cherry Tomatoes'), {'cherry', 'tomato'})
+        self.assertEqual(normalize_terms('berries'), {'berry'})
+
+    def test_include_and_exclude(self):
+        '''Test that include intersects and exclude subtracts'''
+
+        self.assertEqual(self.search_ids(include=['olive oil']), [1, 2])
+        self.assertEqual(self.search_ids(include=['garlic'], exclude=['chicken']), [4])
+        self.assertEqual(self.search_ids(include=['egg']), [3])
+        self.assertEqual(self.search_ids(exclude=['peanut', 'garlic']), [3])
+
+    def test_multi_word_names_match_within_one_ingredient(self):
+        '''Test that "olive oil" isn't matched by olives and oil from different ingredients, when included or excluded'''
+
+        self.index.add(make_recipe(5, ['black olives', 'vegetable oil']))
+
+        self.assertEqual(self.search_ids(include=['olive oil']), [1, 2])
+        self.assertEqual(self.search_ids(include=['olive', 'oil']), [1, 2, 5])
+        self.assertEqual(self.search_ids(exclude=['olive oil']), [3, 4, 5])
+
+    def test_diet_filter(self):
+        '''Test that diets from labels and flags are matched, with vegan counting as vegetarian'''
+
+        self.assertEqual(self.search_ids(diet='vegan'), [2, 4])
+        self.assertEqual(self.search_ids(diet='vegetarian'), [2, 3, 4])
+        self.assertEqual(self.search_ids(diet='none'), [1, 2, 3, 4])
+
+    def test_pagination(self):
+        '''Test offset/number paging and the total count'''
+
+        results, total = self.index.search(offset=1, number=2)
+
+        self.assertEqual([recipe['id'] for recipe in results], [2, 3])
+        self.assertEqual(total, 4)
+
+    def test_reindex_replaces_old_terms(self):
+        '''Test that adding a recipe again replaces what it was indexed under'''
+
+        self.index.add(make_recipe(1, ['salmon']))
+
+        self.assertEqual(self.search_ids(include=['chicken']), [])
+        self.assertEqual(self.search_ids(include=['salmon']), [1])
+        self.assertEqual(len(self.index), 4)
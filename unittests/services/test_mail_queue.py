@@ -0,0 +1,94 @@
+import socket
+from unittest import TestCase, skipUnless
+from flask import Flask
+from flask_mail import Mail
+from db_init import db
+from mail_model import OutboxEmail
+from mail_queue import MailDispatcher
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+
+class RecordingHandler:
+    '''aiosmtpd handler that keeps every message it receives'''
+
+    def __init__(self):
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return '250 OK'
+
+
+class MailQueueTestCase(TestCase):
+    """Test background mail dispatcher against a local SMTP sink"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', MAIL_SERVER='127.0.0.1', MAIL_PORT=8025,
+                               MAIL_USE_SSL=False, MAIL_USE_TLS=False, MAIL_QUEUE_WORKER=False)
+        db.init_app(self.app)
+        self.mail = Mail(self.app)
+        self.dispatcher = MailDispatcher(batch_size=10, max_attempts=2, timeout=0.5)
+        self.dispatcher.init_app(self.app, self.mail)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        OutboxEmail.__table__.create(db.engine)
+
+    def tearDown(self):
+        db.session.remove()
+        OutboxEmail.__table__.drop(db.engine)
+        self.ctx.pop()
+
+    def enqueue(self, count):
+        for i in range(count):
+            self.dispatcher.enqueue(recipients=[f'user{i}@test.com'], subject='Your Shopping Cart', html='<p>List</p>', sender='shop@test.com')
+
+    @skipUnless(Controller, 'aiosmtpd not installed')
+    def test_batch_is_sent_over_one_connection(self):
+        '''Test that queued emails are delivered and marked sent'''
+
+        handler = RecordingHandler()
+        controller = Controller(handler, hostname='127.0.0.1', port=8025)
+        controller.start()
+        try:
+            self.enqueue(3)
+            handled = self.dispatcher.dispatch_batch()
+        finally:
+            controller.stop()
+
+        self.assertEqual(handled, 3)
+        self.assertEqual(len(handler.messages), 3)
+        self.assertEqual(OutboxEmail.query.filter_by(status='sent').count(), 3)
+
+    def test_failed_send_is_retried_then_given_up(self):
+        '''Test that emails stay queued with backoff when SMTP is down, and fail after max attempts'''
+
+        self.enqueue(1)
+
+        self.dispatcher.dispatch_batch()
+        email = OutboxEmail.query.one()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIsNotNone(email.last_error)
+
+        # Not due yet, so nothing is claimed
+        self.assertEqual(self.dispatcher.dispatch_batch(), 0)
+
+        email.next_attempt_at = email.created_at
+        db.session.commit()
+        self.dispatcher.dispatch_batch()
+        self.assertEqual(OutboxEmail.query.one().status, 'failed')
+
+    def test_hung_server_times_out(self):
+        '''Test that a server that accepts the connection but never answers doesn't block the worker'''
+
+        self.enqueue(1)
+        with socket.create_server(('127.0.0.1', 8025)):
+            self.dispatcher.dispatch_batch()
+
+        email = OutboxEmail.query.one()
+        self.assertEqual((email.status, email.attempts), ('pending', 1))
+        self.assertIn('timed out', email.last_error)
@@ -0,0 +1,101 @@
+import os
+import tempfile
+from unittest import TestCase
+from flask import Flask
+import metrics
+from metrics import Metrics, metrics_bp, observe_upstream
+
+
+def make_app():
+    app = Flask(__name__)
+    app.register_blueprint(metrics_bp)
+    metrics.init_app(app)
+
+    @app.route('/recipes/<int:recipe_id>')
+    def recipe(recipe_id):
+        return 'ok'
+
+    return app
+
+
+class MetricsTestCase(TestCase):
+    """Test latency histograms and their Prometheus output"""
+
+    def setUp(self):
+        metrics.metrics.clear()
+
+    def test_render_histogram(self):
+        '''Test that buckets are cumulative and end with +Inf, _sum and _count'''
+
+        registry = Metrics(buckets=(0.5, 1))
+        registry.observe('http_request_duration_seconds', (('endpoint', 'home'),), 0.25)
+        registry.observe('http_request_duration_seconds', (('endpoint', 'home'),), 0.5)
+        registry.observe('http_request_duration_seconds', (('endpoint', 'home'),), 3)
+
+        lines = registry.render().splitlines()
+
+        self.assertIn('# TYPE http_request_duration_seconds histogram', lines)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="home",le="0.5"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="home",le="1"} 2', lines)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="home",le="+Inf"} 3', lines)
+        self.assertIn('http_request_duration_seconds_sum{endpoint="home"} 3.75', lines)
+        self.assertIn('http_request_duration_seconds_count{endpoint="home"} 3', lines)
+
+    def test_label_escaping(self):
+        '''Test that quotes and backslashes in label values are escaped'''
+
+        registry = Metrics(buckets=(1,))
+        registry.observe('db_query_duration_seconds', (('endpoint', 'a"b\\c'),), 0.5)
+
+        self.assertIn('db_query_duration_seconds_count{endpoint="a\\"b\\\\c"} 1', registry.render())
+
+    def test_collect_adds_up_worker_files(self):
+        '''Test that counts flushed by other processes are added to this process' counts'''
+
+        with tempfile.TemporaryDirectory() as directory:
+            labels = (('endpoint', 'home'),)
+            worker = Metrics(buckets=(1,), directory=directory, flush_interval=3600)
+            worker.observe('http_request_duration_seconds', labels, 0.5)
+            worker.flush()
+            # Pretend the file was written by another worker
+            os.rename(os.path.join(directory, f'{os.getpid()}.json'), os.path.join(directory, '1.json'))
+
+            registry = Metrics(buckets=(1,), directory=directory, flush_interval=3600)
+            registry.observe('http_request_duration_seconds', labels, 2)
+
+            self.assertEqual(registry.collect()[('http_request_duration_seconds', labels)], [1, 1, 2.5])
+
+    def test_request_histogram(self):
+        '''Test that requests are recorded by endpoint, method and status and served on /metrics'''
+
+        client = make_app().test_client()
+        client.get('/recipes/1')
+        client.get('/nowhere')
+
+        resp = client.get('/metrics')
+        body = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.content_type.startswith('text/plain; version=0.0.4'))
+        self.assertIn('http_request_duration_seconds_count{endpoint="recipe",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{endpoint="unmatched",method="GET",status="404"} 1', body)
+
+    def test_upstream_paths(self):
+        '''Test that recipe ids are taken out of Spoonacular paths and failed calls are labeled error'''
+
+        observe_upstream('/recipes/716429/information', 200, 0.2)
+        observe_upstream('/recipes/informationBulk', None, 0.2)
+
+        series = metrics.metrics.snapshot()
+
+        self.assertIn(('spoonacular_request_duration_seconds', (('path', '/recipes/{id}/information'), ('status', '200'))), series)
+        self.assertIn(('spoonacular_request_duration_seconds', (('path', '/recipes/informationBulk'), ('status', 'error'))), series)
+
+    def test_forked_worker_starts_empty(self):
+        '''Test that a process doesn't report counts it inherited from its parent'''
+
+        registry = Metrics(buckets=(1,))
+        registry.observe('http_request_duration_seconds', (('endpoint', 'home'),), 0.5)
+        registry._pid = -1
+
+        self.assertEqual(registry.snapshot(), {})
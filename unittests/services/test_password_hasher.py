@@ -0,0 +1,47 @@
+from unittest import TestCase
+from flask_bcrypt import Bcrypt
+from password_hasher import PasswordHasher, hash_rounds
+
+
+class PasswordHasherTestCase(TestCase):
+    """Test the bcrypt password hashing service"""
+
+    def test_hash_and_check(self):
+        '''Test that a hash matches its password only'''
+
+        hasher = PasswordHasher(rounds=4, workers=0)
+        hashed = hasher.hash('password')
+
+        self.assertEqual(hash_rounds(hashed), 4)
+        self.assertTrue(hasher.check(hashed, 'password'))
+        self.assertFalse(hasher.check(hashed, 'wrong'))
+        self.assertFalse(hasher.check(hashed, ''))
+        with self.assertRaises(ValueError):
+            hasher.hash('')
+
+    def test_flask_bcrypt_hashes(self):
+        '''Test that hashes stored before the service existed still verify'''
+
+        hashed = Bcrypt().generate_password_hash('password', 4).decode('UTF-8')
+
+        self.assertTrue(PasswordHasher(rounds=4, workers=0).check(hashed, 'password'))
+
+    def test_needs_rehash(self):
+        '''Test that hashes made with another cost are flagged for rehashing'''
+
+        hashed = PasswordHasher(rounds=4, workers=0).hash('password')
+
+        self.assertFalse(PasswordHasher(rounds=4, workers=0).needs_rehash(hashed))
+        self.assertTrue(PasswordHasher(rounds=5, workers=0).needs_rehash(hashed))
+        self.assertTrue(PasswordHasher(rounds=5, workers=0).needs_rehash('not a hash'))
+
+    def test_process_pool(self):
+        '''Test hashing and checking on the worker pool'''
+
+        hasher = PasswordHasher(rounds=4, workers=1)
+        try:
+            hashed = hasher.hash('password')
+            self.assertTrue(hasher.check(hashed, 'password'))
+            self.assertFalse(hasher.check(hashed, 'wrong'))
+        finally:
+            hasher.shutdown()
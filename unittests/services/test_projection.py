@@ -0,0 +1,29 @@
+from unittest import TestCase
+from flask import Flask
+from projection import requested_fields, project, project_many, RECIPE_CARD_FIELDS, ALL_FIELDS
+
+RECIPE = {'id': 1, 'title': 'Pancakes', 'summary': 'Fluffy', 'extendedIngredients': [{'name': 'flour'}]}
+
+
+class ProjectionTestCase(TestCase):
+    """Test projection of recipe objects"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def test_requested_fields(self):
+        '''Test parsing of the fields query parameter'''
+
+        with self.app.test_request_context('/'):
+            self.assertEqual(requested_fields(), RECIPE_CARD_FIELDS)
+        with self.app.test_request_context('/?fields=title, summary,title'):
+            self.assertEqual(requested_fields(), ('id', 'title', 'summary'))
+        with self.app.test_request_context('/?fields=*'):
+            self.assertIs(requested_fields(), ALL_FIELDS)
+
+    def test_project(self):
+        '''Test that only the requested fields are kept and missing fields are None'''
+
+        self.assertEqual(project(RECIPE, ('id', 'title', 'image')), {'id': 1, 'title': 'Pancakes', 'image': None})
+        self.assertIs(project(RECIPE, ALL_FIELDS), RECIPE)
+        self.assertEqual(project_many([RECIPE, RECIPE], ('id',)), [{'id': 1}, {'id': 1}])
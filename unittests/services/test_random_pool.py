@@ -0,0 +1,64 @@
+from unittest import TestCase
+from unittest.mock import Mock
+import requests
+from random_pool import RandomRecipePool
+
+
+def make_recipe(recipe_id, ingredients=('flour',), vegan=False):
+    return {'id': recipe_id, 'title': f'Recipe {recipe_id}', 'vegan': vegan,
+            'extendedIngredients': [{'nameClean': name} for name in ingredients]}
+
+
+class RandomRecipePoolTestCase(TestCase):
+    """Test the pre-fetched random recipe pool"""
+
+    def setUp(self):
+        self.client = Mock()
+        self.pool = RandomRecipePool(self.client, size=4, fetch_size=2)
+
+    def test_refill_from_store(self):
+        '''Test that a store with enough recipes fills the pool without calling Spoonacular'''
+
+        self.client.store.sample.return_value = [make_recipe(i) for i in range(4)]
+
+        self.pool.refill()
+
+        self.assertEqual(len(self.pool), 4)
+        self.client.random.assert_not_called()
+
+    def test_refill_tops_up_from_spoonacular(self):
+        '''Test that a short store is topped up with a batch of new random recipes, without duplicates'''
+
+        self.client.store.sample.return_value = [make_recipe(1), make_recipe(2)]
+        self.client.random.return_value = {'recipes': [make_recipe(2), make_recipe(3)]}
+
+        self.pool.refill()
+
+        self.client.random.assert_called_once_with(number=2)
+        self.assertEqual({recipe['id'] for recipe in self.pool.sample(10)}, {1, 2, 3})
+
+    def test_refill_keeps_stored_recipes_when_spoonacular_fails(self):
+        '''Test that a failed fetch still fills the pool with what is stored'''
+
+        self.client.store.sample.return_value = [make_recipe(1)]
+        self.client.random.side_effect = requests.exceptions.Timeout()
+
+        self.pool.refill()
+
+        self.assertEqual(len(self.pool), 1)
+
+    def test_sample_filters_diet_and_allergies(self):
+        '''Test that samples fit the diet, avoid allergy ingredients and never exceed the number asked for'''
+
+        self.pool.replace([make_recipe(1, ('peanut butter', 'bread'), vegan=True), make_recipe(2, ('tofu',), vegan=True),
+                           make_recipe(3, ('egg',)), make_recipe(4, ('rice',), vegan=True)])
+
+        self.assertEqual(len(self.pool.sample(2)), 2)
+        self.assertEqual({recipe['id'] for recipe in self.pool.sample(16, diet='vegetarian')}, {1, 2, 4})
+        self.assertEqual({recipe['id'] for recipe in self.pool.sample(16, diet='vegan', allergies=['peanuts'])}, {2, 4})
+        self.assertEqual(self.pool.sample(16, diet='paleo'), [])
+
+    def test_empty_pool(self):
+        '''Test that an empty pool samples nothing'''
+
+        self.assertEqual(self.pool.sample(16, allergies=['egg']), [])
@@ -0,0 +1,53 @@
+from unittest import TestCase
+from unittest.mock import patch
+from recipe_cache import TTLCache
+
+
+class TTLCacheTestCase(TestCase):
+    """Test TTL + LRU recipe cache"""
+
+    def test_get_and_set(self):
+        '''Test that cached values are returned and counted as hits'''
+
+        cache = TTLCache(ttl=60, max_entries=10)
+        cache.set(1, {'id': 1})
+
+        self.assertEqual(cache.get(1), {'id': 1})
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_expiry(self):
+        '''Test that entries past their TTL are treated as misses'''
+
+        cache = TTLCache(ttl=60, max_entries=10)
+        with patch('recipe_cache.time.monotonic', return_value=100):
+            cache.set(1, {'id': 1})
+        with patch('recipe_cache.time.monotonic', return_value=161):
+            self.assertIsNone(cache.get(1))
+
+        self.assertEqual(cache.expirations, 1)
+        self.assertEqual(len(cache), 0)
+
+    def test_lru_eviction_by_count(self):
+        '''Test that the least recently used entry is evicted when max_entries is exceeded'''
+
+        cache = TTLCache(ttl=60, max_entries=2)
+        cache.set(1, {'id': 1})
+        cache.set(2, {'id': 2})
+        cache.get(1)
+        cache.set(3, {'id': 3})
+
+        self.assertEqual(cache.get_many([1, 2, 3]), {1: {'id': 1}, 3: {'id': 3}})
+        self.assertEqual(cache.evictions, 1)
+
+    def test_eviction_by_bytes(self):
+        '''Test that the byte budget is enforced'''
+
+        cache = TTLCache(ttl=60, max_entries=100, max_bytes=30)
+        cache.set(1, {'title': 'a' * 10})
+        cache.set(2, {'title': 'b' * 10})
+
+        self.assertNotIn(1, cache)
+        self.assertIn(2, cache)
+        self.assertLessEqual(cache.stats()['bytes'], 30)
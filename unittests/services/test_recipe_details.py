@@ -0,0 +1,18 @@
+from unittest import TestCase
+from recipe_details import strip_tags, instruction_steps
+
+
+class RecipeDetailsTestCase(TestCase):
+    """Test recipe details cleaning"""
+
+    def test_strip_tags(self):
+        '''Test that HTML tags are removed and missing text becomes empty'''
+
+        self.assertEqual(strip_tags('<b>Fluffy</b> <a href="x">pancakes</a>'), 'Fluffy pancakes')
+        self.assertEqual(strip_tags(None), '')
+
+    def test_instruction_steps(self):
+        '''Test that instructions are split into one stripped step per sentence'''
+
+        self.assertEqual(instruction_steps('<ol><li>Mix the batter.</li><li> Fry it.</li></ol>'), ['Mix the batter', 'Fry it'])
+        self.assertEqual(instruction_steps(None), [])
@@ -0,0 +1,104 @@
+from datetime import timedelta
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+import requests
+from db_init import db
+from food_models import RecipeSnapshot, SNAPSHOT_MAX_AGE, utcnow
+from recipe_cache import TTLCache
+from recipe_refresher import RecipeRefresher
+from spoonacular_client import SpoonacularClient
+from upstream_guard import UpstreamGuard, TokenBucket
+
+
+def fake_bulk(path, params):
+    '''Stand-in for informationBulk that echoes back one recipe per requested id'''
+    return [{'id': int(id), 'title': f'New {id}'} for id in params['ids'].split(',')]
+
+
+class RecipeRefresherTestCase(TestCase):
+    """Test stale-while-revalidate lookups and the background refresher"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', RECIPE_REFRESHER=False)
+        db.init_app(self.app)
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        RecipeSnapshot.__table__.create(db.engine)
+
+        self.client = SpoonacularClient(api_key='test', cache=TTLCache(ttl=60, max_entries=1000), store=RecipeSnapshot)
+        self.refresher = RecipeRefresher(self.client, batch_size=2)
+        self.client.refresher = self.refresher
+
+    def tearDown(self):
+        db.session.remove()
+        RecipeSnapshot.__table__.drop(db.engine)
+        self.ctx.pop()
+
+    def store(self, recipe_id, age):
+        RecipeSnapshot.save_many([{'id': recipe_id, 'title': f'Old {recipe_id}'}])
+        RecipeSnapshot.query.filter_by(id=recipe_id).update({'fetched_at': utcnow() - age})
+        db.session.commit()
+
+    def test_stale_recipe_is_served_and_queued(self):
+        '''Test that a snapshot past its max age is served without a call, kept out of the memory cache and queued'''
+
+        self.store(1, SNAPSHOT_MAX_AGE + timedelta(days=1))
+
+        with patch.object(self.client, '_send') as mock_send:
+            recipe = self.client.information(1)
+
+        self.assertEqual(recipe['title'], 'Old 1')
+        mock_send.assert_not_called()
+        self.assertIsNone(self.client.cache.get(1))
+        self.assertEqual(self.refresher.next_batch(), [1])
+
+    def test_batch_is_most_requested_first(self):
+        '''Test that one batch refreshes the most requested due recipes and leaves the rest for the next round'''
+
+        for recipe_id in (1, 2, 3):
+            self.store(recipe_id, SNAPSHOT_MAX_AGE + timedelta(days=1))
+        # Fresh, but within RECIPE_REFRESH_AHEAD of going stale
+        self.store(4, SNAPSHOT_MAX_AGE - timedelta(hours=1))
+        self.refresher.touch([3, 4, 4, 4, 4])
+
+        with patch.object(self.client, '_send', side_effect=fake_bulk) as mock_send:
+            self.client.information_bulk([1, 2, 3])
+            self.assertEqual(self.refresher.refresh_batch(), [4, 3])
+
+        mock_send.assert_called_once_with('/recipes/informationBulk', {'ids': '4,3'})
+        self.assertEqual(RecipeSnapshot.load_many([3, 4])[4]['title'], 'New 4')
+        self.assertEqual(self.client.cache.get(3)['title'], 'New 3')
+        self.assertEqual(set(self.refresher.next_batch()), {1, 2})
+
+    def test_failed_refresh_is_retried(self):
+        '''Test that recipes whose refresh failed are queued again'''
+
+        self.store(1, SNAPSHOT_MAX_AGE + timedelta(days=1))
+        self.refresher.request([1])
+
+        with patch.object(self.client, '_send', side_effect=requests.exceptions.Timeout()):
+            self.assertEqual(self.refresher.refresh_batch(), [])
+
+        self.assertEqual(self.refresher.next_batch(), [1])
+
+    def test_batch_leaves_points_for_requests(self):
+        '''Test that a round only spends the guard's points above the reserve, and skips when there are none to spare'''
+
+        for recipe_id in range(1, 31):
+            self.store(recipe_id, SNAPSHOT_MAX_AGE + timedelta(days=1))
+        self.client.guard = UpstreamGuard(limiter=TokenBucket(rate=5, capacity=20, clock=lambda: 0))
+        self.refresher.batch_size = 100
+        self.refresher.reserve = 10
+        self.refresher.request(range(1, 31))
+
+        with patch.object(self.client, '_send', side_effect=fake_bulk) as mock_send:
+            self.assertEqual(len(self.refresher.refresh_batch()), 19)
+            self.assertEqual(self.client.guard.limiter.tokens, 10)
+            self.assertEqual(self.refresher.refresh_batch(), [])
+
+        self.assertEqual(mock_send.call_count, 1)
+        # A request can still spend the reserve straight away
+        self.assertEqual(self.client.guard.admit('/recipes/1/information', {}), 0)
+        self.assertEqual(len(self.refresher.next_batch()), 11)
@@ -0,0 +1,82 @@
+from unittest import TestCase
+from unittest.mock import Mock
+from recipe_cache import TTLCache
+from shopping_list import aggregate_ingredients, normalize_unit, ShoppingListBuilder
+
+
+def make_recipe(id, *ingredients):
+    return {'id': id, 'title': f'Recipe {id}', 'extendedIngredients': [
+        {'name': name, 'amount': amount, 'unit': unit, 'aisle': aisle} for name, amount, unit, aisle in ingredients]}
+
+
+class ShoppingListTestCase(TestCase):
+    """Test shopping list aggregation"""
+
+    def test_normalize_unit(self):
+        '''Test that unit spellings collapse to one unit'''
+
+        self.assertEqual(normalize_unit('Tbsps.'), 'tbsp')
+        self.assertEqual(normalize_unit('T'), 'tbsp')
+        self.assertEqual(normalize_unit('cups'), 'cup')
+        self.assertEqual(normalize_unit('ounces'), 'ounce')
+        self.assertEqual(normalize_unit('cloves'), 'clove')
+
+    def test_sums_across_recipes_and_units(self):
+        '''Test that the same ingredient is summed across recipes after unit conversion'''
+
+        recipes = [
+            make_recipe(1, ('flour', 2, 'cups', 'Baking'), ('egg', 2, '', 'Milk, Eggs, Other Dairy')),
+            make_recipe(2, ('Flour', 1, 'cup', 'Baking'), ('flour', 8, 'Tbsp', 'Baking'), ('eggs', 1, '', 'Milk, Eggs, Other Dairy'))
+        ]
+
+        aisles = aggregate_ingredients(recipes)
+
+        self.assertEqual([group['aisle'] for group in aisles], ['Baking', 'Milk, Eggs, Other Dairy'])
+        self.assertEqual(aisles[0]['ingredients'], [{'name': 'flour', 'amount': 3.5, 'unit': 'cups', 'text': '3.5 cups flour'}])
+        self.assertEqual(aisles[1]['ingredients'][0]['text'], '3 eggs')
+
+    def test_display_names_and_units(self):
+        '''Test that lines show the recipe's own spelling and plural count units, not the grouping key'''
+
+        recipes = [
+            make_recipe(1, ('garlic', 2, 'cloves', 'Produce'), ('egg', 2, 'large', 'Dairy'), ('Cherry Tomatoes', 1, '', 'Produce')),
+            make_recipe(2, ('garlic', 1, 'clove', 'Produce'), ('cherry tomato', 1, '', 'Produce'), ('bay leaf', 1, '', 'Spices'))
+        ]
+
+        texts = sorted(item['text'] for group in aggregate_ingredients(recipes) for item in group['ingredients'])
+
+        self.assertEqual(texts, ['1 bay leaf', '2 Cherry Tomatoes', '2 large eggs', '3 cloves garlic'])
+
+    def test_incompatible_units_stay_separate(self):
+        '''Test that mass and volume of one ingredient are not added together'''
+
+        recipes = [make_recipe(1, ('butter', 100, 'g', 'Dairy')), make_recipe(2, ('butter', 2, 'tbsp', 'Dairy'))]
+
+        texts = [item['text'] for item in aggregate_ingredients(recipes)[0]['ingredients']]
+
+        self.assertEqual(sorted(texts), ['100 g butter', '2 Tbsp butter'])
+
+    def test_list_is_cached_per_cart_version(self):
+        '''Test that the list is only built once for the same set of recipe ids'''
+
+        builder = ShoppingListBuilder(TTLCache(ttl=60, max_entries=10))
+        load_recipes = Mock(return_value=[make_recipe(1, ('salt', 1, 'tsp', 'Spices'))])
+
+        builder.get([1], load_recipes)
+        shopping_list = builder.get([1, 1], load_recipes)
+
+        self.assertEqual(load_recipes.call_count, 1)
+        self.assertEqual(shopping_list['recipes'], ['Recipe 1'])
+
+    def test_partial_list_is_not_cached(self):
+        '''Test that a list missing some of the cart's recipes is built again on the next request'''
+
+        builder = ShoppingListBuilder(TTLCache(ttl=60, max_entries=10))
+        load_recipes = Mock(side_effect=[[make_recipe(1, ('salt', 1, 'tsp', 'Spices'))],
+                                         [make_recipe(1, ('salt', 1, 'tsp', 'Spices')), make_recipe(2, ('salt', 1, 'tsp', 'Spices'))]])
+
+        self.assertEqual(builder.get([1, 2], load_recipes)['recipes'], ['Recipe 1'])
+        self.assertEqual(builder.get([1, 2], load_recipes)['recipes'], ['Recipe 1', 'Recipe 2'])
+        builder.get([2, 1], load_recipes)
+
+        self.assertEqual(load_recipes.call_count, 2)
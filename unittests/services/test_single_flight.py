@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+from single_flight import SingleFlight
+
+
+class SingleFlightTestCase(TestCase):
+    """Test in-flight request coalescing"""
+
+    def run_concurrently(self, target, count=8):
+        threads = [threading.Thread(target=target) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def test_concurrent_calls_share_one_result(self):
+        '''Test that concurrent callers for one key run the function once'''
+
+        flights = SingleFlight()
+        calls, results = [], []
+
+        def slow_fetch():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'id': 1}
+
+        self.run_concurrently(lambda: results.append(flights.do(1, slow_fetch)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'id': 1}] * 8)
+        self.assertEqual(flights.in_flight(), 0)
+
+    def test_do_many_only_fetches_unclaimed_keys(self):
+        '''Test that overlapping bulk lookups each fetch only the keys nobody else is fetching'''
+
+        flights = SingleFlight()
+        fetched, results = [], []
+
+        def fetch(keys):
+            fetched.extend(keys)
+            time.sleep(0.1)
+            return {key: key * 10 for key in keys}
+
+        self.run_concurrently(lambda: results.append(flights.do_many([1, 2, 3], fetch)))
+
+        self.assertEqual(sorted(fetched), [1, 2, 3])
+        self.assertEqual(results, [{1: 10, 2: 20, 3: 30}] * 8)
+
+    def test_errors_reach_waiters(self):
+        '''Test that a failed call raises in every waiting caller and is not remembered'''
+
+        flights = SingleFlight()
+        errors = []
+
+        def failing_fetch():
+            time.sleep(0.1)
+            raise ValueError('upstream down')
+
+        def call():
+            try:
+                flights.do(1, failing_fetch)
+            except ValueError as e:
+                errors.append(e)
+
+        self.run_concurrently(call, count=4)
+
+        self.assertEqual(len(errors), 4)
+        self.assertEqual(flights.do(1, lambda: 'recovered'), 'recovered')
+
+    def test_cancelled_async_leader_releases_its_key(self):
+        '''Test that cancelling an async leader wakes its waiters and lets the next caller run the call'''
+
+        flights = SingleFlight()
+
+        async def slow_fetch():
+            await asyncio.sleep(10)
+
+        async def scenario():
+            leader = asyncio.create_task(flights.async_do(1, slow_fetch))
+            await asyncio.sleep(0.05)
+            waiter = asyncio.create_task(flights.async_do(1, slow_fetch))
+            await asyncio.sleep(0.05)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            with self.assertRaises(asyncio.CancelledError):
+                await asyncio.wait_for(waiter, 1)
+
+            async def recovered():
+                return 'recovered'
+            return await asyncio.wait_for(flights.async_do(1, recovered), 1)
+
+        self.assertEqual(asyncio.run(scenario()), 'recovered')
+        self.assertEqual(flights.in_flight(), 0)
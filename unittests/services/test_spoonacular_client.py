@@ -0,0 +1,151 @@
+import asyncio
+from contextlib import nullcontext
+from unittest import TestCase
+from unittest.mock import patch, AsyncMock, Mock
+import httpx
+import requests
+from async_transport import AsyncTransport
+from food_models import SNAPSHOT_MAX_AGE
+from recipe_cache import TTLCache
+from spoonacular_client import SpoonacularClient
+from upstream_guard import UpstreamGuard, CircuitBreaker, TokenBucket
+
+
+def fake_bulk(path, params):
+    '''Stand-in for informationBulk that echoes back one recipe per requested id'''
+    return [{'id': int(id), 'title': f'Recipe {id}'} for id in params['ids'].split(',')]
+
+
+class SpoonacularClientTestCase(TestCase):
+    """Test Spoonacular client cache handling"""
+
+    def setUp(self):
+        self.client = SpoonacularClient(api_key='test', cache=TTLCache(ttl=60, max_entries=1000))
+
+    def test_information_is_cached(self):
+        '''Test that a second information lookup does not call the API'''
+
+        with patch.object(self.client, '_send', return_value={'id': 5, 'title': 'Soup'}) as mock_send:
+            self.client.information(5)
+            recipe = self.client.information('5')
+
+        self.assertEqual(recipe['title'], 'Soup')
+        self.assertEqual(mock_send.call_count, 1)
+
+    def test_bulk_fetches_only_missing_ids(self):
+        '''Test that information_bulk only requests uncached ids and keeps caller order'''
+
+        self.client.cache.set_many([(2, {'id': 2, 'title': 'Cached'})])
+
+        with patch.object(self.client, '_send', side_effect=fake_bulk) as mock_send:
+            recipes = self.client.information_bulk([3, 2, 1, 3])
+
+        mock_send.assert_called_once_with('/recipes/informationBulk', {'ids': '3,1'})
+        self.assertEqual([recipe['id'] for recipe in recipes], [3, 2, 1, 3])
+        self.assertEqual(recipes[1]['title'], 'Cached')
+
+    def test_bulk_chunks_large_requests(self):
+        '''Test that misses are split into chunks and a warm cache makes no calls'''
+
+        with patch('spoonacular_client.BULK_CHUNK_SIZE', 100), patch.object(self.client, '_send', side_effect=fake_bulk) as mock_send:
+            self.client.information_bulk(range(1, 251))
+            self.assertEqual(mock_send.call_count, 3)
+
+            recipes = self.client.information_bulk(range(1, 251))
+            self.assertEqual(mock_send.call_count, 3)
+
+        self.assertEqual(len(recipes), 250)
+
+    def test_async_bulk_fetches_chunks_concurrently(self):
+        '''Test that the async path sends every missing chunk in one concurrent batch'''
+
+        async def fake_get_many(calls):
+            return [fake_bulk(path, params) for path, params in calls]
+
+        with patch('spoonacular_client.BULK_CHUNK_SIZE', 2), patch.object(self.client.transport, 'get_many', AsyncMock(side_effect=fake_get_many)) as mock_get_many:
+            recipes = asyncio.run(self.client.async_information_bulk([1, 2, 3, 4, 5]))
+
+        calls = mock_get_many.call_args.args[0]
+        self.assertEqual(mock_get_many.call_count, 1)
+        self.assertEqual([params['ids'] for path, params in calls], ['1,2', '3,4', '5'])
+        self.assertEqual([recipe['id'] for recipe in recipes], [1, 2, 3, 4, 5])
+
+    def test_guard_admits_all_chunks_of_a_lookup(self):
+        '''Test that a lookup costing more than the burst is admitted whole, on both paths, rather than cut off after its first chunk'''
+
+        async def fake_get(path, params, admitted=False):
+            self.assertTrue(admitted)
+            return fake_bulk(path, params)
+
+        self.client.guard = self.client.transport.guard = UpstreamGuard(limiter=TokenBucket(rate=5, capacity=20, clock=lambda: 0))
+        with patch('spoonacular_client.BULK_CHUNK_SIZE', 100), patch.object(self.client, '_session') as mock_session:
+            mock_session.get.return_value.status_code = 200
+            mock_session.get.return_value.headers = {}
+            mock_session.get.return_value.json.side_effect = [fake_bulk('', {'ids': ','.join(map(str, range(1, 101)))}), fake_bulk('', {'ids': '101'})]
+            recipes = self.client.information_bulk(range(1, 102))
+        self.assertEqual(len(recipes), 101)
+        self.assertEqual(self.client.guard.limiter.tokens, 20 - 51.5)
+
+        self.client.cache = TTLCache(ttl=60, max_entries=1000)
+        self.client.guard.limiter.tokens = 20
+        with patch('spoonacular_client.BULK_CHUNK_SIZE', 100), patch.object(self.client.transport, 'get', AsyncMock(side_effect=fake_get)):
+            recipes = asyncio.run(self.client.async_information_bulk(range(1, 102)))
+        self.assertEqual(len(recipes), 101)
+        self.assertEqual(self.client.guard.limiter.tokens, 20 - 51.5)
+
+    def test_async_bulk_keeps_chunks_that_succeeded(self):
+        '''Test that one failed chunk doesn't throw away the recipes the other chunks returned'''
+
+        async def fake_get(path, params, admitted=False):
+            if params['ids'] == '3':
+                raise requests.exceptions.Timeout()
+            return fake_bulk(path, params)
+
+        with patch('spoonacular_client.BULK_CHUNK_SIZE', 2), patch.object(self.client.transport, 'get', AsyncMock(side_effect=fake_get)):
+            recipes = asyncio.run(self.client.async_information_bulk([1, 2, 3]))
+
+        self.assertEqual([recipe['id'] for recipe in recipes], [1, 2])
+
+    def test_falls_back_to_stale_store(self):
+        '''Test that when Spoonacular can't be asked, recipes come from the store however old they are'''
+
+        store = Mock()
+        store.load_many.side_effect = lambda ids, max_age=SNAPSHOT_MAX_AGE: {5: {'id': 5, 'title': 'Old soup'}} if max_age is None else {}
+        store.fetch_lock.return_value = nullcontext(False)
+        self.client.store = store
+        self.client.guard = UpstreamGuard(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30))
+        self.client.guard.breaker.failure()
+
+        with patch.object(self.client, '_session') as mock_session:
+            recipe = self.client.information(5)
+
+        self.assertEqual(recipe['title'], 'Old soup')
+        mock_session.get.assert_not_called()
+        # Stale recipes aren't cached, so the next lookup tries Spoonacular again
+        self.assertIsNone(self.client.cache.get(5))
+
+    def test_random_falls_back_to_store_sample(self):
+        '''Test that random recipes come from the store when the call fails, and the error is kept when it is empty'''
+
+        store = Mock()
+        store.sample.return_value = [{'id': 1}, {'id': 2}]
+        self.client.store = store
+
+        with patch.object(self.client, '_get', side_effect=requests.exceptions.Timeout()):
+            self.assertEqual(self.client.random(number=2), {'recipes': [{'id': 1}, {'id': 2}]})
+
+            store.sample.return_value = []
+            with self.assertRaises(requests.exceptions.Timeout):
+                self.client.random(number=2)
+
+    def test_async_transport_converts_bad_json(self):
+        '''Test that a response that isn't JSON raises a requests exception, like the sync client does'''
+
+        transport = AsyncTransport('http://spoonacular.test', timeout=(1, 1), pool_size=1, max_retries=0)
+
+        async def get():
+            transport._client = httpx.AsyncClient(base_url=transport.base_url, transport=httpx.MockTransport(lambda request: httpx.Response(200, text='<html>')))
+            return await transport._get('/recipes/1/information', {})
+
+        with self.assertRaises(requests.exceptions.RequestException):
+            asyncio.run(get())
@@ -0,0 +1,83 @@
+from datetime import date
+from unittest import TestCase
+from upstream_guard import TokenBucket, DailyBudget, CircuitBreaker, UpstreamGuard, UpstreamUnavailable, call_cost
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class UpstreamGuardTestCase(TestCase):
+    """Test the Spoonacular rate limiter, budget and circuit breaker"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_call_cost(self):
+        '''Test that informationBulk costs grow with the number of ids'''
+
+        self.assertEqual(call_cost('/recipes/1/information', {}), 1)
+        self.assertEqual(call_cost('/recipes/informationBulk', {'ids': '1,2,3'}), 2)
+        self.assertEqual(call_cost('/recipes/random', {'number': 16}), 1.16)
+
+    def test_token_bucket(self):
+        '''Test that calls wait for points to refill and are refused when the wait is too long'''
+
+        bucket = TokenBucket(rate=2, capacity=4, clock=self.clock)
+
+        self.assertEqual(bucket.reserve(4, max_wait=0), 0)
+        self.assertEqual(bucket.reserve(1, max_wait=1), 0.5)
+        self.assertIsNone(bucket.reserve(4, max_wait=1))
+
+        self.clock.now = 10
+        self.assertEqual(bucket.reserve(4, max_wait=0), 0)
+
+    def test_budget(self):
+        '''Test that the budget refuses calls past the limit learned from the headers until the next day'''
+
+        today = date(2024, 1, 1)
+        budget = DailyBudget(today=lambda: today)
+        self.assertTrue(budget.try_spend(100))
+
+        budget.sync(used=149, left=1)
+        self.assertTrue(budget.try_spend(1))
+        self.assertFalse(budget.try_spend(1))
+
+        today = date(2024, 1, 2)
+        self.assertTrue(budget.try_spend(1))
+
+    def test_breaker(self):
+        '''Test that the breaker opens after repeated failures and closes after a successful trial call'''
+
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=self.clock)
+        breaker.failure()
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertFalse(breaker.allow())
+
+        self.clock.now = 31
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertTrue(breaker.allow())
+
+    def test_guard_records_quota_responses(self):
+        '''Test that a 402 spends the budget and a 429 opens the breaker for Retry-After'''
+
+        guard = UpstreamGuard(TokenBucket(0, 0), DailyBudget(), CircuitBreaker(5, 30, clock=self.clock))
+
+        guard.admit('/recipes/1/information', {})
+        guard.record(429, {'Retry-After': '60'})
+        with self.assertRaises(UpstreamUnavailable):
+            guard.admit('/recipes/1/information', {})
+
+        self.clock.now = 61
+        guard.admit('/recipes/1/information', {})
+        guard.record(402, {'X-API-Quota-Used': '150.5', 'X-API-Quota-Left': '0'})
+        with self.assertRaises(UpstreamUnavailable):
+            guard.admit('/recipes/1/information', {})
+        self.assertEqual(guard.budget.used, 150.5)
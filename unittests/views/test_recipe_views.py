@@ -0,0 +1,120 @@
+import os
+from unittest import TestCase
+from unittest.mock import AsyncMock, patch
+from db_init import db
+from recipe_details import recipe_details
+from random_pool import random_pool
+from user_model import User
+
+from app import create_app, CURR_USER_KEY
+
+# In-memory SQLite unless TEST_DATABASE_URL points somewhere else, e.g. postgresql:///easy_recipes_test
+app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', 'sqlite://'), 'TESTING': True,
+                  'SECRET_KEY': 'test', 'MAIL_QUEUE_WORKER': False,
+                  'RECIPE_REFRESHER': False, 'RANDOM_POOL': False})
+
+with app.app_context():
+    db.drop_all()
+    db.create_all()
+
+RECIPE = {'id': 1, 'title': 'Pancakes', 'readyInMinutes': 20, 'image': 'https://img/1.jpg', 'sourceUrl': 'https://src/1',
+          'summary': '<b>Fluffy</b> pancakes', 'instructions': '<ol><li>Mix the batter.</li><li>Fry it.</li></ol>'}
+
+
+class RecipeViewTestCase(TestCase):
+    """Test views for recipes"""
+
+    def setUp(self):
+        self.ctx = app.app_context()
+        self.ctx.push()
+        recipe_details.cache.clear()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        db.session.rollback()
+        self.ctx.pop()
+
+    def test_show_recipe_details(self):
+        '''Test that details render cleaned instructions as steps'''
+        with patch('routes.recipes.spoonacular.async_information', AsyncMock(return_value=RECIPE)):
+            resp = self.client.get('/recipes/1/details')
+            html = resp.get_data(as_text=True)
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('<li>Mix the batter</li>', html)
+        self.assertIn('<li>Fry it</li>', html)
+        self.assertIn('Fluffy pancakes', html)
+        self.assertIsNotNone(resp.headers.get('ETag'))
+        self.assertIsNotNone(resp.headers.get('Last-Modified'))
+
+    def test_recipe_details_not_modified(self):
+        '''Test that revalidating with the ETag gets a 304 without fetching the recipe again'''
+        fetch = AsyncMock(return_value=RECIPE)
+        with patch('routes.recipes.spoonacular.async_information', fetch):
+            resp = self.client.get('/recipes/1/details')
+            etag = resp.headers['ETag']
+
+            not_modified = self.client.get('/recipes/1/details', headers={'If-None-Match': etag})
+            modified = self.client.get('/recipes/1/details', headers={'If-None-Match': '"stale"'})
+
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.get_data(), b'')
+        self.assertEqual(not_modified.headers['ETag'], etag)
+        self.assertEqual(modified.status_code, 200)
+        self.assertEqual(fetch.await_count, 1)
+
+    def test_recipe_information_not_modified(self):
+        '''Test that recipe information is public and revalidates with a content hash ETag'''
+        with patch('routes.recipes.spoonacular.async_information', AsyncMock(return_value=RECIPE)):
+            resp = self.client.get('/recipes/1/information')
+            not_modified = self.client.get('/recipes/1/information', headers={'If-None-Match': resp.headers['ETag']})
+
+        self.assertEqual(resp.json, RECIPE)
+        self.assertIn('public', resp.headers['Cache-Control'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def get_random_as(self, diet, allergies, pool, fetch):
+        '''GET /recipes/random as a new user with the given diet and allergies, from a pool of the given recipes'''
+        user = User.register(username='pooluser', email='pool@test.com', password='password', image_url=None, diet=diet, allergies=allergies)
+        db.session.add(user)
+        db.session.commit()
+        with self.client.session_transaction() as sess:
+            sess[CURR_USER_KEY] = user.id
+
+        random_pool.replace(pool)
+        try:
+            with patch('routes.recipes.spoonacular.async_random', fetch):
+                return self.client.get('/recipes/random')
+        finally:
+            random_pool.replace([])
+            db.session.delete(user)
+            db.session.commit()
+
+    def test_random_recipes_from_pool(self):
+        '''Test that random recipes come from the pool, fit the user's diet and need no Spoonacular call'''
+        pool = [dict(RECIPE, id=id, extendedIngredients=[{'nameClean': 'flour'}], vegan=id <= 20) for id in range(1, 41)]
+        fetch = AsyncMock()
+
+        resp = self.get_random_as('vegan', '', pool, fetch)
+
+        self.assertEqual(len(resp.json['recipes']), 16)
+        self.assertTrue(all(recipe['id'] <= 20 for recipe in resp.json['recipes']))
+        self.assertEqual(resp.json['recipes'][0]['title'], 'Pancakes')
+        fetch.assert_not_awaited()
+
+    def test_random_recipes_short_pool_is_filled(self):
+        '''Test that few recipes fitting the diet are topped up from the rest of the pool, then from Spoonacular,
+        leaving out recipes with the user's allergies'''
+        pool = [dict(RECIPE, id=id, extendedIngredients=[{'nameClean': 'egg' if id == 2 else 'flour'}], vegan=id <= 3)
+                for id in range(1, 12)]
+        fetch = AsyncMock(return_value={'recipes': [dict(RECIPE, id=id, extendedIngredients=[{'nameClean': 'egg' if id == 100 else 'flour'}])
+                                                    for id in range(100, 110)]})
+
+        resp = self.get_random_as('vegan', 'eggs', pool, fetch)
+
+        ids = [recipe['id'] for recipe in resp.json['recipes']]
+        self.assertEqual(len(ids), 16)
+        self.assertCountEqual(ids[:2], [1, 3])
+        self.assertCountEqual(ids[2:10], range(4, 12))
+        self.assertEqual(ids[10:], list(range(101, 107)))
+        fetch.assert_awaited_once_with(number=16)
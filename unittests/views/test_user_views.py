@@ -1,21 +1,25 @@
 import os
+from datetime import timedelta
 from unittest import TestCase
-from db_init import db
-from food_models import Ingredient, Recipe, Favorites, Allergy
+from unittest.mock import AsyncMock, patch
+from db_init import db, count_queries
+from food_models import Ingredient, Recipe, Favorites, Allergy, RecipeSnapshot
+from mail_model import OutboxEmail
 from model_logic import set_allergies
-from user_model import User
+from user_model import User, user_rows
 from pdb import set_trace
 from sqlalchemy import exc
 
-os.environ['DATABASE_URL'] = "postgresql:///easy_recipes_test"
+from app import create_app, CURR_USER_KEY
 
-from app import app, CURR_USER_KEY
+# In-memory SQLite unless TEST_DATABASE_URL points somewhere else, e.g. postgresql:///easy_recipes_test
+app = create_app({'SQLALCHEMY_DATABASE_URI': os.environ.get('TEST_DATABASE_URL', 'sqlite://'), 'TESTING': True,
+                  'SECRET_KEY': 'test', 'WTF_CSRF_ENABLED': False, 'MAIL_QUEUE_WORKER': False,
+                  'RECIPE_REFRESHER': False, 'RANDOM_POOL': False})
 
-app.config['WTF_CSRF_ENABLED'] = False
-app.config['Testing'] = True
-
-db.drop_all()
-db.create_all()
+with app.app_context():
+    db.drop_all()
+    db.create_all()
 
 class UserViewTestCase(TestCase):
     """Test views for users"""
@@ -23,11 +27,15 @@ class UserViewTestCase(TestCase):
     def setUp(self):
         """Create test client, add sample data"""
 
+        self.ctx = app.app_context()
+        self.ctx.push()
+
         User.query.delete()
         Allergy.query.delete()
         Favorites.query.delete()
         Ingredient.query.delete()
         Recipe.query.delete()
+        user_rows.clear()
 
         self.client = app.test_client()
 
@@ -39,6 +47,7 @@ class UserViewTestCase(TestCase):
 
     def tearDown(self):
         db.session.rollback()
+        self.ctx.pop()
 
     def test_show_user_profile(self):
         with self.client as c:
@@ -72,6 +81,53 @@ class UserViewTestCase(TestCase):
             self.assertEqual(resp.status_code, 200)
             self.assertEqual(resp.json, self.testuser.serialize())
 
+    def test_get_curr_user_query_count(self):
+        '''Test that /users/current loads the user and everything it serializes in two queries, however many favorites there are'''
+        self.testuser.recipes.extend(Recipe(id=id) for id in range(1, 21))
+        db.session.commit()
+        user_id = self.testuser.id
+        db.session.expunge_all()
+
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+
+            with count_queries() as queries:
+                resp = c.get('/users/current')
+
+            self.assertEqual(resp.status_code, 200)
+            self.assertCountEqual(resp.json['recipes'], range(1, 21))
+            self.assertEqual(resp.json['allergies'], ['peanuts'])
+            self.assertEqual(len(queries), 2)
+
+    def test_bootstrap(self):
+        '''Test that /users/bootstrap returns the user, favorite and cart ids and recipe cards from one query and one bulk lookup'''
+        db.session.add_all([Recipe(id=1), Recipe(id=2)])
+        db.session.add_all([Favorites(user_id=self.testuser.id, recipe_id=1),
+                            Favorites(user_id=self.testuser.id, recipe_id=2, in_shopping_cart=True)])
+        db.session.commit()
+        user_id = self.testuser.id
+        fetch = AsyncMock(return_value=[{'id': 1, 'title': 'Pancakes'}, {'id': 2, 'title': 'Waffles'}])
+
+        with self.client as c, patch('routes.users.spoonacular.async_information_bulk', fetch):
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = user_id
+            # The first request loads the user row; later ones take it from the cache
+            c.get('/users/bootstrap')
+            fetch.reset_mock()
+
+            with count_queries() as queries:
+                resp = c.get('/users/bootstrap?fields=id,title')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json['user']['username'], 'testuser')
+        self.assertEqual(resp.json['user']['recipes'], [1, 2])
+        self.assertEqual(resp.json['favorite_ids'], [1, 2])
+        self.assertEqual(resp.json['cart_ids'], [2])
+        self.assertEqual(resp.json['recipes'], [{'id': 1, 'title': 'Pancakes'}, {'id': 2, 'title': 'Waffles'}])
+        self.assertEqual(len(queries), 1)
+        fetch.assert_awaited_once_with([1, 2])
+
     def test_save_recipe(self):
         with self.client as c:
             with c.session_transaction() as sess:
@@ -162,3 +218,125 @@ class UserViewTestCase(TestCase):
     
 
             
+
+    def test_edit_user_details_refreshes_cached_user(self):
+        '''Test that the cached session user is invalidated when the user is edited'''
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            c.get('/users/details')
+            c.post('/users/edit', data={'username': 'testuser2', 'email': 'test@test.com', 'password': 'password'})
+            resp = c.get('/users/details')
+
+            self.assertIn('testuser2', resp.get_data(as_text=True))
+
+    def test_get_shopping_cart_not_modified(self):
+        '''Test that an unchanged cart gets a 304 and a toggled cart a new ETag'''
+        self.testuser.recipes.append(Recipe(id=1))
+        db.session.commit()
+
+        with self.client as c:
+            resp = c.get(f'/users/{self.testuser.id}/cart')
+            etag = resp.headers['ETag']
+            not_modified = c.get(f'/users/{self.testuser.id}/cart', headers={'If-None-Match': etag})
+            c.patch(f'/users/{self.testuser.id}/cart', json={'recipe_id': 1})
+            toggled = c.get(f'/users/{self.testuser.id}/cart', headers={'If-None-Match': etag})
+
+            self.assertEqual(resp.json, [])
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(not_modified.get_data(), b'')
+            self.assertEqual(toggled.status_code, 200)
+            self.assertEqual(toggled.json, [1])
+
+    def test_send_email_is_queued(self):
+        '''Test that the shopping list email is queued, with 202 for API clients and a redirect for the cart form'''
+        self.testuser.recipes.append(Recipe(id=3))
+        db.session.commit()
+        fetch = patch('app.spoonacular.information_bulk', return_value=[{'id': 3, 'title': 'Soup', 'extendedIngredients': []}])
+
+        try:
+            with self.client as c, fetch:
+                with c.session_transaction() as sess:
+                    sess[CURR_USER_KEY] = self.testuser.id
+                c.patch(f'/users/{self.testuser.id}/cart', json={'recipe_id': 3})
+
+                accepted = c.post('/send_email', headers={'Accept': 'application/json'})
+                redirected = c.post('/send_email', headers={'Accept': 'text/html'})
+                recipients = [email.recipients for email in OutboxEmail.query.all()]
+        finally:
+            OutboxEmail.query.delete()
+            db.session.commit()
+
+        self.assertEqual(accepted.status_code, 202)
+        self.assertEqual(accepted.json, {'Result': 'Email queued'})
+        self.assertEqual(redirected.status_code, 302)
+        self.assertTrue(redirected.location.endswith('/users/shopping_cart'))
+        self.assertEqual(recipients, ['test@test.com', 'test@test.com'])
+
+    def test_get_saved_recipes_not_modified(self):
+        '''Test that revalidating unchanged favorites skips the upstream bulk call'''
+        self.testuser.recipes.append(Recipe(id=1))
+        db.session.commit()
+        fetch = AsyncMock(return_value=[{'id': 1, 'title': 'Pancakes'}])
+
+        with self.client as c, patch('routes.users.spoonacular.async_information_bulk', fetch):
+            resp = c.get(f'/users/{self.testuser.id}/recipes')
+            not_modified = c.get(f'/users/{self.testuser.id}/recipes', headers={'If-None-Match': resp.headers['ETag']})
+
+            self.assertEqual(resp.json[0]['title'], 'Pancakes')
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertEqual(fetch.await_count, 1)
+
+    def test_get_saved_recipes_etag_follows_content(self):
+        '''Test that a refreshed snapshot changes the ETag and a partial list gets none'''
+        self.testuser.recipes.extend([Recipe(id=1), Recipe(id=2)])
+        db.session.commit()
+        RecipeSnapshot.save_many([{'id': 1, 'title': 'Pancakes'}, {'id': 2, 'title': 'Waffles'}])
+        fetch = AsyncMock(return_value=[{'id': 1, 'title': 'Pancakes'}, {'id': 2, 'title': 'Waffles'}])
+
+        try:
+            with self.client as c, patch('routes.users.spoonacular.async_information_bulk', fetch):
+                etag = c.get(f'/users/{self.testuser.id}/recipes').headers['ETag']
+                RecipeSnapshot.query.filter_by(id=2).update({'fetched_at': RecipeSnapshot.version([1, 2]) + timedelta(seconds=1)})
+                db.session.commit()
+                refreshed = c.get(f'/users/{self.testuser.id}/recipes', headers={'If-None-Match': etag})
+
+                fetch.return_value = [{'id': 1, 'title': 'Pancakes'}]
+                partial = c.get(f'/users/{self.testuser.id}/recipes')
+        finally:
+            RecipeSnapshot.query.delete()
+            db.session.commit()
+
+        self.assertEqual(refreshed.status_code, 200)
+        self.assertNotEqual(refreshed.headers['ETag'], etag)
+        self.assertEqual([recipe['title'] for recipe in partial.json], ['Pancakes'])
+        self.assertNotIn('ETag', partial.headers)
+
+    def test_get_curr_user_not_modified(self):
+        '''Test that /users/current revalidates with its ETag'''
+        with self.client as c:
+            with c.session_transaction() as sess:
+                sess[CURR_USER_KEY] = self.testuser.id
+
+            resp = c.get('/users/current')
+            not_modified = c.get('/users/current', headers={'If-None-Match': resp.headers['ETag']})
+
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertIn('private', not_modified.headers['Cache-Control'])
+
+    def test_get_saved_recipes_fields(self):
+        '''Test that favorites are trimmed to the card fields unless other fields are asked for'''
+        self.testuser.recipes.append(Recipe(id=1))
+        db.session.commit()
+        recipe = {'id': 1, 'title': 'Pancakes', 'image': 'https://img/1.jpg', 'extendedIngredients': [{'name': 'flour'}]}
+
+        with self.client as c, patch('routes.users.spoonacular.async_information_bulk', AsyncMock(return_value=[recipe])):
+            cards = c.get(f'/users/{self.testuser.id}/recipes').json
+            titles = c.get(f'/users/{self.testuser.id}/recipes?fields=title').json
+            full = c.get(f'/users/{self.testuser.id}/recipes?fields=*').json
+
+            self.assertNotIn('extendedIngredients', cards[0])
+            self.assertEqual(cards[0]['image'], 'https://img/1.jpg')
+            self.assertEqual(titles, [{'id': 1, 'title': 'Pancakes'}])
+            self.assertEqual(full, [recipe])
@@ -0,0 +1,251 @@
+# Description: Guards Spoonacular calls with a points rate limiter, a daily points budget and a circuit breaker.
+# A refused call raises UpstreamUnavailable before anything is sent, so callers fall back to the data they already have.
+import os
+import math
+import time
+import threading
+from datetime import datetime, timezone
+import requests
+
+# The limiter and breaker are per worker process, so the combined rate is this times the number of workers
+SPOONACULAR_POINTS_PER_SECOND = float(os.environ.get('SPOONACULAR_POINTS_PER_SECOND', 5))
+SPOONACULAR_POINTS_BURST = float(os.environ.get('SPOONACULAR_POINTS_BURST', 20))
+# How long a request may wait for the limiter before its call is refused
+SPOONACULAR_RATE_MAX_WAIT = float(os.environ.get('SPOONACULAR_RATE_MAX_WAIT', 0.5))
+# Points per day; 0 means use the plan's quota reported in the response headers
+SPOONACULAR_DAILY_POINTS = float(os.environ.get('SPOONACULAR_DAILY_POINTS', 0))
+SPOONACULAR_BREAKER_FAILURES = int(os.environ.get('SPOONACULAR_BREAKER_FAILURES', 5))
+SPOONACULAR_BREAKER_RESET = float(os.environ.get('SPOONACULAR_BREAKER_RESET', 30))
+
+
+class UpstreamUnavailable(requests.exceptions.RequestException):
+    '''Call refused by the guard. A RequestException, so routes handle it like any other upstream failure.'''
+
+
+def call_cost(path, params):
+    '''Points Spoonacular charges for a call: 1 per call, plus 0.01 per result for searches and random recipes,
+    plus 0.5 per recipe after the first for informationBulk'''
+    if path == '/recipes/informationBulk':
+        ids = [id for id in str(params.get('ids', '')).split(',') if id]
+        return 1 + 0.5 * max(len(ids) - 1, 0)
+    if path == '/recipes/random':
+        return 1 + 0.01 * int(params.get('number', 1))
+    if path == '/recipes/complexSearch':
+        return 1 + 0.01 * int(params.get('number', 10))
+    return 1
+
+
+def utc_today():
+    # Spoonacular quotas reset at midnight UTC
+    return datetime.now(timezone.utc).date()
+
+
+def header_float(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    '''Points refill at rate per second up to capacity. A call costing more than capacity waits for a full bucket
+    and leaves it in debt, so calls after it wait their turn. A rate of 0 turns the limiter off.'''
+
+    def __init__(self, rate, capacity, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, cost, max_wait):
+        '''Take cost points. Returns the seconds the caller must wait before calling,
+        or None, taking nothing, when that would be longer than max_wait.'''
+        if self.rate <= 0:
+            return 0
+        with self._lock:
+            self._refill()
+            wait = max(min(cost, self.capacity) - self.tokens, 0) / self.rate
+            if wait > max_wait:
+                return None
+            self.tokens -= cost
+            return wait
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self):
+        '''Points that can be spent now without waiting; negative while in debt, infinite when the limiter is off'''
+        if self.rate <= 0:
+            return math.inf
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+    def refund(self, cost):
+        '''Give back points reserved for a call that was not made'''
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class DailyBudget:
+    '''Points spent today. Counted locally as calls are made and corrected from Spoonacular's quota headers,
+    which include what the other workers spent.'''
+
+    def __init__(self, limit=0, today=utc_today):
+        # limit is fixed when configured, otherwise learned from the headers; None until then means unlimited
+        self.configured = limit or None
+        self.limit = self.configured
+        self.today = today
+        self.day = today()
+        self.used = 0
+        self.exhausted = False
+        self._lock = threading.Lock()
+
+    def _roll(self):
+        day = self.today()
+        if day != self.day:
+            self.day = day
+            self.used = 0
+            self.exhausted = False
+
+    def try_spend(self, cost):
+        '''Charge cost if today's budget has room for it'''
+        with self._lock:
+            self._roll()
+            if self.exhausted or (self.limit is not None and self.used + cost > self.limit):
+                return False
+            self.used += cost
+            return True
+
+    def remaining(self):
+        '''Points left today, infinite while the limit is unknown'''
+        with self._lock:
+            self._roll()
+            if self.exhausted:
+                return 0
+            if self.limit is None:
+                return math.inf
+            return max(self.limit - self.used, 0)
+
+    def sync(self, used, left):
+        '''Take the points used (and left) today from a response's X-API-Quota-Used/Left headers'''
+        with self._lock:
+            self._roll()
+            self.used = used
+            if self.configured is None and left is not None:
+                self.limit = used + left
+
+    def exhaust(self):
+        '''Spoonacular said the quota is spent (402): refuse calls until the next day'''
+        with self._lock:
+            self._roll()
+            self.exhausted = True
+
+
+class CircuitBreaker:
+    '''Opens after failure_threshold consecutive failures and refuses calls for reset_timeout seconds. Then one
+    trial call is let through (half-open): success closes the breaker, failure opens it again.'''
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self._open_until = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.OPEN and self.clock() >= self._open_until:
+                self.state = self.HALF_OPEN
+                self._trial = False
+            if self.state == self.HALF_OPEN:
+                if self._trial:
+                    return False
+                self._trial = True
+            return self.state != self.OPEN
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial = False
+
+    def failure(self, open_for=None):
+        '''Count a failed call. open_for (e.g. from Retry-After) opens the breaker straight away for that long.'''
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if open_for is not None or self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._open_until = self.clock() + (self.reset_timeout if open_for is None else open_for)
+
+    def cancel(self):
+        '''An allowed call was not made after all; let another caller make the trial call'''
+        with self._lock:
+            self._trial = False
+
+
+class UpstreamGuard:
+    '''Admits Spoonacular calls and learns from their results'''
+
+    def __init__(self, limiter=None, budget=None, breaker=None, max_wait=SPOONACULAR_RATE_MAX_WAIT):
+        self.limiter = limiter or TokenBucket(SPOONACULAR_POINTS_PER_SECOND, SPOONACULAR_POINTS_BURST)
+        self.budget = budget or DailyBudget(SPOONACULAR_DAILY_POINTS)
+        self.breaker = breaker or CircuitBreaker(SPOONACULAR_BREAKER_FAILURES, SPOONACULAR_BREAKER_RESET)
+        self.max_wait = max_wait
+
+    def admit(self, path, params):
+        '''Check a call before it is sent. Returns the seconds to wait before sending it;
+        raises UpstreamUnavailable when the call must not be made. Every admitted call must be passed to record.'''
+        return self.admit_many([(path, params)])
+
+    def admit_many(self, calls):
+        '''Check (path, params) calls that are sent together, like the chunks of one lookup, as one call costing their total.
+        Either all of them are admitted or none is.'''
+        if not self.breaker.allow():
+            raise UpstreamUnavailable('Spoonacular circuit breaker is open')
+        cost = sum(call_cost(path, params) for path, params in calls)
+        wait = self.limiter.reserve(cost, self.max_wait)
+        if wait is None:
+            self.breaker.cancel()
+            raise UpstreamUnavailable('Spoonacular rate limit reached')
+        if not self.budget.try_spend(cost):
+            self.limiter.refund(cost)
+            self.breaker.cancel()
+            raise UpstreamUnavailable('Spoonacular daily points budget is spent')
+        return wait
+
+    def spare_points(self):
+        '''Points that could be spent right now without waiting or going over today's budget'''
+        return min(self.limiter.available(), self.budget.remaining())
+
+    def record(self, status, headers=None):
+        '''Report how an admitted call went. status is None when no response came back (timeout, connection error).'''
+        if headers is not None:
+            used = header_float(headers, 'X-API-Quota-Used')
+            if used is not None:
+                self.budget.sync(used, header_float(headers, 'X-API-Quota-Left'))
+
+        if status == 402:
+            # Out of quota isn't an outage; the budget refuses calls until it resets
+            self.budget.exhaust()
+            self.breaker.cancel()
+        elif status == 429:
+            self.breaker.failure(open_for=header_float(headers or {}, 'Retry-After'))
+        elif status is None or status >= 500:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
@@ -1,9 +1,15 @@
+import os
 from db_init import db
 from model_logic import set_allergies
 from food_models import Ingredient, Recipe, Favorites, Allergy
-from flask_bcrypt import Bcrypt
+from password_hasher import password_hasher
+from recipe_cache import TTLCache
+from sqlalchemy.orm import joinedload, selectinload, make_transient_to_detached
 
-bcrypt = Bcrypt()
+# The logged-in user's row is cached briefly so requests don't reload it. Edits in this process invalidate it
+# right away; another worker may serve the old row for up to the TTL.
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 30))
+user_rows = TTLCache(ttl=USER_CACHE_TTL, max_entries=10000)
 
 class User(db.Model):
     '''User Class'''
@@ -29,14 +35,50 @@ class User(db.Model):
 
     recipes = db.relationship('Recipe', backref='users', secondary='favorite_recipes', cascade='all, delete')
 
-    def serialize(self):
+    def serialize_profile(self):
+        '''Serialize only the user's own columns, so no relationship has to be loaded'''
         return {
             'id': self.id,
             'email': self.email,
             'username': self.username,
             'image_url': self.image_url,
             'diet': self.diet,
-            'dietary_restrictions': self.dietary_restrictions,
+            'dietary_restrictions': self.dietary_restrictions
+        }
+
+    @classmethod
+    def serialize_options(cls):
+        '''Loader options that fetch everything serialize() reads with the user: allergies are joined to the user query and
+        favorites come from one extra IN query. Joining both would return a row for every (favorite, allergy) pair.'''
+        return (selectinload(cls.recipes), joinedload(cls.allergies))
+
+    def row(self):
+        '''Column values of the user row, enough to rebuild the user without a query'''
+        return {column.key: getattr(self, column.key) for column in self.__table__.columns}
+
+    @classmethod
+    def load_cached(cls, user_id, options=()):
+        '''Load the session user. A row cached by an earlier request is attached to the session without a query.
+        Views asking for loader options always query, so their relationships still come in the same SELECT.'''
+        row = None if options else user_rows.get(user_id)
+        if row is not None:
+            user = cls(**row)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(cls, user_id, options=options)
+        if user is not None:
+            user_rows.set(user_id, user.row())
+        return user
+
+    @classmethod
+    def forget(cls, user_id):
+        '''Drop a cached user row after the user is changed'''
+        user_rows.delete(user_id)
+
+    def serialize(self):
+        return {
+            **self.serialize_profile(),
             'recipes': [recipe.id for recipe in self.recipes],
             'allergies': [allergy.id for allergy in self.allergies]
         }
@@ -45,8 +87,8 @@ class User(db.Model):
     def register(cls, username, email, password, image_url, diet, allergies):
         '''Register user. Hashes password and adds user to system.'''
 
-        # bcrypt.generate_password_hash adds salt, so no need to add it explicitly
-        hashed_pwd = bcrypt.generate_password_hash(password).decode('UTF-8')
+        # The hash includes its own salt, so no need to add it explicitly
+        hashed_pwd = password_hasher.hash(password)
 
         user = User(
             username=username,
@@ -57,20 +99,31 @@ class User(db.Model):
             dietary_restrictions=''
         )
         set_allergies(allergies, user)
-        db.session.commit()
-        
+
+        # Callers add and commit the user; committing here too would expire every allergy and reload them one by one
         return user
 
+    def check_password(self, password):
+        '''Check password against this user's hash, without reloading the user'''
+
+        if not password_hasher.check(self.password, password):
+            return False
+
+        # The plain password is only available now, so this is when a hash made with an old cost gets upgraded
+        if password_hasher.needs_rehash(self.password):
+            self.password = password_hasher.hash(password)
+            db.session.commit()
+            User.forget(self.id)
+        return True
+
     @classmethod
     def authenticate(cls, username, password):
         '''Find user with `username` and `password`. If can't find matching user (or if password is wrong), returns False.'''
 
         user = cls.query.filter_by(username=username).first()
 
-        if user:
-            is_auth = bcrypt.check_password_hash(user.password, password)
-            if is_auth:
-                return user
+        if user and user.check_password(password):
+            return user
 
         return False
 